@@ -16,3 +16,4 @@ from lambdaimage.rdds.images import Images
 #from lambdaimage.utils.datasets import DataSets
 from lambdaimage.utils.context import lambdaimageContext
 from lambdaimage.utils import tool
+from lambdaimage.utils.common import setPrecision, getPrecision
@@ -8,65 +8,301 @@ import numpy as np
 import math
 from lambdaimage.utils.tool import exeTime
 
+def _fused(rdd, func):
+    '''
+    Usage:
+     - lazily fuse every zipped L&R record of rdd with func, keeping the keys
+     - the dims and dtype of the result are taken from its first record
+    '''
+    from lambdaimage.rdds.images import Images
+    return Images(rdd.rdd.mapValues(func)).__finalize__(rdd, noPropagate=('_dims', '_dtype'))
+
+def _block_mean(frame, f):
+    '''
+    Usage:
+     - downsample frame by averaging f*f blocks, padding the edges by replication
+    '''
+    frame = np.pad(frame, [(0, -n % f) for n in frame.shape], mode='edge')
+    shape = sum([(n // f, f) for n in frame.shape], ())
+    return frame.reshape(shape).mean(axis=tuple(range(1, 2*frame.ndim, 2)))
+
+def _upsample(small, shape, f):
+    '''
+    Usage:
+     - bilinear upsampling of a _block_mean result back to shape
+    '''
+    out = small
+    for axis, n in enumerate(shape):
+        # pixel i lies at (i - (f-1)/2) / f on the downsampled grid
+        x = ((np.arange(n, dtype=np.float32) - (f-1)/2.0) / f).clip(0, small.shape[axis]-1)
+        i0 = np.floor(x).astype(int)
+        i1 = np.minimum(i0+1, small.shape[axis]-1)
+        w = (x - np.floor(x)).reshape([-1 if a == axis else 1 for a in range(small.ndim)])
+        out = out.take(i0, axis=axis)*(1-w) + out.take(i1, axis=axis)*w
+    return out
+
+def _content_weight(frame, sgm1, sgm2, f):
+    '''
+    Usage:
+     - the local contrast of frame, on a grid downsampled by f
+     - only the squared detail is taken at full resolution, both smoothings are done on the small grid
+    '''
+    from scipy.ndimage import gaussian_filter
+    if f == 1:
+        detail = frame - gaussian_filter(frame, sgm1, mode='nearest')
+        return gaussian_filter(detail*detail, sgm2, mode='nearest')
+    background = _upsample(gaussian_filter(_block_mean(frame, f), sgm1/float(f)), frame.shape, f)
+    detail = frame - background
+    return gaussian_filter(_block_mean(detail*detail, f), sgm2/float(f))
+
 @exeTime
-def content_fusion(rdd, sgm1=44, sgm2=81): 
+def content_fusion(rdd, sgm1=44, sgm2=81, downscale=1):
     '''
     Usage:
      - a fast implementation of content-based fusion
+     - return the fused Images, evaluated lazily on the executors
     Args:
      - rdd: the ziped L&R img stack
      - sgm1/sgm2: gaussian smooth size
+     - downscale: if > 1, the weights are computed on frames downsampled by this factor
+                  and upsampled bilinearly, then blended at full resolution
+     - the weights are computed in the precision of lambdaimage.utils.common.setPrecision,
+       the downsampled weights of downscale > 1 always in float32
     '''
-    from skimage.filters import gaussian_filter
+    from lambdaimage.utils.common import getPrecision
+    ftype = np.float32 if downscale > 1 else getPrecision()
     def func(dframe):
         frame1, frame2 = dframe[0], dframe[1]
-        tmp1 = frame1 - gaussian_filter(frame1,sgm1)
-        tmp1 = gaussian_filter(tmp1*tmp1,sgm2)
-        tmp2 = frame2 - gaussian_filter(frame2,sgm1)
-        tmp2 = gaussian_filter(tmp2*tmp2,sgm2)
-        ret = (tmp1*frame1 + frame1*tmp1)/(tmp1+tmp2)
-        ret = ret.astype(frame1.dtype)
+        dtype = frame1.dtype
+        frame1 = frame1.astype(ftype)
+        frame2 = frame2.astype(ftype)
+        w1 = _content_weight(frame1, sgm1, sgm2, downscale)
+        w2 = _content_weight(frame2, sgm1, sgm2, downscale)
+        w = (w1/np.maximum(w1+w2, 1e-12)).astype(ftype)
+        if downscale > 1:
+            w = _upsample(w, frame1.shape, downscale)
+        ret = w*frame1 + (1-w)*frame2
+        ret = ret.astype(dtype)
         return ret
-    rdd = rdd.applyValues(func)
-    fused_img = np.squeeze(rdd.collectValuesAsArray())
-    return fused_img
+    return _fused(rdd, func)
+
+def _select(c, s, rule='max', window=3):
+    '''
+    Usage:
+     - fuse two arrays of detail coefficients in place into c, and return c
+    Args:
+     - rule: 'max' keeps the coefficient of larger magnitude (s on ties),
+             'energy' keeps the one with the larger energy in its local window
+     - window: the window size of the 'energy' rule
+    '''
+    if rule == 'energy':
+        from scipy.ndimage import uniform_filter
+        take = uniform_filter(c*c, window) <= uniform_filter(s*s, window)
+    else:
+        take = np.abs(c) <= np.abs(s)
+    np.copyto(c, s, where=take)
+    return c
 
 @exeTime
-def wavelet_fusion(rdd, level=5):
+def wavelet_fusion(rdd, level=5, rule='max', window=3):
     '''
     Usage:
      - a implementation of wavelet fusion (C based)
+     - return the fused Images, evaluated lazily on the executors
+     - 2d frames use wavedec2, 3d volumes use wavedecn (plane by plane wavedec2 on PyWavelets < 0.4)
     Args:
-     - level: wavelet level
+     - level: wavelet level, clipped to the max level of 3d volumes
+     - rule: 'max' or 'energy', how detail coefficients are selected, see _select
+     - window: the window size of the 'energy' rule
     '''
     import pywt
-    def fuse(A, C, S):
-        T = [A]
-        for c, s in zip(C, S):
-            cH,cV,cD = c
-            sH,sV,sD = s
-            tH = map(lambda x,y: map(lambda a,b: a if abs(a) > abs(b) else b, x,y), cH, sH)
-            tV = map(lambda x,y: map(lambda a,b: a if abs(a) > abs(b) else b, x,y), cV, sV)
-            tD = map(lambda x,y: map(lambda a,b: a if abs(a) > abs(b) else b, x,y), cD, sD)
-            T.append((tH,tV,tD))
-        return T
+    from lambdaimage.utils.common import getPrecision
+    # pywt transforms float32 in float32, anything else in float64
+    ftype = getPrecision()
+    def pair(frame1, frame2):
+        if frame1.ndim == 2:
+            C = pywt.wavedec2(frame1, 'db4', level=level)
+            S = pywt.wavedec2(frame2, 'db4', level=level)
+            details = [zip(c, s) for c, s in zip(C[1:], S[1:])]
+        else:
+            lv = min(level, pywt.dwtn_max_level(frame1.shape, 'db4'))
+            C = pywt.wavedecn(frame1, 'db4', level=lv)
+            S = pywt.wavedecn(frame2, 'db4', level=lv)
+            details = [[(c[k], s[k]) for k in c] for c, s in zip(C[1:], S[1:])]
+        # fuse into the buffers of C and reconstruct from them
+        C[0] += S[0]
+        C[0] /= 2
+        for pairs in details:
+            for c, s in pairs:
+                _select(c, s, rule, window)
+        if frame1.ndim == 2:
+            fuse_img = pywt.waverec2(C, 'db4')
+        else:
+            fuse_img = pywt.waverecn(C, 'db4')
+        # odd sizes come back padded by one
+        return fuse_img[tuple(slice(0, n) for n in frame1.shape)]
     def func(dframe):
         frame1, frame2 = dframe[0], dframe[1]
-        frame1 = np.array(frame1)
-        frame2 = np.array(frame2)
-        C = pywt.wavedec2(frame1, 'db4', level=level)
-        S = pywt.wavedec2(frame2, 'db4', level=level)
-        tA2 = (C[0] + S[0])/2
-        coeffs = fuse(tA2, C[1:], S[1:])
-        fuse_img = pywt.waverec2(coeffs, 'db4')
-        if frame1.dtype == np.uint16:
+        dtype = frame1.dtype
+        frame1 = np.ascontiguousarray(frame1, dtype=ftype)
+        frame2 = np.ascontiguousarray(frame2, dtype=ftype)
+        if frame1.ndim > 2 and not hasattr(pywt, 'wavedecn'):
+            # PyWavelets < 0.4 has no n-d transform, volumes are fused plane by plane
+            fuse_img = np.array([pair(a, b) for a, b in zip(frame1, frame2)])
+        else:
+            fuse_img = pair(frame1, frame2)
+        if dtype == np.uint16:
             fuse_img = fuse_img.clip(0,65535).astype(np.uint16)
-        elif frame1.dtype == np.uint8:
+        elif dtype == np.uint8:
             fuse_img = fuse_img.clip(0,255).astype(np.uint8)
+        elif dtype.kind == 'f':
+            fuse_img = fuse_img.astype(dtype, copy=False)
         return np.squeeze(fuse_img)
-    rdd = rdd.applyValues(func)
-    fused_img = np.squeeze(rdd.collectValuesAsArray())
-    return fused_img
+    return _fused(rdd, func)
     
+def _content_block_weight(frame, sgm1, sgm2):
+    '''
+    Usage:
+     - the local contrast of a frame of a block
+     - the gaussians are truncated at 3 sigma, so a padding of _content_padding gives
+       the same weights in the core of a block as on the whole frame
+    '''
+    from scipy.ndimage import gaussian_filter
+    detail = frame - gaussian_filter(frame, sgm1, truncate=3.0)
+    return gaussian_filter(detail*detail, sgm2, truncate=3.0)
+
+def _content_padding(sgm1, sgm2):
+    '''
+    Usage:
+     - the support of _content_block_weight, about 3*(sgm1+sgm2)
+    '''
+    # the radius of each gaussian, as gaussian_filter computes it
+    return int(3.0*sgm1 + 0.5) + int(3.0*sgm2 + 0.5)
+
+def _sigmoid_block_weight(frame, starts, shape, ramp, background):
+    '''
+    Usage:
+     - a weight rising from 0 to 1 over `ramp` pixels from the nearest edge of the view,
+       i.e. of its valid (> background) region, or of the whole image
+    Args:
+     - starts: the position of the frame in the whole image
+     - shape: the shape of the whole image
+    '''
+    from scipy.ndimage import distance_transform_edt
+    valid = frame > background
+    if valid.all():
+        dist = np.full(frame.shape, np.inf, dtype=np.float32)
+    else:
+        dist = distance_transform_edt(valid).astype(np.float32)
+    for axis, (start, n) in enumerate(zip(starts, frame.shape)):
+        pos = np.arange(start, start+n)
+        border = np.minimum(pos + 1, shape[axis] - pos).astype(np.float32)
+        dist = np.minimum(dist, border.reshape([-1 if a == axis else 1 for a in range(frame.ndim)]))
+    return 1 / (1 + np.exp(-(dist - ramp/2.0) * (8.0/ramp)))
+
+def _wavedec(frame, level):
+    '''
+    Usage:
+     - the db4 decomposition of frame clipped to its max level, and its detail arrays
+     - 2d frames fall back to wavedec2 on PyWavelets < 0.4, which has no wavedecn
+    '''
+    import pywt
+    if hasattr(pywt, 'wavedecn'):
+        C = pywt.wavedecn(frame, 'db4', level=min(level, pywt.dwtn_max_level(frame.shape, 'db4')))
+        return C, [c[k] for c in C[1:] for k in sorted(c)]
+    lv = min(level, pywt.dwt_max_level(min(frame.shape), pywt.Wavelet('db4').dec_len))
+    C = pywt.wavedec2(frame, 'db4', level=lv)
+    return C, [d for c in C[1:] for d in c]
+
+def _wavelet_frames(frames, level):
+    '''
+    Usage:
+     - wavelet fusion of any number of frames, the approximations are averaged
+       and the detail coefficient of largest magnitude is kept
+     - volumes are fused plane by plane on PyWavelets < 0.4
+    '''
+    import pywt
+    if frames[0].ndim > 2 and not hasattr(pywt, 'wavedecn'):
+        return np.array([_wavelet_frames(planes, level) for planes in zip(*frames)])
+    C, cd = _wavedec(frames[0], level)
+    for frame in frames[1:]:
+        S, sd = _wavedec(frame, level)
+        C[0] += S[0]
+        for c, s in zip(cd, sd):
+            _select(c, s)
+    C[0] /= len(frames)
+    if hasattr(pywt, 'waverecn'):
+        fused = pywt.waverecn(C, 'db4')
+    else:
+        fused = pywt.waverec2(C, 'db4')
+    return fused[tuple(slice(0, n) for n in frames[0].shape)]
+
+@exeTime
+def multiview_fusion(views, method='content', size='64M', padding=None, sgm1=8, sgm2=16,
+                     ramp=20, background=0, level=3):
+    '''
+    Usage:
+     - fuse any number of aligned views in a single pass over padded blocks
+     - every block holds the same region of all views, so memory is bounded per block
+     - return the fused Images, evaluated lazily on the executors
+    Args:
+     - views: a list of aligned Images with the same dims, keyed 0..n-1
+     - method: 'content' weights views by local contrast,
+               'sigmoid' by distance to the edge of each view,
+               'wavelet' keeps the largest detail coefficients across views
+     - size: the block size, see Images.toBlocks (tuples are pixels per dimension)
+     - padding: the overlap of blocks, should cover the weight computation. By default
+                about 3*(sgm1+sgm2) for 'content', ramp for 'sigmoid' and the support of
+                the db4 wavelet at level for 'wavelet'
+     - sgm1/sgm2: gaussian smooth size of 'content'
+     - ramp/background: the width of the 'sigmoid' transition, and the value outside a view
+     - level: wavelet level of 'wavelet'
+    '''
+    from lambdaimage.rdds.imgblocks.blocks import PaddedBlocks
+    if method not in ('content', 'sigmoid', 'wavelet'):
+        raise ValueError("method must be 'content', 'sigmoid' or 'wavelet', got %s" % method)
+    if padding is None:
+        if method == 'content':
+            padding = _content_padding(sgm1, sgm2)
+        elif method == 'sigmoid':
+            padding = int(np.ceil(ramp))
+        else:
+            # db4 filters are 8 long, each level widens the support by 7 of its samples
+            padding = 7 * (2**level - 1)
+    first = views[0]
+    dtype = np.dtype(first.dtype)
+    tagged = []
+    for i, view in enumerate(views):
+        blocks = view.toBlocks(size, units='pixels', padding=padding)
+        tagged.append(blocks.rdd.map(lambda kv, i=i: (kv[0].spatialKey, (i, kv[0], kv[1]))))
+    def fuse_frames(frames, key):
+        if method == 'wavelet':
+            return _wavelet_frames(frames, level)
+        if method == 'content':
+            weights = [_content_block_weight(f, sgm1, sgm2) for f in frames]
+        else:
+            starts = [s.start for s in key.padImgSlices[1:]]
+            weights = [_sigmoid_block_weight(f, starts, key.origShape[1:], ramp, background) for f in frames]
+        total = sum(weights)
+        fused = sum(w*f for w, f in zip(weights, frames))
+        # where no view has any weight, fall back to the mean
+        empty = total <= 1e-12
+        fused[~empty] /= total[~empty]
+        fused[empty] = (sum(frames) / len(frames))[empty]
+        return fused
+    def fuse(group):
+        group = sorted(group, key=lambda x: x[0])
+        key = group[0][1]
+        arys = [v.astype(np.float32) for (_, _, v) in group]
+        out = np.empty(arys[0].shape, dtype)
+        for t in range(arys[0].shape[0]):
+            fused = fuse_frames([a[t] for a in arys], key)
+            if dtype.kind in 'ui':
+                fused = np.round(fused).clip(np.iinfo(dtype).min, np.iinfo(dtype).max)
+            out[t] = fused
+        return key, out
+    fused = first.rdd.context.union(tagged).groupByKey().values().map(fuse)
+    return PaddedBlocks(fused, dims=first.dims, nimages=first.nrecords, dtype=first.dtype).toImages()
+
 if __name__ == '__main__':
     pass
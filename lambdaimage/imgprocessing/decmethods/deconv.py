@@ -19,3 +19,138 @@ class deconvER(DeconvolutionMethod):
     def prepare(self, images):
         pass
 
+
+
+def _otf(psf, shape):
+    """
+    Transfer function of a psf centered on the origin of an array of the given shape
+    """
+    import numpy as np
+    padded = np.zeros(shape, dtype=np.float32)
+    padded[tuple(slice(0, n) for n in psf.shape)] = psf
+    # one axis at a time, np.roll takes several axes only from numpy 1.12
+    for axis, n in enumerate(psf.shape):
+        padded = np.roll(padded, -(n // 2), axis=axis)
+    return np.fft.rfftn(padded)
+
+
+def _rlMultiview(frames, otfs, iteration, eps=1e-6):
+    """
+    Joint Richardson-Lucy estimate of one volume from several views, each blurred by its own otf.
+
+    Every iteration re-blurs the estimate with each view's otf and multiplies it by the
+    average of the back-projected ratios, so all views contribute to a single estimate.
+    """
+    import numpy as np
+    from numpy.fft import rfftn, irfftn
+    shape = frames[0].shape
+    est = sum(frames) / np.float32(len(frames))
+    for _ in range(iteration):
+        estF = rfftn(est)
+        correction = np.zeros(shape, dtype=np.float32)
+        for y, otf in zip(frames, otfs):
+            blurred = irfftn(estF * otf, shape)
+            ratio = y / np.maximum(blurred, eps)
+            correction += irfftn(rfftn(ratio) * np.conj(otf), shape).astype(np.float32)
+        est *= np.maximum(correction, 0) / len(frames)
+    return est
+
+
+class deconvMVRL(DeconvolutionMethod):
+    """
+    Multi-view Richardson-Lucy deconvolution, fusing registered views into one deconvolved volume.
+
+    Views are split into the same padded blocks and every block is deconvolved jointly from
+    all views on the executors, so deconvolution and fusion are a single pass over the data.
+    Transfer functions are computed once per block shape in each partition.
+    """
+    def __init__(self, *args, **kwargs):
+        self.psfs = None
+        self.iteration = None
+        self.size = None
+        self.padding = None
+
+    def prepare(self, psfs, iter, size='64M', padding=None):
+        """
+        Parameters
+        ----------
+        psfs : list of strings or ndarrays
+            Point spread function of each view, as tif file paths or arrays with
+            the same number of dimensions as the images
+
+        iter : int
+            Number of Richardson-Lucy iterations
+
+        size : string or tuple, optional, default = '64M'
+            Block size, see Images.toBlocks
+
+        padding : int or tuple, optional, default = None
+            Overlap of blocks, defaults to the largest psf extent
+        """
+        import numpy as np
+        from lambdaimage.rdds.fileio.tifffile import imread
+
+        loaded = []
+        for psf in psfs:
+            psf = imread(psf) if isinstance(psf, basestring) else psf
+            psf = np.asarray(psf, dtype=np.float32)
+            loaded.append(psf / psf.sum())
+        self.psfs = loaded
+        self.iteration = iter
+        self.size = size
+        if padding is None:
+            padding = max(max(p.shape) for p in loaded)
+        self.padding = padding
+        return self
+
+    def run(self, views):
+        """
+        Deconvolve and fuse registered views.
+
+        Parameters
+        ----------
+        views : list of Images
+            Registered views with the same dims and keys, one per psf
+
+        Returns
+        -------
+        Images of float32 fused volumes
+        """
+        import numpy as np
+        from lambdaimage.rdds.imgblocks.blocks import PaddedBlocks
+
+        if len(views) != len(self.psfs):
+            raise ValueError("Expected one psf per view, got %d psfs for %d views" % (len(self.psfs), len(views)))
+        first = views[0]
+        ndim = len(first.dims.count)
+        for psf in self.psfs:
+            if psf.ndim != ndim:
+                raise ValueError("Psf has %d dimensions but images have %d" % (psf.ndim, ndim))
+
+        tagged = []
+        for i, view in enumerate(views):
+            blocks = view.toBlocks(self.size, units='pixels', padding=self.padding)
+            tagged.append(blocks.rdd.map(lambda kv, i=i: (kv[0].spatialKey, (i, kv[0], kv[1]))))
+
+        psfs = first.rdd.context.broadcast(self.psfs)
+        iteration = self.iteration
+        # extend blocks by half a psf so that the circular convolution does not wrap at image borders
+        margins = [(0, 0)] + [(n / 2, n / 2) for n in np.max([p.shape for p in self.psfs], axis=0)]
+
+        def deconvPartition(groups):
+            otfs = {}
+            for group in groups:
+                group = sorted(group, key=lambda x: x[0])
+                key = group[0][1]
+                arys = [np.pad(v.astype(np.float32), margins, mode='symmetric') for (_, _, v) in group]
+                shape = arys[0].shape[1:]
+                if shape not in otfs:
+                    otfs[shape] = [_otf(p, shape) for p in psfs.value]
+                crop = tuple(slice(m[0], m[0] + n) for m, n in zip(margins[1:], group[0][2].shape[1:]))
+                out = np.empty(group[0][2].shape, dtype=np.float32)
+                for t in range(out.shape[0]):
+                    out[t] = _rlMultiview([a[t] for a in arys], otfs[shape], iteration)[crop]
+                yield key, out
+
+        grouped = first.rdd.context.union(tagged).groupByKey().values().mapPartitions(deconvPartition)
+        return PaddedBlocks(grouped, dims=first.dims, nimages=first.nrecords, dtype='float32').toImages()
@@ -1,16 +1,16 @@
 from lambdaimage.rdds.images import Images
 from lambdaimage.utils.common import checkParams
-from lambdaimage.imgprocessing.decmethods.deconv_c import deconv_func
 
 class Deconvolution(object):
     """
     """
     def __new__(cls, method, **kwargs):
-        from lambdaimage.imgprocessing.decmethods.deconv import deconvRL, deconvER
+        from lambdaimage.imgprocessing.decmethods.deconv import deconvRL, deconvER, deconvMVRL
     
         DECMETHODS={
             'rl': deconvRL,
-            'er': deconvER
+            'er': deconvER,
+            'mvrl': deconvMVRL
         }
 
         checkParams(method, DECMETHODS.keys())
@@ -26,6 +26,7 @@ class DeconvolutionMethod(object):
         """
         from lambdaimage.rdds.fileio.tifffile import imread
         from lambdaimage.rdds.fileio.tifffile import imsave
+        from lambdaimage.imgprocessing.decmethods.deconv_c import deconv_func
         import numpy as np
 
         #images=imread(nfile)
@@ -14,16 +14,17 @@ class Registration(object):
     Parameters
     ----------
     method : string
-        A registration method, options include 'crosscorr' and 'planarcrosscorr'
+        A registration method, options include 'crosscorr', 'planarcrosscorr' and 'piecewiserigid'
     """
 
     def __new__(cls, method, **kwargs):
 
-        from lambdaimage.imgprocessing.regmethods.crosscorr import CrossCorr, PlanarCrossCorr
+        from lambdaimage.imgprocessing.regmethods.crosscorr import CrossCorr, PlanarCrossCorr, PiecewiseRigid
 
         REGMETHODS = {
             'crosscorr': CrossCorr,
-            'planarcrosscorr': PlanarCrossCorr
+            'planarcrosscorr': PlanarCrossCorr,
+            'piecewiserigid': PiecewiseRigid
         }
 
         checkParams(method, REGMETHODS.keys())
@@ -61,7 +62,7 @@ class RegistrationMethod(object):
     def getTransform(self, im):
         raise NotImplementedError
 
-    def fit(self, images):
+    def fit(self, images, cache=None):
         """
         Compute registration parameters on a collection of images / volumes.
 
@@ -73,6 +74,11 @@ class RegistrationMethod(object):
         images : Images
             An Images object with the images / volumes to estimate registration for.
 
+        cache : RegistrationCache, optional, default = None
+            If given, a model previously estimated for the same images, method and
+            parameters is loaded from the cache instead of being recomputed, and
+            newly estimated models are stored in it.
+
         Returns
         -------
         model : RegisterModel
@@ -88,6 +94,12 @@ class RegistrationMethod(object):
 
         self.isPrepared(images)
 
+        if cache is not None:
+            key = self.cacheKey(images)
+            model = cache.get(key)
+            if model is not None:
+                return model
+
         # broadcast the registration model
         bcReg = images.rdd.context.broadcast(self)
 
@@ -98,8 +110,22 @@ class RegistrationMethod(object):
         regMethod = self.__class__.__name__
         transClass = transformations.itervalues().next().__class__.__name__
         model = RegistrationModel(transformations, regMethod=regMethod, transClass=transClass)
+
+        if cache is not None:
+            cache.put(key, model)
         return model
 
+    def cacheKey(self, images):
+        """
+        Key identifying the registration of these images with this method and its parameters.
+
+        See also
+        --------
+        RegistrationCache : content-addressed store for registration results
+        """
+        from lambdaimage.utils.cache import RegistrationCache
+        return RegistrationCache.key(images, method=self.__class__.__name__, **self.__dict__)
+
     def run(self, images):
         """
         Compute and implement registration on a collection of images / volumes.
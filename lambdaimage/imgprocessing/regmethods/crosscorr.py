@@ -4,7 +4,8 @@ from numpy import ndarray
 
 from lambdaimage.rdds.images import Images
 from lambdaimage.imgprocessing.registration import RegistrationMethod
-from lambdaimage.imgprocessing.regmethods.utils import computeDisplacement, computeReferenceMean, checkReference
+from lambdaimage.imgprocessing.regmethods.utils import computeDisplacement, computeDisplacementNear, \
+    computeReferenceMean, selectReferenceRange, checkReference, taper
 
 
 class CrossCorr(RegistrationMethod):
@@ -14,8 +15,11 @@ class CrossCorr(RegistrationMethod):
     def __init__(self, *args, **kwargs):
         super(CrossCorr, self).__init__(*args, **kwargs)
         self.reference = None
+        self.referenceRange = (None, None, 20)
+        self.nrounds = 1
+        self.searchRadius = 2
 
-    def prepare(self, images, startIdx=None, stopIdx=None, defaultNImages=20):
+    def prepare(self, images, startIdx=None, stopIdx=None, defaultNImages=20, nrounds=1, searchRadius=2):
         """
         Prepare cross correlation by computing or specifying a reference image.
 
@@ -28,13 +32,31 @@ class CrossCorr(RegistrationMethod):
         calculate a reference mean image over the center `defaultNImages` records
         of the Images object.
 
+        With `nrounds` greater than one, registration is iterated: after each round
+        the reference is rebuilt from the aligned images in the same range, and images
+        are registered again against it, searching only within `searchRadius` of their
+        previous displacement.
+
         Parameters
         ----------
         images : ndarray or Images object
             Images to compute reference from, or a single image to set as reference
 
+        nrounds : positive int, optional, default = 1
+            Number of rounds of registration and reference refinement
+
+        searchRadius : non-negative int, optional, default = 2
+            Largest change in displacement considered along each dimension in later rounds
+
         See computeReferenceMean.
         """
+        if nrounds < 1:
+            raise ValueError("Number of rounds must be at least 1, got %d" % nrounds)
+
+        self.referenceRange = (startIdx, stopIdx, defaultNImages)
+        self.nrounds = nrounds
+        self.searchRadius = searchRadius
+
         if isinstance(images, Images):
             self.reference = computeReferenceMean(images, startIdx, stopIdx,
                                                   defaultNImages=defaultNImages)
@@ -74,6 +96,80 @@ class CrossCorr(RegistrationMethod):
 
         return Displacement(delta)
 
+    def getTransformNear(self, im, previous):
+        """
+        Compute displacement between an image or volume and reference, near a previous estimate.
+
+        Parameters
+        ----------
+        im : ndarray
+            The image or volume
+
+        previous : Displacement
+            Displacement from a previous round of registration
+        """
+        from lambdaimage.imgprocessing.transformation import Displacement
+
+        delta = computeDisplacementNear(im, self.reference, previous.delta, self.searchRadius)
+
+        return Displacement(delta)
+
+    def fit(self, images, cache=None):
+        """
+        Compute registration parameters on a collection of images / volumes.
+
+        If more than one round was requested in prepare(), the first round registers
+        against the initial reference. Each later round rebuilds the reference by
+        transforming and averaging only the images in the reference range, and then
+        takes the correlation peak within a small window around each image's previous
+        displacement. Only the correlation values of that window are computed, without
+        any fourier transform, so a later round costs a few passes over each image rather
+        than a full registration, see computeDisplacementNear.
+
+        See also
+        --------
+        RegistrationMethod.fit
+        """
+        from copy import copy
+
+        if self.nrounds == 1:
+            return super(CrossCorr, self).fit(images, cache=cache)
+
+        if cache is not None:
+            key = self.cacheKey(images)
+            model = cache.get(key)
+            if model is not None:
+                return model
+
+        model = super(CrossCorr, self).fit(images)
+        window, n = selectReferenceRange(images, *self.referenceRange)
+
+        for _ in range(1, self.nrounds):
+            refined = copy(self)
+            refined.reference = (model.transform(window).sum() / float(n)).astype(images.dtype)
+            bcReg = images.rdd.context.broadcast(refined)
+            bcTransformations = images.rdd.context.broadcast(model.transformations)
+            model.transformations = images.rdd.map(
+                lambda kv: (kv[0], bcReg.value.getTransformNear(kv[1], bcTransformations.value[kv[0]]))
+            ).collectAsMap()
+
+        if cache is not None:
+            cache.put(key, model)
+        return model
+
+    def run(self, images):
+        """
+        Compute and implement registration on a collection of images / volumes.
+
+        With a single round this is lazy, see RegistrationMethod.run. With several
+        rounds, displacements for all images are needed to refine the reference,
+        so this calls fit() and then transforms the images.
+        """
+        if self.nrounds == 1:
+            return super(CrossCorr, self).run(images)
+
+        return self.fit(images).transform(images)
+
 
 class PlanarCrossCorr(CrossCorr):
     """
@@ -106,3 +202,262 @@ class PlanarCrossCorr(CrossCorr):
                 delta.append(computeDisplacement(im[:, :, z], self.reference[:, :, z]))
 
         return PlanarDisplacement(delta)
+
+    def getTransformNear(self, im, previous):
+        """
+        Compute the planar displacement between an image or volume and reference,
+        near a previous estimate.
+
+        Overrides method from CrossCorr.
+
+        Parameters
+        ----------
+        im : ndarray
+            The image or volume
+
+        previous : PlanarDisplacement
+            Displacement from a previous round of registration
+        """
+        from lambdaimage.imgprocessing.transformation import PlanarDisplacement
+
+        delta = []
+
+        if im.ndim == 2:
+            delta.append(computeDisplacementNear(im, self.reference, previous.delta[0], self.searchRadius))
+        else:
+            for z in range(0, im.shape[2]):
+                delta.append(computeDisplacementNear(im[:, :, z], self.reference[:, :, z],
+                                                     previous.delta[z], self.searchRadius))
+
+        return PlanarDisplacement(delta)
+
+
+class PiecewiseRigid(CrossCorr):
+    """
+    Piecewise-rigid translation using cross correlation on overlapping blocks.
+
+    Each image is divided into padded blocks, a displacement is estimated for every
+    block against the matching region of the reference, displacements are regularized
+    against those of neighboring blocks, and the result is applied as a smoothly
+    interpolated displacement field.
+    """
+    def __init__(self, *args, **kwargs):
+        super(PiecewiseRigid, self).__init__(*args, **kwargs)
+        self.size = None
+        self.padding = None
+        self.smooth = None
+        self.niter = None
+
+    def prepare(self, images, size=(64, 64), padding=16, smooth=0.5, niter=2, **kwargs):
+        """
+        Prepare piecewise-rigid registration by computing or specifying a reference,
+        and setting how images are divided into blocks.
+
+        Parameters
+        ----------
+        images : ndarray or Images object
+            Images to compute reference from, or a single image to set as reference
+
+        size : tuple of positive int, optional, default = (64, 64)
+            Pixels per dimension of each block, excluding padding
+
+        padding : non-negative int or tuple of int, optional, default = 16
+            Extra pixels on each side of a block used when estimating its displacement,
+            should exceed the largest expected displacement
+
+        smooth : float between 0 and 1, optional, default = 0.5
+            Weight given to the mean displacement of neighboring blocks in each
+            regularization step, 0 disables regularization
+
+        niter : non-negative int, optional, default = 2
+            Number of regularization steps
+
+        See CrossCorr.prepare for remaining arguments.
+        """
+        if not 0 <= smooth <= 1:
+            raise ValueError("Smoothing weight must be between 0 and 1, got %g" % smooth)
+        if kwargs.get('nrounds', 1) != 1:
+            raise ValueError("Piecewise-rigid registration does a single round, got nrounds=%s" % kwargs['nrounds'])
+
+        super(PiecewiseRigid, self).prepare(images, **kwargs)
+        self.size = tuple(size)
+        self.padding = padding
+        self.smooth = smooth
+        self.niter = niter
+
+        return self
+
+    def getTransform(self, im):
+        """
+        Compute the displacement field between a single image or volume and the reference.
+
+        The image is divided into the same padded blocks as in fit(), but locally, so this
+        is meant for single images; use fit() or run() to estimate blocks in parallel.
+
+        Parameters
+        ----------
+        im : ndarray
+            The image or volume
+
+        Returns
+        -------
+        DisplacementField
+        """
+        from itertools import product
+
+        padding = self.padding if isinstance(self.padding, (tuple, list)) else [self.padding] * im.ndim
+        starts = [range(0, n, size) for (n, size) in zip(im.shape, self.size)]
+
+        blocks = []
+        for key in product(*starts):
+            core = [slice(k, min(k + size, n)) for (k, size, n) in zip(key, self.size, im.shape)]
+            pad = [slice(max(sl.start - p, 0), min(sl.stop + p, n)) for (sl, p, n) in zip(core, padding, im.shape)]
+            center = tuple((sl.start + sl.stop - 1) / 2.0 for sl in core)
+            neighbors = [tuple(k + size * d for (k, size, d) in zip(key, self.size, shift))
+                         for shift in product([-1, 0, 1], repeat=im.ndim) if any(shift)]
+            neighbors = [n for n in neighbors if all(0 <= k < m for (k, m) in zip(n, im.shape))]
+            blocks.append((key, center, neighbors, self.getBlockDisplacement(im[tuple(pad)], pad)))
+
+        return self.getField(blocks)
+
+    def getBlockDisplacement(self, ary, padSlices):
+        """
+        Compute the displacement of a padded block against the same region of the reference.
+
+        Parameters
+        ----------
+        ary : ndarray
+            Values of the padded block
+
+        padSlices : sequence of slices
+            Spatial slices of the padded block in the image
+        """
+        return computeDisplacement(taper(ary), taper(self.reference[tuple(padSlices)]))
+
+    def getBlockDisplacements(self, key, ary):
+        """
+        Compute displacements for every time point of a single padded block.
+
+        Parameters
+        ----------
+        key : PaddedBlockGroupingKey
+            Key of the block, spanning all time points
+
+        ary : ndarray
+            Block values, with time as the first dimension
+
+        Returns
+        -------
+        list of (time index, (spatial key, block center, neighboring spatial keys, displacement))
+        """
+        center = tuple((sl.start + sl.stop - 1) / 2.0 for sl in key.imgSlices[1:])
+        neighbors = key.neighbors()
+
+        out = []
+        for tpIdx in key.temporalIndexRange():
+            delta = self.getBlockDisplacement(ary[tpIdx], key.padImgSlices[1:])
+            out.append((tpIdx, (key.spatialKey, center, neighbors, delta)))
+        return out
+
+    def getField(self, blocks):
+        """
+        Regularize block displacements against their neighbors and build a displacement field.
+
+        Parameters
+        ----------
+        blocks : sequence of (spatial key, block center, neighboring spatial keys, displacement)
+            Displacements for all blocks of one image / volume
+
+        Returns
+        -------
+        DisplacementField
+        """
+        from numpy import asarray, zeros
+        from lambdaimage.imgprocessing.transformation import DisplacementField
+
+        blocks = list(blocks)
+        deltas = dict((k, asarray(d, dtype='float64')) for (k, _, _, d) in blocks)
+        for _ in range(self.niter):
+            updated = {}
+            for k, _, neighbors, _ in blocks:
+                near = [deltas[n] for n in neighbors if n in deltas]
+                if self.smooth and near:
+                    updated[k] = (1 - self.smooth) * deltas[k] + self.smooth * sum(near) / len(near)
+                else:
+                    updated[k] = deltas[k]
+            deltas = updated
+
+        # blocks lie on a regular grid, indexed by the distinct starting positions along each axis
+        ndim = len(blocks[0][0])
+        starts = [sorted(set(k[i] for (k, _, _, _) in blocks)) for i in range(ndim)]
+        centers = [[None] * len(s) for s in starts]
+        field = zeros([len(s) for s in starts] + [ndim])
+        for k, center, _, _ in blocks:
+            idx = tuple(s.index(ki) for (s, ki) in zip(starts, k))
+            for i in range(ndim):
+                centers[i][idx[i]] = center[i]
+            field[idx] = deltas[k]
+
+        return DisplacementField(centers=centers, delta=field.tolist())
+
+    def fit(self, images, cache=None):
+        """
+        Compute piecewise-rigid registration parameters on a collection of images / volumes.
+
+        Block displacements are estimated in parallel on a PaddedBlocks representation of the
+        images, and regularized in parallel across images; only the compact displacement fields
+        are returned to the driver.
+
+        Parameters
+        ----------
+        images : Images
+            An Images object with the images / volumes to estimate registration for.
+
+        cache : RegistrationCache, optional, default = None
+            Cache to load a previously estimated model from, or store a new one in.
+
+        Returns
+        -------
+        model : RegistrationModel
+            Displacement fields keyed by image, usable to transform an Images object.
+        """
+        from lambdaimage.imgprocessing.registration import RegistrationModel
+
+        if not (isinstance(images, Images)):
+            raise Exception('Input data must be Images or a subclass')
+
+        if len(images.dims.count) not in set([2, 3]):
+            raise Exception('Number of image dimensions %s must be 2 or 3' % (len(images.dims.count)))
+
+        self.isPrepared(images)
+
+        if cache is not None:
+            key = self.cacheKey(images)
+            model = cache.get(key)
+            if model is not None:
+                return model
+
+        blocks = images.toBlocks(self.size, units="pixels", padding=self.padding)
+
+        bcReg = images.rdd.context.broadcast(self)
+        displacements = blocks.rdd.flatMap(lambda kv: bcReg.value.getBlockDisplacements(kv[0], kv[1]))
+        transformations = displacements.groupByKey().mapValues(lambda v: bcReg.value.getField(v)).collectAsMap()
+
+        model = RegistrationModel(transformations, regMethod=self.__class__.__name__, transClass='DisplacementField')
+
+        if cache is not None:
+            cache.put(key, model)
+        return model
+
+    def run(self, images):
+        """
+        Compute and implement piecewise-rigid registration on a collection of images / volumes.
+
+        Unlike other methods, displacements must be estimated for all blocks before
+        any image can be transformed, so this calls fit() and then transforms the images.
+
+        See also
+        --------
+        PiecewiseRigid.fit
+        """
+        return self.fit(images).transform(images)
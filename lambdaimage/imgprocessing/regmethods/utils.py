@@ -34,6 +34,28 @@ def computeReferenceMean(images, startIdx=None, stopIdx=None, defaultNImages=20)
         The reference image / volume
     """
 
+    ref, n = selectReferenceRange(images, startIdx, stopIdx, defaultNImages)
+
+    reference = (ref.sum() / float(n)).astype(images.dtype)
+
+    return reference
+
+
+def selectReferenceRange(images, startIdx=None, stopIdx=None, defaultNImages=20):
+    """
+    Select the records over which a reference is computed.
+
+    See computeReferenceMean for how the range is chosen.
+
+    Returns
+    -------
+    ref : Images
+        The selected records
+
+    n : int
+        The number of selected records
+    """
+
     if not (isinstance(images, Images)):
         raise Exception('Input data must be Images or a subclass')
 
@@ -62,9 +84,7 @@ def computeReferenceMean(images, startIdx=None, stopIdx=None, defaultNImages=20)
     else:
         ref = images
 
-    reference = (ref.sum() / float(n)).astype(images.dtype)
-
-    return reference
+    return ref, n
 
 
 def checkReference(images, reference):
@@ -124,3 +144,89 @@ def computeDisplacement(arry1, arry2):
     adjusted = [int(d - n) if d > n // 2 else int(d) for (d, n) in pairs]
 
     return adjusted
+
+
+def computeDisplacementNear(arry1, arry2, delta, radius=2):
+    """
+    Compute an optimal displacement between two ndarrays within a window around a guess.
+
+    Takes the peak of the same circular cross correlation as computeDisplacement, but
+    only among displacements within `radius` of `delta` along each dimension, so that
+    a good starting displacement cannot be replaced by a distant spurious peak.
+
+    When the window is small, only its (2 * radius + 1) ** ndim correlation values are
+    computed, each as the dot product of arry1 with a shifted view of a padded copy of
+    arry2, so this costs one copy of arry2 plus (2 * radius + 1) ** ndim passes over the
+    arrays (125 for a 3d window of radius 2). Once that exceeds the roughly 3 * log2(size)
+    passes of the three fourier transforms of computeDisplacement, the full correlation
+    is computed with them instead and its peak is taken within the window.
+
+    Parameters
+    ----------
+    arry1 : ndarray
+        The first array
+
+    arry2 : ndarray
+        The second array
+
+    delta : list of int
+        The starting displacement, e.g. from a previous registration
+
+    radius : non-negative int, optional, default = 2
+        Largest change from `delta` to consider along each dimension
+    """
+    from itertools import product
+    from numpy import argmax, arange, asarray, einsum, ix_, log2, pad, roll, unravel_index, zeros
+    from numpy.fft import fftn, ifftn
+
+    arry1 = asarray(arry1, dtype='float64')
+    arry2 = asarray(arry2, dtype='float64')
+    dims = range(arry1.ndim)
+    first = [int(round(d)) - radius for d in delta]
+    width = 2 * radius + 1
+
+    if width ** arry1.ndim > 3 * log2(max(arry1.size, 2)):
+        # the same correlation as computeDisplacement, restricted to the window
+        full = abs(ifftn(fftn(arry1) * fftn(arry2).conjugate()))
+        c = full[ix_(*[(f + arange(width)) % n for (f, n) in zip(first, arry1.shape)])]
+    else:
+        # the correlation at displacement d is sum(arry1 * roll(arry2, d)), arry2 is rolled to
+        # the first displacement of the window and padded so that every other one is a view of it,
+        # one axis at a time since np.roll takes several axes only from numpy 1.12
+        shifted = arry2
+        for axis, f in enumerate(first):
+            shifted = roll(shifted, f, axis=axis)
+        padded = pad(shifted, [(2 * radius, 0)] * arry1.ndim, mode='wrap')
+
+        c = zeros([width] * arry1.ndim)
+        for offset in product(range(width), repeat=arry1.ndim):
+            view = padded[tuple(slice(2 * radius - t, 2 * radius - t + n) for (t, n) in zip(offset, arry1.shape))]
+            c[offset] = abs(einsum(arry1, dims, view, dims, []))
+    peak = unravel_index(argmax(c), c.shape)
+
+    # cast to basic python int for serialization
+    return [int(f + p) for (f, p) in zip(first, peak)]
+
+
+def taper(arry):
+    """
+    Remove the mean of an ndarray and taper it towards zero at its borders.
+
+    Applies a separable Hann window so that the circular cross correlation
+    used by computeDisplacement is not dominated by discontinuities between
+    opposite edges, as happens for blocks cut out of a larger image.
+
+    Parameters
+    ----------
+    arry : ndarray
+        The array to taper
+    """
+    from numpy import hanning
+
+    out = arry - arry.mean()
+    for axis, n in enumerate(arry.shape):
+        shape = [1] * arry.ndim
+        shape[axis] = n
+        out = out * hanning(n).reshape(shape)
+
+    return out
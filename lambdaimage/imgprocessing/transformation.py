@@ -92,3 +92,75 @@ class PlanarDisplacement(Transformation, Serializable):
 
     def __repr__(self):
         return "PlanarDisplacement(delta=%s)" % repr(self.delta)
+
+
+class DisplacementField(Transformation, Serializable):
+    """
+    Class for transformations based on spatially varying displacements.
+
+    Displacements are specified on a regular grid of points, typically the centers
+    of blocks, and linearly interpolated between them.
+
+    Parameters
+    ----------
+    centers : list
+        A nested list, where the first list is over dimensions, and for
+        each dimension the increasing positions of the grid points
+
+    delta : list
+        A nested list with one entry per grid point, each entry a list
+        of displacements for each dimension
+    """
+
+    def __init__(self, centers=None, delta=None):
+        self.centers = centers
+        self.delta = delta
+
+    def toArray(self):
+        """
+        Return transformation as an array
+        """
+        return asarray(self.delta)
+
+    def getField(self, shape):
+        """
+        Interpolate the displacements to every pixel of an image or volume.
+
+        Parameters
+        ----------
+        shape : tuple
+            Shape of the image or volume
+
+        Returns
+        -------
+        list of ndarray, the displacement along each dimension
+        """
+        from numpy import arange, interp, meshgrid
+        from scipy.ndimage.interpolation import map_coordinates
+
+        delta = asarray(self.delta, dtype='float64')
+        # fractional grid position of every pixel along each dimension, clamped at the outermost points
+        gridPos = [interp(arange(n), c, arange(len(c))) for (n, c) in zip(shape, self.centers)]
+        coords = meshgrid(*gridPos, indexing='ij')
+        return [map_coordinates(delta[..., i], coords, order=1, mode='nearest') for i in range(len(shape))]
+
+    def apply(self, im):
+        """
+        Apply a displacement field by resampling an image or volume.
+
+        Parameters
+        ----------
+        im : ndarray
+            The image or volume to transform
+        """
+        from numpy import indices
+        from scipy.ndimage.interpolation import map_coordinates
+
+        field = self.getField(im.shape)
+        coords = indices(im.shape, dtype='float64')
+        for i in range(im.ndim):
+            coords[i] += field[i]
+        return map_coordinates(im, coords, order=1, mode='nearest')
+
+    def __repr__(self):
+        return "DisplacementField(delta=%s)" % repr(self.delta)
@@ -102,14 +102,19 @@ def projection(img_stack, method='max'):
         raise "Bad Projection Method", method
     return proj
 
-def smooth(rdd, smooth_size):
+def smooth_frame(frame, smooth_size):
+    '''
+    Usage:
+     - median filter then contrast enhancement of one frame, see smooth
+    '''
     from skimage.morphology import disk
     from skimage.filters import rank
-    def func(frame):
-        smoothed = rank.median(frame,disk(smooth_size))
-        smoothed = rank.enhance_contrast(smoothed, disk(smooth_size))
-        return smoothed
-    return rdd.applyValues(func)
+    smoothed = rank.median(frame,disk(smooth_size))
+    smoothed = rank.enhance_contrast(smoothed, disk(smooth_size))
+    return smoothed
+
+def smooth(rdd, smooth_size):
+    return rdd.applyValues(lambda frame: smooth_frame(frame, smooth_size))
 
 @exeTime
 def blockshaped_all(img_stack, nrows, ncols):
@@ -305,12 +305,16 @@ class Data(object):
         to which they can be cast safely, as determined by the lambdaimage.utils.common smallest_float_type function.
         Typically this will be a float type larger than a passed integer type (for instance, float16 for int8 or uint8).
 
+        If 'precision' is passed, values will be cast to the compute precision set by
+        lambdaimage.utils.common.setPrecision, float64 unless changed. 'safe' casting is relaxed
+        to 'same_kind' in that case, so that float64 values can be narrowed to float32.
+
         If the passed dtype is the same as the current dtype, or if 'smallfloat' is passed when values are already
         in floating point, then this method will return self unchanged.
 
         Parameters
         ----------
-        dtype: numpy dtype or dtype specifier, or string 'smallfloat', or None
+        dtype: numpy dtype or dtype specifier, or string 'smallfloat' or 'precision', or None
             Data type to which RDD values are to be cast. Will return without cast if None is passed.
 
         casting: 'no'|'equiv'|'safe'|'same_kind'|'unsafe', optional, default 'safe'
@@ -328,6 +332,12 @@ class Data(object):
             # get the smallest floating point type that can be safely cast to from our current type
             from lambdaimage.utils.common import smallestFloatType
             dtype = smallestFloatType(self.dtype)
+        elif dtype == 'precision':
+            from lambdaimage.utils.common import getPrecision
+            dtype = getPrecision()
+            # narrowing to the compute precision is intended
+            if casting == 'safe':
+                casting = 'same_kind'
 
         def cast(v, dtype_, casting_):
             if isinstance(v, ndarray):
@@ -340,7 +350,7 @@ class Data(object):
         nextRdd = self.rdd.mapValues(lambda v: cast(v, dtypeFunc(dtype), casting))
         return self._constructor(nextRdd, dtype=str(dtype)).__finalize__(self)
 
-    def apply(self, func, keepDtype=False, keepIndex=False):
+    def apply(self, func, keepDtype=False, keepIndex=False, preservesPartitioning=False):
         """
         Apply arbitrary function to records of a Data object.
 
@@ -359,13 +369,18 @@ class Data(object):
         keepIndex : boolean
             Whether to preserve the index, if false index will be set to none
             under the assumption that the function might change it
+
+        preservesPartitioning : boolean
+            Whether the function leaves keys unchanged, so that the partitioner
+            of the underlying RDD can be kept
         """
         noprop = ()
         if keepDtype is False:
             noprop += ('_dtype',)
         if keepIndex is False:
             noprop += ('_index',)
-        return self._constructor(self.rdd.map(func)).__finalize__(self, noPropagate=noprop)
+        newrdd = self.rdd.map(func, preservesPartitioning=preservesPartitioning)
+        return self._constructor(newrdd).__finalize__(self, noPropagate=noprop)
 
     def applyKeys(self, func, **kwargs):
         """
@@ -386,6 +401,7 @@ class Data(object):
         --------
         Data.apply
         """
+        kwargs.setdefault('preservesPartitioning', True)
         return self.apply(lambda (k, v): (k, func(v)), **kwargs)
 
     def collect(self, sorting=False):
@@ -462,7 +478,7 @@ class Data(object):
         self._nrecords = count
         return count
 
-    def mean(self, dtype='float64', casting='safe'):
+    def mean(self, dtype='precision', casting='safe'):
         """
         Mean of values computed by aggregating across records, returned as an ndarray
         with the same size as a single record.
@@ -472,7 +488,7 @@ class Data(object):
         """
         return self.stats('mean', dtype=dtype, casting=casting).mean()
 
-    def sum(self, dtype='float64', casting='safe'):
+    def sum(self, dtype='precision', casting='safe'):
         """
         Sum of values computed by aggregating across records, returned as an ndarray
         with the same size as a single record.
@@ -480,12 +496,17 @@ class Data(object):
         If dtype is not None, then the values will first be cast to the requested type before the operation is
         performed. See Data.astype() for details.
 
+        By default values are cast to the compute precision, see lambdaimage.utils.common.setPrecision,
+        and summed in double precision.
+
         obj.sum() is equivalent to obj.astype(dtype, casting).rdd.values().sum().
         """
         out = self.astype(dtype, casting)
+        if dtype == 'precision':
+            return out.rdd.values().treeReduce(lambda a, b: add(a, b, dtype='float64'), depth=3)
         return out.rdd.values().treeReduce(add, depth=3)
 
-    def variance(self, dtype='float64', casting='safe'):
+    def variance(self, dtype='precision', casting='safe'):
         """
         Variance of values computed by aggregating across records, returned as an ndarray
         with the same size as a single record.
@@ -495,7 +516,7 @@ class Data(object):
         """
         return self.stats('variance', dtype=dtype, casting=casting).variance()
 
-    def stdev(self, dtype='float64', casting='safe'):
+    def stdev(self, dtype='precision', casting='safe'):
         """
         Standard deviation of values computed by aggregating across records, returned as an ndarray
         with the same size as a single record.
@@ -507,7 +528,7 @@ class Data(object):
         """
         return self.stats('stdev', dtype=dtype, casting=casting).stdev()
 
-    def stats(self, requestedStats='all', dtype='float64', casting='safe'):
+    def stats(self, requestedStats='all', dtype='precision', casting='safe'):
         """
         Return a L{StatCounter} object that captures all or some of the mean, variance, maximum, minimum,
         and count of the RDD's elements in one operation.
@@ -519,8 +540,9 @@ class Data(object):
         requestedStats: sequence of one or more requested stats, or 'all'
             Possible stats include 'mean', 'sum', 'min', 'max', 'variance', 'sampleVariance', 'stdev', 'sampleStdev'.
 
-        dtype: numpy dtype or dtype specifier, or string 'smallfloat', or None
+        dtype: numpy dtype or dtype specifier, or string 'smallfloat' or 'precision', or None
             Data type to which RDD values are to be cast before calculating stats. See Data.astype().
+            Defaults to the compute precision; single precision values are accumulated in double precision.
 
         casting: 'no'|'equiv'|'safe'|'same_kind'|'unsafe', optional, default 'safe'
             Method of casting to use. See Data.astype() and numpy astype() function.
@@ -586,6 +608,22 @@ class Data(object):
         self.rdd = self.rdd.repartition(numPartitions)
         return self
 
+    def partitionBy(self, numPartitions):
+        """
+        Hash partition data by key.
+
+        This calls the Spark partitionBy() method on the underlying RDD. Data objects
+        partitioned with the same number of partitions place records with equal keys
+        in the same partition, so they can be joined by key without a shuffle.
+
+        Parameters
+        ----------
+        numPartitions : int
+            Number of partitions in new RDD
+        """
+        self.rdd = self.rdd.partitionBy(numPartitions)
+        return self
+
     def filter(self, func):
         """
         Filter records by applying a function to each record.
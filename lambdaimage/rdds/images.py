@@ -388,8 +388,13 @@ class Images(Data):
         order : choice of 0 / 1 / 2 / 3 or sequence from same set, optional, default = 0
             Order of the gaussian kernel, 0 is a gaussian, higher numbers correspond
             to derivatives of a gaussian.
+
+        Floating point images wider than the compute precision (see lambdaimage.utils.common.setPrecision)
+        are filtered and returned in that precision.
         """
         from scipy.ndimage.filters import gaussian_filter
+        from numpy import dtype as dtypeFunc
+        from lambdaimage.utils.common import getPrecision
 
         dims = self.dims
         ndims = len(dims)
@@ -397,6 +402,13 @@ class Images(Data):
         if ndims == 3 and size(sigma) == 1:
             sigma = [sigma, sigma, 0]
 
+        precision = getPrecision()
+        current = dtypeFunc(self.dtype)
+        if current.kind == 'f' and current.itemsize > precision.itemsize:
+            return self._constructor(
+                self.rdd.mapValues(lambda v: gaussian_filter(v.astype(precision), sigma, order)),
+                dtype=str(precision)).__finalize__(self)
+
         return self._constructor(
             self.rdd.mapValues(lambda v: gaussian_filter(v, sigma, order))).__finalize__(self)
 
@@ -699,3 +711,88 @@ class Images(Data):
         """
         renumberedRdd = self.rdd.values().zipWithIndex().map(lambda (ary, idx): (idx, ary))
         return self._constructor(renumberedRdd).__finalize__(self)
+
+    def pairWith(self, other, npartitions=None):
+        """
+        Pair each image / volume with the one of another Images object that has the same key.
+
+        Both objects are hash partitioned by key with a shared partitioner and joined, so
+        records are paired by key rather than by position, and the data never passes
+        through the driver. If both objects are already partitioned this way, for instance
+        when loaded with lambdaimageContext.loadImagesPair, the join does not shuffle.
+        Keys present in only one of the objects are dropped.
+
+        Parameters
+        ----------
+        other : Images
+            Images with the same dimensions and keys, e.g. a second view of the same sample
+
+        npartitions : positive int, optional, default = None
+            Number of partitions of the result, if unspecified will keep the current
+            partitioning when there is one, and otherwise use the larger number of
+            partitions of the two objects
+
+        Returns
+        -------
+        Images object whose values stack the two images / volumes along a new first axis
+        """
+        from numpy import asarray
+
+        if not isinstance(other, Images):
+            raise Exception('Can only pair with Images or a subclass')
+
+        if npartitions is None:
+            if self.rdd.partitioner is not None:
+                npartitions = self.rdd.partitioner.numPartitions
+            else:
+                npartitions = max(self.rdd.getNumPartitions(), other.rdd.getNumPartitions())
+
+        left = self.rdd.partitionBy(npartitions)
+        right = other.rdd.partitionBy(npartitions)
+        paired = left.join(right, npartitions).mapValues(lambda (v1, v2): asarray((v1, v2)))
+
+        return self._constructor(paired).__finalize__(self, noPropagate=('_dims', '_dtype', '_nrecords'))
+
+    def label(self, connectivity=1, size="64M"):
+        """
+        Label the connected components of binary images / volumes.
+
+        Blocks of the data are labeled independently, each with a one pixel padding. Only the
+        labels on the faces between adjacent blocks are exchanged, the resulting equivalences are
+        resolved with a union-find on the driver, and the blocks are relabeled in place, so the
+        data is never gathered on one machine.
+
+        Two-dimensional images are taken as the planes of a single stack, indexed by key, and
+        labeled as one volume; three-dimensional volumes are labeled one by one.
+
+        Parameters
+        ----------
+        connectivity : int, optional, default = 1
+            Maximum number of axes along which neighboring pixels may differ to be connected,
+            1 for face neighbors up to the number of dimensions for all neighbors,
+            see scipy.ndimage.generate_binary_structure
+
+        size : string or tuple, optional, default = "64M"
+            Block size, see Images.toBlocks
+
+        Returns
+        -------
+        Images of int32 labels numbered from 1, with 0 as background
+        """
+        from numpy import zeros
+        from scipy.ndimage import generate_binary_structure, label
+        from lambdaimage.rdds.imgblocks.labeling import labelBlocks
+
+        ndim = len(self.dims)
+        rank = 3 if ndim == 2 else ndim
+        if not 1 <= connectivity <= rank:
+            raise ValueError("Connectivity must be between 1 and %d, got %s" % (rank, connectivity))
+        if ndim == 2:
+            structure = generate_binary_structure(3, connectivity)
+        else:
+            # no connections between volumes, the first axis of blocks
+            structure = zeros((3,) + (3,) * ndim, dtype=bool)
+            structure[1] = generate_binary_structure(ndim, connectivity)
+
+        blocks = self.toBlocks(size, units="pixels", padding=1)
+        return labelBlocks(blocks, lambda v: label(v, structure)[0], merge='connect')
@@ -0,0 +1,230 @@
+""" Labeling of PaddedBlocks with labels stitched across block boundaries """
+
+from numpy import arange, ascontiguousarray, asarray, concatenate, dtype, empty, maximum, minimum, prod, \
+    searchsorted, unique, void, where, zeros
+
+
+def blockIndex(key):
+    """
+    Linear index of a block in the grid of blocks of its image.
+
+    Parameters
+    ----------
+    key : PaddedBlockGroupingKey
+    """
+    index = 0
+    for start, pix, n in zip(key.spatialKey, key.pixelsPerDim, key.origShape[1:]):
+        nblocks = -(-n // pix)
+        index = index * nblocks + start // pix
+    return index
+
+
+def _coreSlices(spatialKey, key):
+    """ Spatial slices of the core of the block at spatialKey, in image coordinates """
+    return [slice(start, min(start + pix, n))
+            for start, pix, n in zip(spatialKey, key.pixelsPerDim, key.origShape[1:])]
+
+
+def _shell(core, other):
+    """
+    The part of the block with core slices other lying within one pixel of core,
+    as (start, stop) pairs, or None if the blocks are not adjacent.
+    """
+    region = []
+    for c, o in zip(core, other):
+        lo, hi = max(c.start - 1, o.start), min(c.stop + 1, o.stop)
+        if hi <= lo:
+            return None
+        region.append((lo, hi))
+    return tuple(region)
+
+
+def _faceMessages(key, labels):
+    """
+    Labels of a block on the faces it shares with each neighbor.
+
+    For every pair of adjacent blocks (a, b), the region of the core of b within one pixel of
+    the core of a is sent twice under the key (a, b): once as labeled by a, which holds it in
+    its padding, and once as labeled by b, which holds it in its core.
+    """
+    core = key.imgSlices[1:]
+    pad = key.padImgSlices[1:]
+
+    def local(region):
+        return [slice(None)] + [slice(lo - p.start, hi - p.start) for (lo, hi), p in zip(region, pad)]
+
+    messages = []
+    for neighbor in key.neighbors():
+        other = _coreSlices(neighbor, key)
+        region = _shell(core, other)
+        if region is not None:
+            messages.append(((key.spatialKey, neighbor), ('pad', labels[local(region)])))
+        region = _shell(other, core)
+        if region is not None:
+            messages.append(((neighbor, key.spatialKey), ('core', labels[local(region)])))
+    return messages
+
+
+def _uniquePairs(pad, core, return_counts=False):
+    """
+    Distinct (pad, core) label pairs, rows compared through a void view since numpy 1.9
+    has no unique along an axis.
+    """
+    pairs = ascontiguousarray(concatenate([pad[:, None], core[:, None]], axis=1).astype('int64'))
+    rows = pairs.view(dtype((void, pairs.dtype.itemsize * 2))).ravel()
+    _, first, counts = unique(rows, return_index=True, return_counts=True)
+    if return_counts:
+        return pairs[first], counts
+    return pairs[first]
+
+
+def _connectedPairs(pad, core):
+    """
+    Pairs of labels found on the same pixels of a face, which are connected through them.
+    """
+    both = (pad > 0) & (core > 0)
+    if not both.any():
+        return empty((0, 2), dtype='int64')
+    return _uniquePairs(pad[both], core[both])
+
+
+def _overlapPairs(pad, core):
+    """
+    Pairs of labels that are the same object on a face, when each covers the majority
+    of the other's pixels there.
+    """
+    both = (pad > 0) & (core > 0)
+    if not both.any():
+        return empty((0, 2), dtype='int64')
+    pairs, counts = _uniquePairs(pad[both], core[both], return_counts=True)
+    padIds, padCounts = unique(pad[pad > 0], return_counts=True)
+    coreIds, coreCounts = unique(core[core > 0], return_counts=True)
+    padTotal = padCounts[searchsorted(padIds, pairs[:, 0])]
+    coreTotal = coreCounts[searchsorted(coreIds, pairs[:, 1])]
+    return pairs[(2 * counts > padTotal) & (2 * counts > coreTotal)]
+
+
+MERGES = {
+    'connect': _connectedPairs,
+    'overlap': _overlapPairs,
+}
+
+
+def unionFind(pairs, n):
+    """
+    Resolve equivalences between integer ids with a vectorized union-find.
+
+    Roots are hooked under the smallest root of each pair and paths are fully compressed
+    after every round, until every pair shares its root.
+
+    Parameters
+    ----------
+    pairs : ndarray of shape (npairs, 2)
+        Pairs of equivalent ids in [0, n)
+
+    n : int
+        Number of ids
+
+    Returns
+    -------
+    ndarray of length n with the smallest id of the class of each id
+    """
+    parent = arange(n)
+    pairs = asarray(pairs, dtype='int64').reshape(-1, 2)
+    a, b = pairs[:, 0], pairs[:, 1]
+    while True:
+        ra, rb = parent[a], parent[b]
+        differ = ra != rb
+        if not differ.any():
+            return parent
+        minimum.at(parent, maximum(ra, rb)[differ], minimum(ra, rb)[differ])
+        while True:
+            grand = parent[parent]
+            if (grand == parent).all():
+                break
+            parent = grand
+
+
+def labelBlocks(blocks, labelFunc, merge='overlap'):
+    """
+    Label every block independently and stitch the labels into one consistent labeling.
+
+    Local labels are made unique by the index of their block. Adjacent blocks exchange only
+    their labels on the faces between them, the resulting pairs of equivalent labels are
+    resolved on the driver with a union-find, and the blocks are relabeled with consecutive
+    labels from 1. The image is never gathered in one place.
+
+    Parameters
+    ----------
+    blocks : PaddedBlocks
+        Blocks with a padding of at least one pixel on every spatial axis
+
+    labelFunc : function
+        Labels the array of a padded block, with 0 as background. Labels must be below
+        nimages * (pixels per image + 1), so the images of a block may be numbered apart
+
+    merge : 'connect' or 'overlap', optional, default = 'overlap'
+        How labels meeting on a face are merged. 'connect' merges any labels of the two blocks
+        that share a pixel, which is exact for connected components. 'overlap' merges the labels
+        that cover the majority of each other's pixels on the face, which suits segmentations
+        whose objects may touch, like watersheds.
+
+    Returns
+    -------
+    Images of int32 labels (int64 if there are more than 2**31 - 1), from the relabeled blocks,
+    which stay persisted in place of the local labels
+    """
+    from pyspark import StorageLevel
+    from lambdaimage.rdds.imgblocks.blocks import PaddedBlocks
+
+    if merge not in MERGES:
+        raise ValueError("merge must be one of %s, got '%s'" % (sorted(MERGES), merge))
+    pairsFunc = MERGES[merge]
+
+    def labelBlock(kv):
+        key, val = kv
+        local = asarray(labelFunc(val)).astype('int64')
+        stride = key.origShape[0] * (prod(key.origShape[1:]) + 1)
+        return key, where(local > 0, local + blockIndex(key) * stride, 0)
+
+    labeled = blocks.rdd.map(labelBlock).persist(StorageLevel.MEMORY_AND_DISK)
+
+    def facePairs(messages):
+        sides = dict(messages)
+        if len(sides) < 2:
+            return []
+        return [pairsFunc(sides['pad'], sides['core'])]
+
+    pairs = labeled.flatMap(lambda kv: _faceMessages(*kv)).groupByKey().values().flatMap(facePairs).collect()
+    pairs = concatenate(pairs) if pairs else empty((0, 2), dtype='int64')
+
+    def coreIds(kv):
+        key, val = kv
+        ids = unique(val[key.valSlices])
+        return ids[ids > 0]
+
+    ids = labeled.map(coreIds).collect()
+    ids = unique(concatenate(ids)) if ids else zeros(0, dtype='int64')
+
+    # compact the ids of the labels in cores and on faces, then resolve them
+    nodes = unique(concatenate([ids, pairs.ravel()]))
+    roots = nodes[unionFind(searchsorted(nodes, pairs), len(nodes))]
+    _, final = unique(roots[searchsorted(nodes, ids)], return_inverse=True)
+    final = final + 1
+    dtype = 'int32' if len(final) == 0 or final.max() < 2**31 else 'int64'
+    mapping = labeled.context.broadcast((ids, final.astype(dtype)))
+
+    def relabel(kv):
+        key, val = kv
+        ids, final = mapping.value
+        out = zeros(val.shape, dtype=dtype)
+        if len(ids):
+            idx = minimum(searchsorted(ids, val), len(ids) - 1)
+            found = (ids[idx] == val) & (val > 0)
+            out[found] = final[idx[found]]
+        return key, out
+
+    relabeled = labeled.map(relabel).persist(StorageLevel.MEMORY_AND_DISK)
+    relabeled.count()
+    labeled.unpersist()
+    return PaddedBlocks(relabeled, dims=blocks.dims, nimages=blocks.nimages, dtype=dtype).toImages()
@@ -13,42 +13,45 @@ def _generate_H(imgA, imgB):
     Usage:
      - calc the grey level histogram of imgA&B
     '''
-    H = np.zeros((256,256))
-    _X, _Y = imgA.shape
-    for i in range(_X):
-        for j in range(_Y):
-            H[imgA[i,j],imgB[i,j]] += 1
-    return H.astype(float)
+    idx = imgA.astype(np.intp).ravel() * 256 + imgB.astype(np.intp).ravel()
+    return np.bincount(idx, minlength=256*256).reshape(256,256).astype(float)
+
+def _entropy(p):
+    p = p[p > 1e-7]
+    return -(p * np.log2(p)).sum()
 
 def _mutual_info(H):
     '''
     Usage:
      - calc the -(mutual information)
     '''
-    tot = .0+ sum(H.flatten())
-    p = H/tot
-    HAB = sum(map(lambda x: -x*math.log(x,2) if x>1e-7 else 0, p.flatten()))
-    HA = sum(map(lambda x: -x*math.log(x,2) if x>1e-7 else 0, sum(p).flatten()))
-    HB = sum(map(lambda x: -x*math.log(x,2) if x>1e-7 else 0, sum(p.T).flatten()))
-    IAB = HA + HB - HAB
+    p = H / H.sum()
+    IAB = _entropy(p.sum(axis=0)) + _entropy(p.sum(axis=1)) - _entropy(p)
     return -IAB
 
 def _PV_interpolation(H ,p, q, imgA, imgB):
     '''
     Usage:
-     - update the grey level histogram
+     - update the grey level histogram with the pixels p of imgB, mapped to q in imgA
+     - p, q are pairs of coordinate arrays
     '''
     _X, _Y = imgA.shape
     px, py = p
     qx, qy = q
-    dx, dy = qx-math.floor(qx), qy-math.floor(qy)
-    if qx <= 0 or qx >= _X-1 or qy <= 0 or qy >= _Y-1:
-        H[imgA[0,0],imgA[0,0]] += 1 
-    else:
-        H[imgA[int(math.floor(qx)),int(math.floor(qy))], imgB[px, py]] += (1-dx)*(1-dy)
-        H[imgA[int(math.floor(qx)),int(math.ceil(qy))], imgB[px, py]] += dx*(1-dy)
-        H[imgA[int(math.ceil(qx)),int(math.floor(qy))], imgB[px, py]] += (1-dx)*dy
-        H[imgA[int(math.ceil(qx)),int(math.ceil(qy))], imgB[px, py]] += dx*dy
+    out = (qx <= 0) | (qx >= _X-1) | (qy <= 0) | (qy >= _Y-1)
+    H[imgA[0,0],imgA[0,0]] += out.sum()
+    px, py, qx, qy = px[~out], py[~out], qx[~out], qy[~out]
+    fx, fy = np.floor(qx), np.floor(qy)
+    dx, dy = qx-fx, qy-fy
+    fx, fy = fx.astype(np.intp), fy.astype(np.intp)
+    cx, cy = np.ceil(qx).astype(np.intp), np.ceil(qy).astype(np.intp)
+    a = imgA.ravel()
+    b = imgB.ravel().take(px*_Y + py).astype(np.intp)
+    # the four corner weights, paired with corners as in the C kernel
+    corners = [(fx, fy, (1-dx)*(1-dy)), (fx, cy, dx*(1-dy)), (cx, fy, (1-dx)*dy), (cx, cy, dx*dy)]
+    idx = np.concatenate([a.take(x*_Y + y).astype(np.intp) * 256 + b for (x, y, w) in corners])
+    weights = np.concatenate([w for (x, y, w) in corners])
+    H += np.bincount(idx, weights=weights, minlength=256*256).reshape(256,256)
 
 def _get_trans(vec):
     '''
@@ -66,17 +69,98 @@ def _get_trans(vec):
 
 def _update(vec, imgA, imgB):
     H = _generate_H(imgA, imgB)
-    _H = H.copy()
     _X, _Y = imgA.shape
     U = _get_trans(vec)
-    for i in range(_X):
-        for j in range(_Y):
-            p = np.array([i,j,1])
-            q = np.dot(U, p)
-            p = (p[0],p[1])
-            q = (q[0],q[1])
-            _PV_interpolation(_H, p, q, imgA, imgB)
-    return _mutual_info(_H)
+    px, py = np.indices((_X, _Y)).reshape(2, -1)
+    qx = U[0,0]*px + U[0,1]*py + U[0,2]
+    qy = U[1,0]*px + U[1,1]*py + U[1,2]
+    _PV_interpolation(H, (px, py), (qx, qy), imgA, imgB)
+    return _mutual_info(H)
+
+def _keypoints(img, n=500, radius=4):
+    '''
+    Usage:
+     - detect Harris corners in img and describe each by its normalized neighbourhood
+    Args:
+     - n: the max number of keypoints
+     - radius: the half size of the descriptor patch
+    '''
+    from skimage.feature import corner_harris, corner_peaks
+    img = img.astype(np.float64)
+    pts = corner_peaks(corner_harris(img), min_distance=radius, exclude_border=radius, num_peaks=n)
+    if len(pts) == 0:
+        return pts, np.zeros((0, (2*radius+1)**2))
+    # gather every patch at once, as an (npts, patch size) array
+    offsets = np.arange(-radius, radius+1)
+    rows = pts[:, 0, None, None] + offsets[None, :, None]
+    cols = pts[:, 1, None, None] + offsets[None, None, :]
+    desc = img[rows, cols].reshape(len(pts), -1)
+    desc -= desc.mean(axis=1)[:, None]
+    desc /= np.maximum(np.sqrt((desc**2).sum(axis=1)), 1e-7)[:, None]
+    return pts, desc
+
+def _match(descA, descB, ratio=0.8):
+    '''
+    Usage:
+     - match descriptors of B to A with a KD-tree and Lowe's ratio test
+     - return the index pairs (iA, iB)
+    '''
+    from scipy.spatial import cKDTree
+    if len(descA) < 2 or len(descB) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    dist, idx = cKDTree(descA).query(descB, k=2)
+    good = dist[:, 0] < ratio * dist[:, 1]
+    return idx[good, 0], np.nonzero(good)[0]
+
+def _affine_to_vec(M):
+    '''
+    Usage:
+     - decompose a 3x3 affine matrix into the vec of _get_trans (with hy = 0)
+    '''
+    Q, R = np.linalg.qr(M[:2, :2])
+    # make the scales positive, leave a reflection in sy
+    signs = np.sign(np.diag(R))
+    signs[signs == 0] = 1
+    Q, R = Q * signs, R * signs[:, None]
+    if np.linalg.det(Q) < 0:
+        Q[:, 1], R[1, :] = -Q[:, 1], -R[1, :]
+    sita = math.atan2(Q[1, 0], Q[0, 0])
+    return [M[0, 2], M[1, 2], sita, R[0, 0], R[1, 1], R[0, 1] / R[0, 0], 0]
+
+@exeTime
+def keypoint_init(imgA, imgB, downscale=4, min_matches=10):
+    '''
+    Usage:
+     - estimate a starting vec for powell from keypoints matched on a downsampled level
+     - fall back to the identity if there are too few matches
+    Args:
+     - downscale: the downsampling factor of the matching level
+     - min_matches: the least number of RANSAC inliers to accept the estimate
+    '''
+    from skimage.transform import downscale_local_mean, AffineTransform
+    from skimage.measure import ransac
+    from lambdaimage.utils.tool import log
+    identity = [0,0,0,1,1,0,0]
+    f = downscale
+    smallA = downscale_local_mean(imgA.astype(np.float64), (f, f))
+    smallB = downscale_local_mean(imgB.astype(np.float64), (f, f))
+    ptsA, descA = _keypoints(smallA)
+    ptsB, descB = _keypoints(smallB)
+    iA, iB = _match(descA, descB)
+    if len(iA) < min_matches:
+        log('warn')('%d keypoint matches, starting from the identity' % len(iA))
+        return identity
+    # the model maps coordinates in B to coordinates in A, as U does
+    model, inliers = ransac((ptsB[iB].astype(np.float64), ptsA[iA].astype(np.float64)),
+                            AffineTransform, min_samples=3, residual_threshold=1.5, max_trials=500)
+    if model is None or inliers.sum() < min_matches:
+        log('warn')('too few RANSAC inliers, starting from the identity')
+        return identity
+    # back to full resolution, pixel i of the small level is centered at f*i + (f-1)/2
+    M = model.params.copy()
+    c = np.array([(f-1)/2.0, (f-1)/2.0])
+    M[:2, 2] = f * M[:2, 2] + c - np.dot(M[:2, :2], c)
+    return _affine_to_vec(M)
 
 def _trans(frame, vec):
     from lambdaimage.udf._trans import trans
@@ -123,10 +207,32 @@ def execute(rdd, vec):
     return rdd.applyValues(func)
 
 
-def mutual_information(rdd, vec=None, *args):
+def mutual_information(rdd, vec=None, *args, **kwargs):
+    '''
+    Usage:
+     - mutual_information(rdd)(imgA, imgB) estimate the affine vec on imgA&B, then transform rdd
+     - mutual_information(rdd, vec) transform rdd with a known vec
+    Args:
+     - cache: (keyword only) a RegistrationCache, the vec estimated for the same imgA, imgB, ftol
+              and init is reused
+     - init: (in wrap) 'identity' starts powell from [0,0,0,1,1,0,0],
+             'keypoints' starts it from keypoint_init(imgA, imgB)
+    '''
+    cache = kwargs.get('cache')
     if not vec:
-        def wrap(imgA, imgB, ftol=0.1):
-            vec = c_powell(imgA, imgB, [0,0,0,1,1,0,0], ftol)
+        def wrap(imgA, imgB, ftol=0.1, init='identity'):
+            if cache is not None:
+                key = cache.key(imgA, imgB, method='mutual_information', init=init, ftol=ftol)
+                vec = cache.get(key)
+                if vec is not None:
+                    return execute(rdd, vec)
+            if init == 'keypoints':
+                vec0 = keypoint_init(imgA, imgB)
+            else:
+                vec0 = [0,0,0,1,1,0,0]
+            vec = c_powell(imgA, imgB, vec0, ftol)
+            if cache is not None:
+                cache.put(key, vec)
             return execute(rdd, vec)
         return wrap
     else:
@@ -135,11 +241,15 @@ def mutual_information(rdd, vec=None, *args):
 def cross_correlation(rdd):
     from skimage.feature import register_translation
     from scipy.ndimage import fourier_shift
+    from scipy import fftpack
+    from lambdaimage.utils.common import getPrecision
+    # scipy's fft keeps float32 in complex64, numpy's always computes in complex128
+    ftype = getPrecision()
     def func(dframe):
         frame1,frame2 = dframe[0], dframe[1]
         shift,error,diffphase = register_translation(frame1, frame2, 10)
-        tframe = fourier_shift(np.fft.fftn(frame2), shift)
-        tframe = np.fft.ifftn(tframe)
+        tframe = fourier_shift(fftpack.fftn(frame2.astype(ftype)), shift)
+        tframe = fftpack.ifftn(tframe)
         return tframe.real
     return rdd.applyValues(func)
 
@@ -0,0 +1,72 @@
+################################
+# FileName : distance.py
+################################
+
+import numpy as np
+
+def _sampling(sampling, ndim):
+    '''
+    Usage:
+     - broadcast the pixel spacing to every axis
+    '''
+    if sampling is None:
+        return np.ones(ndim)
+    sampling = np.atleast_1d(sampling).astype(np.float64)
+    if sampling.size == 1:
+        sampling = np.repeat(sampling, ndim)
+    if sampling.size != ndim:
+        raise ValueError("sampling must be a number or have one value per axis, got %s" % (sampling,))
+    return sampling
+
+def edt(binary, sampling=None, threads=None):
+    '''
+    Usage:
+     - exact Euclidean distance from every nonzero pixel to the nearest zero pixel, as
+       ndimage.distance_transform_edt but in float32
+     - the separable transform of Felzenszwalb & Huttenlocher, one in place pass of the C
+       lower envelope (lambdaimage.udf._edt) per axis over a single float32 array, so neither
+       the float64 result nor the index arrays of ndimage are allocated
+     - the lines of each pass are split across threads, the C pass runs without the GIL
+     - pixels with no zero pixel in the whole array get inf
+     - large stacks are split across the executors by segmentation.distance_transform_blocks
+    Args:
+     - binary: a 2d frame or 3d volume
+     - sampling: the pixel spacing, a number or one per axis
+     - threads: the threads of each pass, the number of cpus by default, which suits the driver
+                and serial code; inside Spark tasks pass 1, the executor cores already run a task each
+    '''
+    from lambdaimage.udf._edt import edt_axis
+    binary = np.asarray(binary)
+    sampling = _sampling(sampling, binary.ndim)
+    f = np.where(binary, np.float32(np.inf), np.float32(0))
+    if f.size == 0:
+        return f
+    if threads is None:
+        import multiprocessing
+        threads = multiprocessing.cpu_count()
+    flat = f.reshape(-1)
+    pool = None
+    if threads > 1:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(threads)
+    try:
+        for axis in range(f.ndim):
+            n = f.shape[axis]
+            inner = int(np.prod(f.shape[axis+1:]))
+            lines = f.size // n
+            bounds = np.linspace(0, lines, min(max(threads, 1), lines) + 1).astype(int)
+            chunks = zip(bounds[:-1], bounds[1:])
+            run = lambda (start, stop): edt_axis(flat, n, inner, sampling[axis], start, stop)
+            if pool is None or len(chunks) == 1:
+                for chunk in chunks:
+                    run(chunk)
+            else:
+                pool.map(run, chunks)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return np.sqrt(f, out=f)
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,33 @@
+################################
+# FileName : linkage.py
+################################
+
+import numpy as np
+
+def single_linkage(points, threshold):
+    '''
+    Usage:
+     - flat single-linkage clusters of points cut at threshold, as fclusterdata(points, threshold,
+       criterion='distance'), without its O(n^2) distance matrix
+     - points closer than threshold are linked from a KD-tree, the clusters are the connected
+       components of these links, so memory grows with the number of points and links
+     - return the cluster of every point, numbered from 1 in order of first point
+    '''
+    from scipy.spatial import cKDTree
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    points = np.asarray(points, dtype=np.float64)
+    n = len(points)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    # query_pairs returns a set of pairs before scipy 0.19
+    pairs = np.array(sorted(cKDTree(points).query_pairs(threshold)), dtype=np.intp).reshape(-1, 2)
+    graph = coo_matrix((np.ones(len(pairs), dtype=np.int8), (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+    _, components = connected_components(graph, directed=False)
+    _, first, inverse = np.unique(components, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(1, len(first) + 1)
+    return rank[inverse]
+
+if __name__ == "__main__":
+    pass
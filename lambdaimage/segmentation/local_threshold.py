@@ -0,0 +1,154 @@
+################################
+# FileName : local_threshold.py
+################################
+
+import itertools
+import numpy as np
+
+def _radius(radius, ndim):
+    '''
+    Usage:
+     - broadcast an int radius to every axis
+    '''
+    radius = np.atleast_1d(radius).astype(int)
+    if radius.size == 1:
+        radius = np.repeat(radius, ndim)
+    if radius.size != ndim:
+        raise ValueError("radius must be an int or have one value per axis, got %s" % (radius,))
+    return radius
+
+def _integral(frame):
+    '''
+    Usage:
+     - the integral image of frame, with a leading row of zeros on every axis
+     - integers are summed exactly in int64, anything else in float64
+    '''
+    ii = frame.astype(np.int64 if frame.dtype.kind in 'uib' else np.float64)
+    for axis in range(ii.ndim):
+        ii = ii.cumsum(axis=axis)
+    return np.pad(ii, [(1, 0)] * ii.ndim, mode='constant')
+
+def _bounds(shape, radius):
+    '''
+    Usage:
+     - the upper and lower bounds of the window of every position along every axis,
+       clipped to the image
+    '''
+    bounds = []
+    for n, r in zip(shape, radius):
+        i = np.arange(n)
+        bounds.append((np.minimum(i + r + 1, n), np.maximum(i - r, 0)))
+    return bounds
+
+def _box_sum(ii, bounds):
+    '''
+    Usage:
+     - the sum over the window of every position from an integral image, O(1) per pixel
+    '''
+    total = 0
+    for corner in itertools.product((0, 1), repeat=len(bounds)):
+        part = ii
+        for axis, c in enumerate(corner):
+            part = part.take(bounds[axis][c], axis=axis)
+        total = total - part if sum(corner) % 2 else total + part
+    return total
+
+def local_stats(frame, radius):
+    '''
+    Usage:
+     - the mean and standard deviation over a (2*radius+1) window around every pixel
+     - windows are clipped at the border, so border pixels use the part inside the image
+    Args:
+     - frame: a 2d frame or 3d volume of any shape
+     - radius: an int, or one int per axis
+    '''
+    radius = _radius(radius, frame.ndim)
+    bounds = _bounds(frame.shape, radius)
+    count = 1
+    for axis, (hi, lo) in enumerate(bounds):
+        count = count * (hi - lo).reshape([-1 if a == axis else 1 for a in range(frame.ndim)])
+    # center the values so that the sum of squares does not swamp the variance,
+    # integer frames keep an integer center so that flat windows get their exact mean
+    if frame.dtype.kind in 'uib':
+        center = int(round(frame.mean()))
+        values = frame.astype(np.int64) - center
+    else:
+        center = frame.mean()
+        values = frame.astype(np.float64) - center
+    mean = _box_sum(_integral(values), bounds) / count.astype(np.float64)
+    sq = values.astype(np.float64)
+    var = _box_sum(_integral(sq*sq), bounds) / count - mean*mean
+    return mean + center, np.sqrt(np.maximum(var, 0))
+
+def phansalkar(frame, radius, k=0.25, r=0.5, p=2, q=10):
+    '''
+    Usage:
+     - Phansalkar's threshold for low contrast images, on intensities rescaled to [0, 1]
+     - t = m * (1 + p*exp(-q*m) + k*(s/r - 1))
+    '''
+    m, s = local_stats(frame, radius)
+    lo, hi = float(frame.min()), float(frame.max())
+    scale = max(hi - lo, 1e-12)
+    # the statistics of the rescaled frame
+    m, s = (m - lo) / scale, s / scale
+    return (frame - lo) / scale > m * (1 + p*np.exp(-q*m) + k*(s/r - 1))
+
+def sauvola(frame, radius, k=0.2, r=None):
+    '''
+    Usage:
+     - Sauvola's threshold, t = m * (1 + k*(s/r - 1))
+    Args:
+     - r: the dynamic range of the standard deviation, half the intensity range by default
+    '''
+    if r is None:
+        r = 0.5 * (float(frame.max()) - float(frame.min()))
+    m, s = local_stats(frame, radius)
+    return frame > m * (1 + k*(s/max(r, 1e-12) - 1))
+
+def niblack(frame, radius, k=-0.2):
+    '''
+    Usage:
+     - Niblack's threshold, t = m + k*s
+    '''
+    m, s = local_stats(frame, radius)
+    return frame > m + k*s
+
+def bernsen(frame, radius, contrast_min=15):
+    '''
+    Usage:
+     - Bernsen's threshold, the mid-range of the local min and max
+     - where the local contrast is below contrast_min the window is taken as one class,
+       foreground if its mid-range is above the mid-range of the whole frame
+    '''
+    from scipy.ndimage import maximum_filter, minimum_filter
+    size = 2*_radius(radius, frame.ndim) + 1
+    frame = frame.astype(np.float64)
+    hi = maximum_filter(frame, size, mode='nearest')
+    lo = minimum_filter(frame, size, mode='nearest')
+    mid = (hi + lo) / 2
+    flat = (hi - lo) < contrast_min
+    return np.where(flat, mid >= (frame.max() + frame.min()) / 2, frame > mid)
+
+METHODS = {
+    'phansalkar': phansalkar,
+    'sauvola': sauvola,
+    'niblack': niblack,
+    'bernsen': bernsen,
+}
+
+def local_threshold(frame, method, radius, *args):
+    '''
+    Usage:
+     - threshold a 2d frame or 3d volume with local statistics
+     - return a boolean mask of the same shape as frame
+    Args:
+     - method: 'phansalkar', 'sauvola', 'niblack' or 'bernsen'
+     - radius: the window is 2*radius+1 on every axis, an int or one int per axis
+     - args: the parameters of the method, see the function of the same name
+    '''
+    if method not in METHODS:
+        raise ValueError("Bad local threshold method %s, choose from %s" % (method, sorted(METHODS)))
+    return METHODS[method](frame, radius, *args)
+
+if __name__ == "__main__":
+    pass
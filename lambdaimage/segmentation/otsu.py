@@ -0,0 +1,110 @@
+################################
+# FileName : otsu.py
+################################
+
+import numpy as np
+
+# the largest histogram searched exhaustively for more than 2 classes
+MAX_BINS = 1024
+
+def _bins(lo, hi, dtype, nbins):
+    '''
+    Usage:
+     - the bin width of a histogram of [lo, hi], integers get one bin per value when they fit in nbins
+    '''
+    if np.dtype(dtype).kind in 'uib' and hi - lo + 1 <= nbins:
+        return 1, int(hi - lo + 1)
+    return (float(hi) - float(lo)) / nbins or 1.0, nbins
+
+def _histogram(frame, lo, width, nbins):
+    '''
+    Usage:
+     - the integer histogram of frame in nbins bins of width from lo
+    '''
+    idx = np.floor((frame.ravel() - lo) / width).astype(np.int64).clip(0, nbins-1)
+    return np.bincount(idx, minlength=nbins)
+
+def _windows(hists, window):
+    '''
+    Usage:
+     - the sum of the histograms at most window positions away from each of hists
+    '''
+    csum = np.concatenate(([np.zeros(len(hists[0]), dtype=np.int64)], np.cumsum(hists, axis=0)))
+    n = len(hists)
+    return [csum[min(i+window+1, n)] - csum[max(i-window, 0)] for i in range(n)]
+
+def _gain(P, S, a, b):
+    '''
+    Usage:
+     - the gain m*m/w of the classes holding the bins [a, b), from the cumulative
+       counts P and the cumulative first moments S, 0 for empty classes
+    '''
+    w = P[b] - P[a]
+    m = S[b] - S[a]
+    return np.where(w > 0, m*m / np.where(w > 0, w, 1), 0)
+
+def _search(P, S, L, nclasses):
+    '''
+    Usage:
+     - the exhaustive dynamic program over all the splits of L bins, O(L*L) memory
+    '''
+    a = np.arange(L+1)[:, None]
+    b = np.arange(L+1)[None, :]
+    gain = np.where(b > a, _gain(P, S, a, b), -np.inf)
+    # best[b] is the largest gain of the bins [0, b) split into k+1 classes
+    best = gain[0]
+    args = []
+    for k in range(1, nclasses):
+        total = best[:, None] + gain
+        args.append(total.argmax(axis=0))
+        best = total.max(axis=0)
+    levels = []
+    b = L
+    for arg in reversed(args):
+        b = arg[b]
+        levels.append(b)
+    return sorted(levels)
+
+def multi_otsu(hist, nclasses=2):
+    '''
+    Usage:
+     - split the bins of hist into nclasses classes maximizing the between class variance
+     - return the nclasses-1 first bins of the upper classes
+     - 2 classes take one O(L) pass over the bins, more classes search a histogram of at most
+       MAX_BINS bins exhaustively, longer ones are merged down to it and each level is then
+       refined within its merged bin on the full histogram
+    '''
+    hist = np.asarray(hist, dtype=np.float64)
+    L = len(hist)
+    P = np.concatenate(([0], np.cumsum(hist)))
+    S = np.concatenate(([0], np.cumsum(hist*np.arange(L))))
+    if nclasses == 2:
+        t = np.arange(1, L)
+        if not len(t):
+            return [0]
+        return [int(t[(_gain(P, S, 0, t) + _gain(P, S, t, L)).argmax()])]
+    f = -(-L // MAX_BINS)
+    if f == 1:
+        return _search(P, S, L, nclasses)
+    # the boundaries of the merged bins, the moments stay in units of the original bins
+    idx = np.minimum(np.arange(-(-L // f) + 1) * f, L)
+    levels = [int(idx[l]) for l in _search(P[idx], S[idx], len(idx)-1, nclasses)]
+    bounds = [0] + levels + [L]
+    for i in range(1, nclasses):
+        t = np.arange(max(bounds[i-1]+1, bounds[i]-f), min(bounds[i+1]-1, bounds[i]+f) + 1)
+        if len(t):
+            bounds[i] = int(t[(_gain(P, S, bounds[i-1], t) + _gain(P, S, t, bounds[i+1])).argmax()])
+    return bounds[1:-1]
+
+def duel_levels(hist):
+    '''
+    Usage:
+     - the two levels of a two-pass Otsu: the Otsu level of hist, and below it the Otsu level
+       of the bins under the first, return them in increasing order
+    '''
+    t1 = multi_otsu(hist)[0]
+    t2 = multi_otsu(np.asarray(hist)[:t1])[0] if t1 > 1 else 0
+    return [t2, t1]
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,128 @@
+################################
+# FileName : pipeline.py
+################################
+
+from lambdaimage.utils.tool import exeTime, log
+from lambdaimage.segmentation.segmentation import PROPERTY_COLUMNS as COLUMNS
+import numpy as np
+
+class SegmentationPipeline(object):
+    '''
+    Usage:
+     - the per-plane segmentation chain, peak_filter -> smooth -> watershed -> properties,
+       run plane by plane inside one mapPartitions, so no intermediate stack is collected
+       or rebuilt on the driver and only the property rows of the objects come back
+    Args:
+     - peak_size: the smallest foreground objects kept, see segmentation.peak_filter
+     - smooth_size: the radius of the smoothing of the foreground, see preprocess.smooth
+     - min_radius: the seed distance of the watershed is 2*min_radius, see segmentation.watershed
+     - radius: the (min, max) radius of the objects kept, see segmentation.properties
+     - threshold: the distance within which run clusters the objects of the planes into cells,
+                  as segmentation.fusion, or None to return them unclustered, as properties
+    '''
+    def __init__(self, peak_size=140, smooth_size=2, min_radius=7, radius=(10, 30), threshold=10):
+        self.peak_size = peak_size
+        self.smooth_size = smooth_size
+        self.min_radius = min_radius
+        self.radius = radius
+        self.threshold = threshold
+
+    @classmethod
+    def from_steps(cls, steps):
+        '''
+        Usage:
+         - the pipeline of a chain of named steps, e.g. the segmentation functions of lambdaimage.xml:
+           [('seg.peak_filter', ['140']), ('prep.smooth', ['2']), ('seg.watershed', ['7']), ('seg.fusion', ['10', '30'])]
+         - the chain must be peak_filter, smooth, watershed, then properties or fusion with the
+           (min, max) radius of the objects, fusion taking the clustering distance as an optional
+           third parameter
+        '''
+        names = [name.split('.')[-1] for name, _ in steps]
+        if names[:3] != ['peak_filter', 'smooth', 'watershed'] or len(names) != 4 or names[3] not in ('properties', 'fusion'):
+            raise ValueError("expected the steps peak_filter, smooth, watershed, then properties or fusion, got %s" % names)
+        params = [para for _, para in steps]
+        if names[3] == 'properties':
+            threshold = None
+        else:
+            threshold = float(params[3][2]) if len(params[3]) > 2 else 10
+        return cls(peak_size=int(params[0][0]), smooth_size=int(params[1][0]), min_radius=int(params[2][0]),
+                   radius=(int(params[3][0]), int(params[3][1])), threshold=threshold)
+
+    def label(self, frame):
+        '''
+        Usage:
+         - the watershed labels of one plane
+        '''
+        from lambdaimage.preprocess.preprocess import smooth_frame
+        from lambdaimage.segmentation.segmentation import peak_frame, watershed_frame
+        binary = peak_frame(frame, self.peak_size)
+        smoothed = smooth_frame(binary.astype(np.uint8), self.smooth_size)
+        return watershed_frame(frame, smoothed, self.min_radius)
+
+    def plane(self, frame, z, labeled=None):
+        '''
+        Usage:
+         - segment one plane, return the (objects, 6) rows of its properties, see COLUMNS
+        Args:
+         - labeled: the labels of the plane, if they are already known
+        '''
+        from lambdaimage.segmentation.region_stats import region_stats
+        from lambdaimage.segmentation.segmentation import _property_rows
+        labeled = self.label(frame) if labeled is None else labeled
+        stats = region_stats(labeled, frame)
+        return _property_rows(stats, z, stats['label'], self.radius[0], self.radius[1])
+
+    @exeTime
+    def properties(self, rdd, labels=None):
+        '''
+        Usage:
+         - the properties of the objects of every plane of rdd, as segmentation.properties
+        Args:
+         - labels: if given, a directory, on a filesystem shared by the executors, where every
+                   partition saves the labels of its planes run-length encoded in one archive,
+                   only the rows come back to the driver, see sparse_labels.load_labels
+        '''
+        import os
+        from lambdaimage.segmentation.segmentation import _property_table
+        from lambdaimage.segmentation.sparse_labels import save_labels
+        keep = labels is not None
+        if keep and not os.path.isdir(labels):
+            os.makedirs(labels)
+        def run(index, part):
+            rows, planes = [np.zeros((0, len(COLUMNS)))], []
+            for z, frame in part:
+                labeled = self.label(frame)
+                rows.append(self.plane(frame, z, labeled))
+                if keep:
+                    planes.append((z, labeled))
+            if planes:
+                save_labels([v for _, v in planes], os.path.join(labels, 'part-%05d.npz' % index),
+                            keys=[z for z, _ in planes])
+            yield np.concatenate(rows)
+        parts = rdd.rdd.mapPartitionsWithIndex(run).collect()
+        rows = np.concatenate([np.zeros((0, len(COLUMNS)))] + parts)
+        prop = _property_table(rows)
+        log('info')("%d objects" % len(prop))
+        return prop
+
+    def run(self, rdd, threshold=None, labels=None):
+        '''
+        Usage:
+         - the cell table of rdd, as segmentation.fusion: the objects of the planes are clustered
+           within threshold and averaged weighted by their intensity
+         - with no threshold here nor in the pipeline, the objects of properties
+        Args:
+         - threshold: the clustering distance, that of the pipeline by default
+         - labels: if given, the directory where the labels of the planes are saved, see properties
+        '''
+        from lambdaimage.segmentation.segmentation import clustering, weighted_average
+        threshold = self.threshold if threshold is None else threshold
+        prop = self.properties(rdd, labels)
+        if threshold is None:
+            return prop
+        cell_table = weighted_average(clustering(prop, threshold), 'intensitysum')
+        del cell_table['tag']
+        return cell_table
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,121 @@
+################################
+# FileName : region_stats.py
+################################
+
+from collections import OrderedDict
+import numpy as np
+
+def _group_reduce(ufunc, values, order, starts):
+    '''
+    Usage:
+     - reduce values label by label, given the order that sorts the pixels by label
+       and where each label starts in it
+    '''
+    return ufunc.reduceat(values[order], starts)
+
+def region_stats(labels, image=None):
+    '''
+    Usage:
+     - the statistics of every label of a labeled frame or volume in one vectorized pass,
+       accumulated with bincount over the labeled pixels instead of one region at a time
+     - return an OrderedDict of columns, one row per label > 0 in increasing order:
+       label, area, centroid-i, bbox-i (start of axis i, then stop of axis i at bbox-(ndim+i)),
+       moments_central-i-j (sum over the region of the product of the offsets from the centroid
+       along axes i <= j), and with an image weighted_centroid-i, intensity_sum, intensity_mean
+       and intensity_max
+    Args:
+     - labels: an integer array of any dimension, 0 is background
+     - image: an intensity array of the same shape, optional
+    '''
+    labels = np.asarray(labels)
+    ndim = labels.ndim
+    if image is not None:
+        image = np.asarray(image)
+        if image.shape != labels.shape:
+            raise ValueError("image shape %s does not match labels shape %s" % (image.shape, labels.shape))
+    coords = np.nonzero(labels)
+    ids, inv = np.unique(labels[coords], return_inverse=True)
+    n = len(ids)
+    count = lambda weights=None: np.bincount(inv, weights, minlength=n)
+
+    columns = OrderedDict()
+    columns['label'] = ids
+    area = count()
+    columns['area'] = area
+    centroid = [count(c) / np.maximum(area, 1) for c in coords]
+    for i in range(ndim):
+        columns['centroid-%d' % i] = centroid[i]
+
+    order = np.argsort(inv, kind='mergesort')
+    starts = np.concatenate(([0], np.cumsum(area)[:-1])).astype(np.intp)
+    for i in range(ndim):
+        columns['bbox-%d' % i] = _group_reduce(np.minimum, coords[i], order, starts) if n else np.zeros(0, np.intp)
+    for i in range(ndim):
+        columns['bbox-%d' % (ndim+i)] = _group_reduce(np.maximum, coords[i], order, starts) + 1 if n else np.zeros(0, np.intp)
+
+    offsets = [c - m[inv] for c, m in zip(coords, centroid)]
+    for i in range(ndim):
+        for j in range(i, ndim):
+            columns['moments_central-%d-%d' % (i, j)] = count(offsets[i] * offsets[j])
+
+    if image is not None:
+        values = image[coords].astype(np.float64)
+        total = count(values)
+        for i in range(ndim):
+            columns['weighted_centroid-%d' % i] = count(values * coords[i]) / np.where(total != 0, total, 1)
+        columns['intensity_sum'] = total
+        columns['intensity_mean'] = total / np.maximum(area, 1)
+        columns['intensity_max'] = _group_reduce(np.maximum, image[coords], order, starts) if n else np.zeros(0, image.dtype)
+    return columns
+
+def region_stats_frame(labels, image=None):
+    '''
+    Usage:
+     - region_stats as a pandas DataFrame indexed by label
+    '''
+    import pandas as pd
+    columns = region_stats(labels, image)
+    index = pd.Index(columns.pop('label'), name='label')
+    return pd.DataFrame(columns, index=index)
+
+def _keep(sizes, min_size, max_size, ids=None):
+    '''
+    Usage:
+     - whether each label, of the given ids or else of the index of sizes, has a size within
+       [min_size, max_size], the background 0 is never kept
+    '''
+    keep = sizes >= min_size
+    if max_size is not None:
+        keep &= sizes <= max_size
+    keep &= (np.arange(len(sizes)) if ids is None else ids) != 0
+    return keep
+
+def size_filter(labels, min_size=0, max_size=None, connectivity=1):
+    '''
+    Usage:
+     - drop the objects smaller than min_size or larger than max_size pixels, with the sizes of all
+       objects from one bincount and a single lookup to mask them, as remove_small_objects
+     - a boolean array is labeled first and the kept pixels are returned as a boolean array,
+       any other array is taken as labels and returned with the dropped labels set to 0
+    Args:
+     - connectivity: the connectivity of the labeling of a boolean array, see ndimage.generate_binary_structure
+    '''
+    from scipy import ndimage as ndi
+    labels = np.asarray(labels)
+    binary = labels.dtype == bool
+    if binary:
+        labels = ndi.label(labels, ndi.generate_binary_structure(labels.ndim, connectivity))[0]
+    if labels.size and labels.max() > labels.size:
+        # sparse large ids, count the labels present only
+        ids, inv = np.unique(labels, return_inverse=True)
+        keep = _keep(np.bincount(inv), min_size, max_size, ids)
+        kept = keep[inv].reshape(labels.shape)
+    else:
+        keep = _keep(np.bincount(labels.ravel(), minlength=1), min_size, max_size)
+        kept = keep[labels]
+    if binary:
+        return kept
+    return np.where(kept, labels, 0).astype(labels.dtype)
+
+if __name__ == "__main__":
+    pass
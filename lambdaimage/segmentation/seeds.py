@@ -0,0 +1,56 @@
+################################
+# FileName : seeds.py
+################################
+
+import numpy as np
+
+def _merge_plateaus(coords):
+    '''
+    Usage:
+     - keep one seed of every group of touching seeds, the maxima of a plateau
+    '''
+    from lambdaimage.segmentation.linkage import single_linkage
+    if len(coords) < 2:
+        return coords
+    clusters = single_linkage(coords, np.sqrt(coords.shape[1]) + 1e-6)
+    _, first = np.unique(clusters, return_index=True)
+    return coords[np.sort(first)]
+
+def local_maxima(distance, min_distance, mask=None, threshold=0, exclude_border=False):
+    '''
+    Usage:
+     - the seeds of a watershed: the maxima of distance (e.g. a distance transform) within
+       the foreground mask, highest in a (2*min_distance+1) window around them
+     - the window maximum is a max filter per axis in float32, pixels out of the mask never win,
+       and touching maxima of a plateau give a single seed
+     - return the (seeds, ndim) coordinates, no dense mask of the seeds is built
+    Args:
+     - mask: the foreground, distance > 0 by default
+     - threshold: seeds must be higher than threshold
+     - exclude_border: drop the seeds closer than min_distance to the border
+    '''
+    from scipy.ndimage import maximum_filter1d
+    distance = np.asarray(distance, dtype=np.float32)
+    mask = distance > 0 if mask is None else np.asarray(mask, dtype=bool)
+    values = np.where(mask, distance, -np.inf).astype(np.float32)
+    peak = values
+    for axis in range(values.ndim):
+        peak = maximum_filter1d(peak, 2*min_distance + 1, axis=axis, mode='nearest')
+    coords = np.transpose(np.nonzero((values == peak) & mask & (values > threshold)))
+    if exclude_border and len(coords):
+        inside = ((coords >= min_distance) & (coords < np.array(values.shape) - min_distance)).all(axis=1)
+        coords = coords[inside]
+    return _merge_plateaus(coords)
+
+def seeds_to_markers(seeds, shape, dtype=np.int32):
+    '''
+    Usage:
+     - the markers of a watershed, the seeds numbered from 1 in an array of shape
+    '''
+    markers = np.zeros(shape, dtype=dtype)
+    if len(seeds):
+        markers[tuple(np.asarray(seeds).T)] = np.arange(1, len(seeds) + 1)
+    return markers
+
+if __name__ == "__main__":
+    pass
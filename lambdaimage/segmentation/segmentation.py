@@ -5,110 +5,405 @@
 ################################
 
 from lambdaimage.utils.tool import exeTime, bar, log
+from collections import OrderedDict
 import numpy as np
 
 def threshold(rdd, method='adaptive', *args):
-    from skimage.filters import threshold_otsu, threshold_adaptive
+    '''
+    Usage:
+     - binarize every frame of rdd
+    Args:
+     - method: 'adaptive', 'otsu' (see otsu_threshold), 'duel' (see otsu.duel_levels),
+               or one of the local thresholds
+               'phansalkar', 'sauvola', 'niblack' and 'bernsen' (see local_threshold)
+     - args: the block size of 'adaptive', or the window radius of a local threshold
+             followed by its parameters
+    '''
+    from skimage.filters import threshold_adaptive
     import scipy.ndimage as ndi
-    from lambdaimage.udf._phansalkar import phansalkar as _phansalkar
+    from lambdaimage.segmentation.local_threshold import local_threshold, METHODS
+    from lambdaimage.segmentation.otsu import duel_levels
     def adaptive(frame):
         binary = threshold_adaptive(frame, block_size=block_size)
         #binary = ndi.binary_fill_holes(binary)
         return binary
-    def otsu(frame):
-        threshold = threshold_otsu(frame)
-        binary = frame > threshold
-        return binary
-    def duel(frame):
-        threshold = threshold_otsu(frame)
-        binary1 = frame > threshold
-        frame = frame - binary1 * frame
-        threshold = threshold_otsu(frame)
-        binary2 = frame > threshold
-        binary = binary2
-        return binary
-    def phansalkar(frame):
-        binary = _phansalkar(frame, block_size)
-        return binary 
+    def local(frame):
+        return local_threshold(frame, method, radius, *params)
     if method=='adaptive':
         block_size = args[0]
         return rdd.applyValues(adaptive)
     elif method == 'otsu':
-        return rdd.applyValues(otsu)
+        return otsu_threshold(rdd)
     elif method == 'duel':
-        return rdd.applyValues(duel)
-    elif method == 'phansalkar':
-        block_size = args[0]
-        return rdd.applyValues(phansalkar)
+        # the pixels between the two levels of a two-pass Otsu of the stack
+        lo, width, hist = _stack_histogram(rdd, 256)
+        t2, t1 = [lo + t*width for t in duel_levels(hist)]
+        return rdd.applyValues(lambda frame: (frame >= t2) & (frame < t1))
+    elif method in METHODS:
+        radius, params = args[0], args[1:]
+        return rdd.applyValues(local)
     else:
         raise "Bad Threshold Method", method
 
-def peak_filter(rdd, smooth_size):
-    from skimage.morphology import disk, binary_opening, remove_small_objects
+def _stack_histogram(rdd, nbins, window=None):
+    '''
+    Usage:
+     - the histogram of the whole stack from one distributed pass, or a dict of the histograms
+       of the planes at most window positions away per key, with the lo and width of its bins
+    '''
+    from lambdaimage.segmentation.otsu import _bins, _histogram, _windows
+    values = rdd.rdd.values()
+    lo, hi = values.map(lambda v: (v.min(), v.max())).reduce(lambda a, b: (min(a[0], b[0]), max(a[1], b[1])))
+    # python scalars, so that thresholds do not wrap around in small integer types
+    lo, hi = lo.item(), hi.item()
+    width, nbins = _bins(lo, hi, rdd.dtype, nbins)
+    if window is None:
+        return lo, width, values.map(lambda v: _histogram(v, lo, width, nbins)).treeReduce(np.add, depth=3)
+    hists = sorted(rdd.rdd.mapValues(lambda v: _histogram(v, lo, width, nbins)).collect())
+    return lo, width, dict(zip([k for k, _ in hists], _windows([h for _, h in hists], window)))
+
+@exeTime
+def otsu_levels(rdd, nclasses=2, nbins=256, window=None):
+    '''
+    Usage:
+     - Otsu / multi-level Otsu thresholds of the whole stack from one distributed histogram
+     - return the nclasses-1 thresholds, class k holds the values in [t[k-1], t[k]),
+       or a dict of them per key when window is given
+    Args:
+     - nclasses: the number of classes, 2 for a single threshold
+     - nbins: the number of bins, integer stacks use one bin per value when they fit
+     - window: if given, the thresholds of each plane come from the histogram of
+               the planes at most window positions away, in key order
+    '''
+    from lambdaimage.segmentation.otsu import multi_otsu
+    lo, width, hist = _stack_histogram(rdd, nbins, window)
+    edges = lambda hist: [lo + t*width for t in multi_otsu(hist, nclasses)]
+    if window is None:
+        return edges(hist)
+    return dict((k, edges(h)) for k, h in hist.items())
+
+def otsu_threshold(rdd, nclasses=2, nbins=256, window=None):
+    '''
+    Usage:
+     - binarize the stack with thresholds shared by all planes (or a window of planes), see otsu_levels
+     - return a boolean Images for 2 classes, else uint8 class labels
+    '''
+    levels = otsu_levels(rdd, nclasses, nbins, window)
+    levels = rdd.rdd.context.broadcast(levels)
+    def classify(kv):
+        k, v = kv
+        t = levels.value if window is None else levels.value[k]
+        if nclasses == 2:
+            return k, v >= t[0]
+        return k, np.digitize(v, t).astype(np.uint8)
+    from lambdaimage.rdds.images import Images
+    return Images(rdd.rdd.map(classify, preservesPartitioning=True)).__finalize__(rdd, noPropagate=('_dtype',))
+
+def peak_frame(frame, smooth_size):
+    '''
+    Usage:
+     - the foreground of one frame without its objects smaller than smooth_size, see peak_filter
+    '''
+    from skimage.morphology import disk, binary_opening
     import scipy.ndimage as ndi
-    def func(frame):
-        frame = frame.astype(bool)
-        binary = remove_small_objects(frame, smooth_size)
-        #binary = ndi.binary_fill_holes(binary)
-        #opened = binary_opening(frame, disk(smooth_size))
-        #opened = opened & frame
-        return binary
-    return rdd.applyValues(func)
+    from lambdaimage.segmentation.region_stats import size_filter
+    frame = frame.astype(bool)
+    binary = size_filter(frame, smooth_size)
+    #binary = ndi.binary_fill_holes(binary)
+    #opened = binary_opening(frame, disk(smooth_size))
+    #opened = opened & frame
+    return binary
 
-def watershed(rdd, min_radius):
+def peak_filter(rdd, smooth_size):
+    return rdd.applyValues(lambda frame: peak_frame(frame, smooth_size))
+
+@exeTime
+def size_filter_blocks(rdd, min_size=0, max_size=None, connectivity=1, size='64M'):
+    '''
+    Usage:
+     - drop the objects of the whole stack smaller than min_size or larger than max_size pixels,
+       objects that span several planes or blocks are measured as a whole
+     - boolean Images are labeled with Images.label on blocks and the kept pixels are returned
+       as boolean Images, other Images are taken as labels consistent over the stack and the
+       dropped labels are set to 0
+     - sizes are a distributed bincount of the labels, the stack is never gathered
+    Args:
+     - connectivity, size: the connectivity and the block size of the labeling, see Images.label
+    '''
+    from lambdaimage.segmentation.region_stats import _keep
+    binary = np.dtype(rdd.dtype) == bool
+    labels = rdd.label(connectivity, size) if binary else rdd
+    values = labels.rdd.values()
+    n = int(values.map(lambda v: v.max() if v.size else 0).reduce(max))
+    def count(part):
+        total = np.zeros(n + 1, dtype=np.int64)
+        for v in part:
+            total += np.bincount(v.ravel(), minlength=n + 1)
+        yield total
+    sizes = values.mapPartitions(count).treeReduce(np.add, depth=3)
+    keep = labels.rdd.context.broadcast(_keep(sizes, min_size, max_size))
+    if binary:
+        return labels.applyValues(lambda v: keep.value[v]).astype(bool)
+    return labels.applyValues(lambda v: np.where(keep.value[v], v, 0).astype(v.dtype))
+
+def watershed_frame(frame, binary, min_radius):
+    '''
+    Usage:
+     - the watershed of the distance transform of the foreground binary of one frame, see watershed
+    '''
     from skimage.morphology import watershed, remove_small_objects
-    from scipy import ndimage
-    from skimage.feature import peak_local_max
-    def func(dframe):
-        frame, binary = dframe[0], dframe[1]
-        #binary = remove_small_objects(binary, min_radius, connectivity=2)
-        distance = ndimage.distance_transform_edt(binary)
-        local_maxi = peak_local_max(distance, min_distance=2*min_radius, indices=False, labels=frame)
-        markers = ndimage.label(local_maxi)[0]
-        labeled = watershed(-distance, markers, mask=binary)
-        return labeled
-    return rdd.applyValues(func)
+    from lambdaimage.segmentation.distance import edt
+    from lambdaimage.segmentation.seeds import local_maxima, seeds_to_markers
+    #binary = remove_small_objects(binary, min_radius, connectivity=2)
+    # runs in the Spark tasks of watershed and SegmentationPipeline
+    distance = edt(binary, threads=1)
+    seeds = local_maxima(distance, 2*min_radius, mask=binary, exclude_border=True)
+    markers = seeds_to_markers(seeds, distance.shape)
+    labeled = watershed(-distance, markers, mask=binary)
+    return labeled
+
+def watershed(rdd, min_radius):
+    return rdd.applyValues(lambda dframe: watershed_frame(dframe[0], dframe[1], min_radius))
+
+def distance_transform(rdd, sampling=None):
+    '''
+    Usage:
+     - exact Euclidean distance transform of every binary record, float32, see distance.edt
+    '''
+    from lambdaimage.segmentation.distance import edt
+    return rdd.applyValues(lambda v: edt(v, sampling, threads=1)).astype(np.float32)
 
 @exeTime
-def properties(labeled_stack, image_stack, min_radius, max_radius):
+def distance_transform_blocks(rdd, max_distance, sampling=None, size='64M'):
+    '''
+    Usage:
+     - Euclidean distance transform of a binary stack on padded blocks in parallel, capped at max_distance
+     - the padding of the blocks covers max_distance, so every distance up to max_distance
+       is exact and larger ones are max_distance, the stack is never gathered
+     - return float32 Images
+    Args:
+     - rdd: binary Images, either the planes of one stack or 3d volumes transformed one by one
+     - max_distance: the largest distance needed, e.g. the radius of the objects for seeds
+     - sampling: the pixel spacing, a number or one per axis of the stack / volumes
+     - size: the block size, see Images.toBlocks
+    '''
+    from lambdaimage.segmentation.distance import edt, _sampling
+    planes = len(rdd.dims) == 2
+    spacing = _sampling(sampling, 3 if planes else len(rdd.dims))
+    padding = [int(np.ceil(max_distance / float(d))) for d in spacing]
+    def func(block):
+        if planes:
+            return np.minimum(edt(block, spacing, threads=1), max_distance)
+        return np.array([np.minimum(edt(volume, spacing, threads=1), max_distance) for volume in block],
+                        dtype=np.float32)
+    # blocks of planes hold every plane, so only the axes of the planes are padded
+    blocks = rdd.toBlocks(size, units='pixels', padding=tuple(padding[1:] if planes else padding))
+    return blocks._constructor(blocks.rdd.mapValues(func), dims=blocks.dims,
+                               nimages=blocks.nimages, dtype='float32').toImages()
+
+@exeTime
+def seeds_blocks(rdd, min_distance, threshold=0, size='64M'):
+    '''
+    Usage:
+     - the watershed seeds of a distance stack on padded blocks in parallel, see seeds.local_maxima
+     - blocks are padded by min_distance, so the window of every pixel of a core is in its block,
+       only the seeds of the cores are kept and just their coordinates are collected
+     - return the (seeds, 3) coordinates (z, y, x) of the planes of a stack, or the
+       (seeds, 4) coordinates (record, z, y, x) of 3d volumes
+    Args:
+     - rdd: Images of distances, e.g. from distance_transform_blocks, the foreground is > 0
+     - min_distance, threshold: see seeds.local_maxima
+     - size: the block size, see Images.toBlocks
+    '''
+    from lambdaimage.segmentation.seeds import local_maxima, _merge_plateaus
+    planes = len(rdd.dims) == 2
+    ndim = 3 if planes else 4
+    def func(kv):
+        key, block = kv
+        if planes:
+            found = [local_maxima(block, min_distance, threshold=threshold)]
+        else:
+            found = [np.column_stack((np.full(len(c), t, dtype=c.dtype), c)) if len(c) else c.reshape(0, ndim)
+                     for t, c in ((t, local_maxima(v, min_distance, threshold=threshold)) for t, v in enumerate(block))]
+        coords = np.concatenate(found).reshape(-1, ndim)
+        # to the coordinates of the stack, and in the core of the block
+        start = np.array([s.start for s in key.padImgSlices])
+        lo = np.array([s.start for s in key.imgSlices])
+        hi = np.array([s.stop for s in key.imgSlices])
+        coords = coords + start
+        return coords[((coords >= lo) & (coords < hi)).all(axis=1)]
+    padding = (min_distance,) * len(rdd.dims)
+    seeds = rdd.toBlocks(size, units='pixels', padding=padding).rdd.map(func).collect()
+    seeds = np.concatenate(seeds) if seeds else np.zeros((0, ndim), dtype=np.intp)
+    # plateaus split by a block boundary
+    seeds = seeds[np.lexsort(seeds.T[::-1])]
+    if planes:
+        return _merge_plateaus(seeds)
+    return np.concatenate([_merge_plateaus(seeds[seeds[:, 0] == t]) for t in np.unique(seeds[:, 0])] or [seeds])
+
+def _watershed_volume(binary, min_distance):
+    '''
+    Usage:
+     - watershed of the distance transform of a binary volume, seeded at its maxima
+    '''
+    from skimage.morphology import watershed
+    from lambdaimage.segmentation.distance import edt
+    from lambdaimage.segmentation.seeds import local_maxima, seeds_to_markers
+    binary = binary.astype(bool)
+    if not binary.any():
+        return np.zeros(binary.shape, dtype=np.int32)
+    distance = edt(binary, threads=1)
+    markers = seeds_to_markers(local_maxima(distance, min_distance, mask=binary), binary.shape)
+    return watershed(-distance, markers, mask=binary)
+
+@exeTime
+def watershed_3d_blocks(rdd, min_distance=10, size='64M', padding=None):
+    '''
+    Usage:
+     - 3d watershed of a binary stack on padded blocks in parallel, the stack is never gathered
+     - labels are stitched across blocks by a union-find over the labels on block faces
+     - return the labeled Images, consistent over the whole stack
+    Args:
+     - rdd: binary Images, either the planes of one stack or 3d volumes labeled one by one
+     - min_distance: the min distance between seeds, the maxima of the distance transform
+     - size: the block size, see Images.toBlocks
+     - padding: the halo of the blocks, 2*min_distance by default. It should cover the seed
+                spacing and the radius of the objects, so that seeds and distances in the core
+                of a block are the same as in the whole stack
+    '''
+    from lambdaimage.rdds.imgblocks.labeling import labelBlocks
+    if padding is None:
+        padding = 2*min_distance
+    if np.min(padding) < 1:
+        raise ValueError("padding must be at least 1 to stitch labels across blocks, got %s" % (padding,))
+    planes = len(rdd.dims) == 2
+    def func(block):
+        if planes:
+            return _watershed_volume(block, min_distance)
+        labels = np.array([_watershed_volume(volume, min_distance) for volume in block], dtype=np.int64)
+        # the volumes are labeled apart, so that their objects stay distinct in the block
+        stride = block[0].size + 1
+        for t, local in enumerate(labels):
+            local[local > 0] += t * stride
+        return labels
+    blocks = rdd.toBlocks(size, units='pixels', padding=padding)
+    return labelBlocks(blocks, func, merge='overlap')
+
+@exeTime
+def region_properties(rdd, images=None):
+    '''
+    Usage:
+     - the statistics of the labels of every record, computed on the executors, see region_stats
+     - return an rdd of (key, columns), columns being an OrderedDict of arrays with one row per label
+    Args:
+     - rdd: labeled Images
+     - images: Images of intensities with the same keys, for the intensity statistics
+    '''
+    from lambdaimage.segmentation.region_stats import region_stats
+    if images is None:
+        return rdd.rdd.mapValues(region_stats)
+    return rdd.rdd.join(images.rdd).mapValues(lambda v: region_stats(*v))
+
+PROPERTY_COLUMNS = ('x', 'y', 'z', 'intensitysum', 'size', 'tag')
+
+def _property_rows(stats, z, tag, min_radius, max_radius, axes=(0, 1)):
+    '''
+    Usage:
+     - the rows of PROPERTY_COLUMNS of the objects of stats whose radius, that of the disk
+       of their area, is within (min_radius, max_radius)
+    Args:
+     - stats: the region_stats of labels with an image
+     - z, tag: the plane of every object (or of all) and its label in the plane
+     - axes: the axes of the weighted centroid giving x and y
+    '''
+    radius = (stats['area'] / np.pi)**0.5
+    keep = (min_radius < radius) & (radius < max_radius)
+    return np.column_stack((stats['weighted_centroid-%d' % axes[0]], stats['weighted_centroid-%d' % axes[1]],
+                            np.zeros(len(radius)) + z, stats['intensity_sum'], radius, tag))[keep]
+
+def _property_table(rows):
+    '''
+    Usage:
+     - the DataFrame of property rows sorted by plane and tag, indexed by tag, with
+       the intensity sums normalized over all the objects
+    '''
     import pandas as pd
-    from skimage.measure import regionprops
-    prop = []
-    columns = ('x', 'y', 'z', 'intensitysum', 'size', 'tag')
-    indices = []
-    end = len(labeled_stack)
-    for z, frame in enumerate(labeled_stack):
-        msg = " get the properties of the %d-th" % (z+1)
-        bar("info")(msg,z+1,end)
-        f_prop = regionprops(frame.astype(np.int),
-                intensity_image = image_stack[z])
-        for d in f_prop:
-            radius = (d.area / np.pi)**0.5
-            if(min_radius < radius < max_radius):
-                prop.append([d.weighted_centroid[0],
-                                   d.weighted_centroid[1],
-                                   z,d.mean_intensity*d.area,
-                                   radius,
-                                   d.label])
-                indices.append(d.label)
-    if not len(indices):
-            all_props = pd.DataFrame([], index=[])
-    indices = pd.Index(indices, name='label')
-    prop = pd.DataFrame(prop, index=indices, columns=columns)
+    rows = rows[np.lexsort((rows[:, 5], rows[:, 2]))]
+    tag = rows[:, 5].astype(np.int64)
+    prop = pd.DataFrame(OrderedDict(zip(PROPERTY_COLUMNS, rows.T)), index=pd.Index(tag, name='label'),
+                        columns=PROPERTY_COLUMNS)
+    prop['z'] = prop['z'].astype(np.int64)
+    prop['tag'] = tag
     prop['intensitysum'] /= prop['intensitysum'].sum()
     return prop
 
+@exeTime
+def properties(labeled_stack, image_stack, min_radius, max_radius):
+    '''
+    Usage:
+     - the objects of every plane of a stack labeled plane by plane, with their
+       weighted centroid, intensity sum and radius, in one pass over the whole stack
+     - objects whose radius is not within (min_radius, max_radius) are dropped
+     - labeled_stack may be labeled Images, e.g. from watershed, collected run-length
+       encoded, see collect_labels
+    '''
+    from lambdaimage.segmentation.region_stats import region_stats
+    if hasattr(labeled_stack, 'rdd'):
+        labeled_stack = collect_labels(labeled_stack)
+    labeled_stack = np.asarray(labeled_stack).astype(np.int64)
+    # labels of different planes are different regions
+    stride = max(labeled_stack.max(), 0) + 1
+    z = np.arange(len(labeled_stack)).reshape((-1,) + (1,) * (labeled_stack.ndim - 1))
+    stats = region_stats(np.where(labeled_stack > 0, labeled_stack + z * stride, 0), image_stack)
+    rows = _property_rows(stats, stats['label'] // stride, stats['label'] % stride, min_radius, max_radius, axes=(1, 2))
+    return _property_table(rows)
+
+
+def compress_labels(rdd):
+    '''
+    Usage:
+     - run-length encode every record of labeled Images on the executors, see SparseLabels
+     - return an rdd of (key, SparseLabels), cheap to shuffle, cache or collect
+    '''
+    from lambdaimage.segmentation.sparse_labels import SparseLabels
+    return rdd.rdd.mapValues(SparseLabels.fromarray)
+
+def decompress_labels(sparse, dtype=None):
+    '''
+    Usage:
+     - the dense labeled Images of an rdd of (key, SparseLabels)
+    '''
+    from lambdaimage.rdds.images import Images
+    return Images(sparse.mapValues(lambda v: v.toarray(dtype)))
+
+def collect_labels(rdd):
+    '''
+    Usage:
+     - collectValuesAsArray for labeled Images, records come back run-length encoded and
+       the stack is in the smallest type that holds its labels
+    '''
+    from lambdaimage.segmentation.sparse_labels import dense_stack
+    return dense_stack([v for _, v in sorted(compress_labels(rdd).collect(), key=lambda kv: kv[0])])
+
+def save_labels(rdd, path):
+    '''
+    Usage:
+     - save labeled Images run-length encoded in one .npz archive, see sparse_labels.load_labels
+    '''
+    from lambdaimage.segmentation import sparse_labels
+    sparse_labels.save_labels([v for _, v in sorted(compress_labels(rdd).collect(), key=lambda kv: kv[0])], path)
 
 @exeTime
 def clustering(prop, threshold):
-    import scipy.cluster.hierarchy as hier
+    '''
+    Usage:
+     - merge the objects of prop whose centroids are linked by steps shorter than threshold
+       (single linkage), the label of prop becomes the cluster
+    '''
+    from lambdaimage.segmentation.linkage import single_linkage
     log("info")("clustering start...")
-    positions = prop[['x', 'y', 'z']].copy()
-    print positions.values.shape
-    log("info")("akka")
-    cluster_idx = hier.fclusterdata(positions.values, threshold, criterion='distance')
-    log("info")("ooover")
-    prop['new_label'] = cluster_idx
+    positions = prop[['x', 'y', 'z']].values
+    prop['new_label'] = single_linkage(positions, threshold)
     prop.set_index('new_label', drop=True, append=False, inplace=True)
     prop.index.name = 'label' 
     prop = prop.sort_index()
@@ -125,25 +420,54 @@ def df_average(df, weights_column):
         values[col] = v
     return values
 
+def weighted_average(prop, weights_column):
+    '''
+    Usage:
+     - the rows of prop averaged label by label, weighted by weights_column, as df_average
+       over groupby(level='label') but with one sorted segment reduction per column
+     - weights_column itself is summed, columns that are not numbers keep their first value
+    '''
+    import pandas as pd
+    if not len(prop):
+        return prop.iloc[:0]
+    labels = prop.index.values
+    order = np.argsort(labels, kind='mergesort')
+    labels = labels[order]
+    starts = np.flatnonzero(np.concatenate(([True], labels[1:] != labels[:-1])))
+    weights = prop[weights_column].values[order].astype(np.float64)
+    norm = np.add.reduceat(weights, starts)
+    columns = OrderedDict()
+    for col in prop.columns:
+        values = prop[col].values[order]
+        if col == weights_column:
+            columns[col] = norm
+        elif values.dtype.kind in 'biuf':
+            with np.errstate(divide='ignore', invalid='ignore'):
+                columns[col] = np.add.reduceat(values * weights, starts) / norm
+        else:
+            columns[col] = values[starts]
+    index = pd.Index(labels[starts], name=prop.index.name)
+    return pd.DataFrame(columns, index=index, columns=prop.columns)
+
 @exeTime
 def fusion(labeled_stack, image_stack, min_radius, max_radius):  
+    from lambdaimage.serial.IO import save_table
     prop = properties(labeled_stack, image_stack, min_radius, max_radius)
-    prop.to_pickle('prop.pkl')
+    save_table(prop, 'prop.npz')
     prop = clustering(prop, 10)
     log('info')("clustering over")
-    cell_table = prop.groupby(level='label').apply(df_average, 'intensitysum')
-    cell_table.to_pickle("cell_table.pkl")
-    cell_table.to_csv("cell_show.csv")
+    cell_table = weighted_average(prop, 'intensitysum')
+    save_table(cell_table, "cell_table.npz")
     #cell_map = labeln(properties, labeled_stack)
     del cell_table['tag']
     return cell_table
 
 def debug(labeled_stack, image_stack, min_radius, max_radiusm, prop):
+    from lambdaimage.serial.IO import save_table
     prop = clustering(prop,6)
     log('info')("clustering over")
-    cell_table = prop.groupby(level='label').apply(df_average, 'intensitysum')
-    cell_table.to_pickle("cell_table.pkl")
-    cell_table.to_csv("cell_show.csv")
+    cell_table = weighted_average(prop, 'intensitysum')
+    save_table(cell_table, "cell_table.npz")
     #cell_map = labeln(properties, labeled_stack)
     del cell_table['tag']
     return cell_table
@@ -152,40 +476,38 @@ def debug(labeled_stack, image_stack, min_radius, max_radiusm, prop):
 
 @exeTime
 def watershed_3d(image_stack, binary, min_distance=10, min_radius=6):
-    from skimage.morphology import watershed, remove_small_objects
-    from scipy import ndimage
-    from skimage.feature import peak_local_max
-    binary = remove_small_objects(binary, min_radius, connectivity=3)
-    distance = ndimage.distance_transform_edt(binary)
-    local_maxi = peak_local_max(distance, min_distance=min_distance, indices=False, labels=image_stack)
-    markers = ndimage.label(local_maxi)[0]
+    '''
+    Usage:
+     - 3d watershed of the distance transform of the binary stack, seeded at its maxima
+       at least min_distance apart, after dropping the objects smaller than min_radius voxels
+     - return the labels in the smallest unsigned type that holds them (uint8, uint16, ...),
+       see sparse_labels.smallest_dtype
+    '''
+    from skimage.morphology import watershed
+    from lambdaimage.segmentation.distance import edt
+    from lambdaimage.segmentation.region_stats import size_filter
+    from lambdaimage.segmentation.sparse_labels import smallest_dtype
+    from lambdaimage.segmentation.seeds import local_maxima, seeds_to_markers
+    binary = size_filter(binary.astype(bool), min_radius, connectivity=3)
+    distance = edt(binary)
+    seeds = local_maxima(distance, min_distance, mask=binary, exclude_border=True)
+    markers = seeds_to_markers(seeds, binary.shape)
     labeled_stack = watershed(-distance, markers, mask=binary)
-    return labeled_stack
+    return labeled_stack.astype(smallest_dtype(labeled_stack.max()))
 
 @exeTime
 def properties_3d(labeled_stack):
-    from lambdaimage.udf._moment import moment
-    from scipy import ndimage as ndi
+    '''
+    Usage:
+     - the centroid and volume of every label of a labeled volume
+    '''
     import pandas as pd
-    labeled_stack = np.squeeze(labeled_stack)
-    prop = []
+    from lambdaimage.segmentation.region_stats import region_stats
+    stats = region_stats(np.squeeze(labeled_stack))
     columns = ('x', 'y', 'z', 'volume')
-    indices = []
-    label = 0
-    objects = ndi.find_objects(labeled_stack)
-    for i, _slice in enumerate(objects):
-        if _slice is None:
-            continue
-        label += 1
-        mu = moment(labeled_stack[_slice].astype(np.double))
-        volume = mu[0]
-        x = mu[1] + _slice[0].start
-        y = mu[2] + _slice[1].start
-        y = mu[3] + _slice[2].start
-        prop.append([x,y,z,volume])
-        indices.append(label)
-    indices = pd.Index(indices, name='label')
-    prop = pd.DataFrame(prop, index=indices, columns=columns)
+    values = (stats['centroid-0'], stats['centroid-1'], stats['centroid-2'], stats['area'])
+    prop = pd.DataFrame(OrderedDict(zip(columns, values)),
+                        index=pd.Index(stats['label'], name='label'), columns=columns)
     return prop
 
 if __name__ == "__main__":
@@ -0,0 +1,142 @@
+################################
+# FileName : sparse_labels.py
+################################
+
+import os
+import numpy as np
+
+def smallest_dtype(max_label):
+    '''
+    Usage:
+     - the smallest unsigned integer type that holds the labels up to max_label
+    '''
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_label <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+class SparseLabels(object):
+    '''
+    Usage:
+     - a label array stored as the runs of equal nonzero labels along its flattened (C order)
+       pixels, each run being its start, length and label, in the smallest types that fit,
+       so the background costs nothing to move, cache or save
+     - toarray() gives back the dense labels
+    '''
+    def __init__(self, shape, starts, lengths, values):
+        self.shape = tuple(shape)
+        self.starts = starts
+        self.lengths = lengths
+        self.values = values
+
+    @classmethod
+    def fromarray(cls, labels):
+        '''
+        Usage:
+         - run-length encode a label array, labels must be nonnegative integers
+        '''
+        labels = np.asarray(labels)
+        flat = labels.ravel()
+        if not flat.size:
+            return cls(labels.shape, np.zeros(0, np.uint8), np.zeros(0, np.uint8), np.zeros(0, np.uint8))
+        if flat.min() < 0:
+            raise ValueError("labels must be nonnegative, got a minimum of %d" % flat.min())
+        starts = np.flatnonzero(np.concatenate(([True], flat[1:] != flat[:-1])))
+        lengths = np.diff(np.concatenate((starts, [flat.size])))
+        values = flat[starts]
+        runs = values != 0
+        starts, lengths, values = starts[runs], lengths[runs], values[runs]
+        index = smallest_dtype(flat.size)
+        return cls(labels.shape, starts.astype(index), lengths.astype(index),
+                   values.astype(smallest_dtype(values.max() if len(values) else 0)))
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    @property
+    def nbytes(self):
+        return self.starts.nbytes + self.lengths.nbytes + self.values.nbytes
+
+    def toarray(self, dtype=None):
+        '''
+        Usage:
+         - the dense labels, in the smallest type that fits unless dtype is given
+        '''
+        out = np.zeros(int(np.prod(self.shape)), dtype=self.dtype if dtype is None else dtype)
+        lengths = self.lengths.astype(np.int64)
+        if len(lengths):
+            # the flat index of every labeled pixel, run after run
+            offsets = self.starts.astype(np.int64) - np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            out[np.repeat(offsets, lengths) + np.arange(lengths.sum())] = np.repeat(self.values, lengths)
+        return out.reshape(self.shape)
+
+    def __getstate__(self):
+        return self.shape, self.starts, self.lengths, self.values
+
+    def __setstate__(self, state):
+        self.shape, self.starts, self.lengths, self.values = state
+
+    def __repr__(self):
+        return "SparseLabels(shape=%s, runs=%d, dtype=%s)" % (self.shape, len(self.values), self.dtype)
+
+def save_labels(stack, path, keys=None):
+    '''
+    Usage:
+     - save a stack of labels, or a list of SparseLabels, run-length encoded in one .npz archive
+    Args:
+     - keys: the keys of the planes, which order the planes of the archives of a directory
+             in load_labels, 0..n-1 by default
+    '''
+    arrays = {}
+    if keys is not None:
+        arrays['keys'] = np.asarray(keys)
+    for i, labels in enumerate(stack):
+        if not isinstance(labels, SparseLabels):
+            labels = SparseLabels.fromarray(labels)
+        arrays['shape_%d' % i] = np.array(labels.shape, dtype=np.int64)
+        arrays['starts_%d' % i] = labels.starts
+        arrays['lengths_%d' % i] = labels.lengths
+        arrays['values_%d' % i] = labels.values
+    np.savez_compressed(path, count=np.array(len(stack)), **arrays)
+
+def _load_archive(path):
+    '''
+    Usage:
+     - the (key, SparseLabels) of the planes of one archive of save_labels
+    '''
+    with np.load(path) as f:
+        count = int(f['count'])
+        keys = f['keys'] if 'keys' in f.files else range(count)
+        return [(k, SparseLabels(f['shape_%d' % i], f['starts_%d' % i], f['lengths_%d' % i], f['values_%d' % i]))
+                for k, i in zip(keys, range(count))]
+
+def load_labels(path, dense=True):
+    '''
+    Usage:
+     - load labels saved by save_labels, as a dense stack in the smallest type that fits
+       all of them, or as the list of SparseLabels
+     - path is an archive, or a directory of archives (e.g. one per partition, see
+       SegmentationPipeline.properties) whose planes are ordered by their keys
+    '''
+    if os.path.isdir(path):
+        names = sorted(name for name in os.listdir(path) if name.endswith('.npz'))
+        planes = [kv for name in names for kv in _load_archive(os.path.join(path, name))]
+        stack = [v for _, v in sorted(planes, key=lambda kv: kv[0])]
+    else:
+        stack = [v for _, v in _load_archive(path)]
+    if not dense:
+        return stack
+    return dense_stack(stack)
+
+def dense_stack(stack):
+    '''
+    Usage:
+     - the dense array of a list of SparseLabels of the same shape, in the smallest type that fits
+    '''
+    top = max([int(s.values.max()) for s in stack if len(s.values)] or [0])
+    dtype = smallest_dtype(top)
+    return np.array([s.toarray(dtype) for s in stack], dtype=dtype)
+
+if __name__ == "__main__":
+    pass
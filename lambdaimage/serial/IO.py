@@ -54,11 +54,26 @@ def save_tiff(img_stack, pwd):
 
 @exeTime
 def load_table(pwd):
+    '''
+    Usage:
+     - load a DataFrame saved by save_table
+    '''
     import pandas as pd
-    return pd.read_pickle(pwd)
+    from collections import OrderedDict
+    with np.load(pwd) as f:
+        columns = [str(col) for col in f['columns']]
+        data = OrderedDict((col, f['column_%d' % i]) for i, col in enumerate(columns))
+        index = pd.Index(f['index'], name=str(f['index_name']) or None)
+    return pd.DataFrame(data, index=index, columns=columns)
 
 @exeTime
 def save_table(tab, pwd):
-    import pandas as pd
-    pd.to_pickle(pwd)
-    pd.to_csv(pwd)
+    '''
+    Usage:
+     - save a DataFrame of numeric columns column by column in a numpy .npz archive,
+       binary and columnar, unlike pickle or csv
+    '''
+    columns = [str(col) for col in tab.columns]
+    arrays = dict(('column_%d' % i, tab[col].values) for i, col in enumerate(tab.columns))
+    np.savez(pwd, columns=np.array(columns), index=tab.index.values,
+             index_name=np.array(tab.index.name or ''), **arrays)
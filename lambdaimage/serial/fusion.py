@@ -8,60 +8,145 @@ import numpy as np
 from lambdaimage.utils.tool import exeTime
 import math
 
+def _block_mean(frame, f):
+    '''
+    Usage:
+     - downsample frame by averaging f*f blocks, padding the edges by replication
+    '''
+    frame = np.pad(frame, [(0, -n % f) for n in frame.shape], mode='edge')
+    shape = sum([(n // f, f) for n in frame.shape], ())
+    return frame.reshape(shape).mean(axis=tuple(range(1, 2*frame.ndim, 2)))
+
+def _upsample(small, shape, f):
+    '''
+    Usage:
+     - bilinear upsampling of a _block_mean result back to shape
+    '''
+    out = small
+    for axis, n in enumerate(shape):
+        # pixel i lies at (i - (f-1)/2) / f on the downsampled grid
+        x = ((np.arange(n, dtype=np.float32) - (f-1)/2.0) / f).clip(0, small.shape[axis]-1)
+        i0 = np.floor(x).astype(int)
+        i1 = np.minimum(i0+1, small.shape[axis]-1)
+        w = (x - np.floor(x)).reshape([-1 if a == axis else 1 for a in range(small.ndim)])
+        out = out.take(i0, axis=axis)*(1-w) + out.take(i1, axis=axis)*w
+    return out
+
+def _content_weight(frame, sgm1, sgm2, f):
+    '''
+    Usage:
+     - the local contrast of frame, on a grid downsampled by f
+     - only the squared detail is taken at full resolution, both smoothings are done on the small grid
+    '''
+    from scipy.ndimage import gaussian_filter
+    if f == 1:
+        detail = frame - gaussian_filter(frame, sgm1, mode='nearest')
+        return gaussian_filter(detail*detail, sgm2, mode='nearest')
+    background = _upsample(gaussian_filter(_block_mean(frame, f), sgm1/float(f)), frame.shape, f)
+    detail = frame - background
+    return gaussian_filter(_block_mean(detail*detail, f), sgm2/float(f))
+
 @exeTime
-def content_fusion(img_stack, sgm1=44, sgm2=81): 
+def content_fusion(img_stack, sgm1=44, sgm2=81, downscale=1):
     '''
     Usage:
      - a fast implementation of content-based fusion
     Args:
      - rdd: the ziped L&R img stack
      - sgm1/sgm2: gaussian smooth size
+     - downscale: if > 1, the weights are computed on frames downsampled by this factor
+                  and upsampled bilinearly, then blended at full resolution
+     - the weights are computed in the precision of lambdaimage.utils.common.setPrecision,
+       the downsampled weights of downscale > 1 always in float32
     '''
-    from skimage.filters import gaussian_filter
+    from lambdaimage.utils.common import getPrecision
+    ftype = np.float32 if downscale > 1 else getPrecision()
     def func(dframe):
         frame1, frame2 = dframe[0], dframe[1]
-        tmp1 = frame1 - gaussian_filter(frame1,sgm1)
-        tmp1 = gaussian_filter(tmp1*tmp1,sgm2)
-        tmp2 = frame2 - gaussian_filter(frame2,sgm1)
-        tmp2 = gaussian_filter(tmp2*tmp2,sgm2)
-        ret = (tmp1*frame1 + frame1*tmp1)/(tmp1+tmp2)
-        ret = ret.astype(frame1.dtype)
+        dtype = frame1.dtype
+        frame1 = frame1.astype(ftype)
+        frame2 = frame2.astype(ftype)
+        w1 = _content_weight(frame1, sgm1, sgm2, downscale)
+        w2 = _content_weight(frame2, sgm1, sgm2, downscale)
+        w = (w1/np.maximum(w1+w2, 1e-12)).astype(ftype)
+        if downscale > 1:
+            w = _upsample(w, frame1.shape, downscale)
+        ret = w*frame1 + (1-w)*frame2
+        ret = ret.astype(dtype)
         return ret
     fused_img = np.array(map(func, img_stack))
     return fused_img
 
+def _select(c, s, rule='max', window=3):
+    '''
+    Usage:
+     - fuse two arrays of detail coefficients in place into c, and return c
+    Args:
+     - rule: 'max' keeps the coefficient of larger magnitude (s on ties),
+             'energy' keeps the one with the larger energy in its local window
+     - window: the window size of the 'energy' rule
+    '''
+    if rule == 'energy':
+        from scipy.ndimage import uniform_filter
+        take = uniform_filter(c*c, window) <= uniform_filter(s*s, window)
+    else:
+        take = np.abs(c) <= np.abs(s)
+    np.copyto(c, s, where=take)
+    return c
+
 @exeTime
-def wavelet_fusion(img_stack, level=5):
+def wavelet_fusion(img_stack, level=5, rule='max', window=3):
     '''
     Usage:
      - a implementation of wavelet fusion (C based)
+     - 2d frames use wavedec2, 3d volumes use wavedecn (plane by plane wavedec2 on PyWavelets < 0.4)
     Args:
-     - level: wavelet level
+     - level: wavelet level, clipped to the max level of 3d volumes
+     - rule: 'max' or 'energy', how detail coefficients are selected, see _select
+     - window: the window size of the 'energy' rule
     '''
     import pywt
-    def fuse(A, C, S):
-        T = [A]
-        for c, s in zip(C, S):
-            cH,cV,cD = c
-            sH,sV,sD = s
-            tH = map(lambda x,y: map(lambda a,b: a if abs(a) > abs(b) else b, x,y), cH, sH)
-            tV = map(lambda x,y: map(lambda a,b: a if abs(a) > abs(b) else b, x,y), cV, sV)
-            tD = map(lambda x,y: map(lambda a,b: a if abs(a) > abs(b) else b, x,y), cD, sD)
-            T.append((tH,tV,tD))
-        return T
+    from lambdaimage.utils.common import getPrecision
+    # pywt transforms float32 in float32, anything else in float64
+    ftype = getPrecision()
+    def pair(frame1, frame2):
+        if frame1.ndim == 2:
+            C = pywt.wavedec2(frame1, 'db4', level=level)
+            S = pywt.wavedec2(frame2, 'db4', level=level)
+            details = [zip(c, s) for c, s in zip(C[1:], S[1:])]
+        else:
+            lv = min(level, pywt.dwtn_max_level(frame1.shape, 'db4'))
+            C = pywt.wavedecn(frame1, 'db4', level=lv)
+            S = pywt.wavedecn(frame2, 'db4', level=lv)
+            details = [[(c[k], s[k]) for k in c] for c, s in zip(C[1:], S[1:])]
+        # fuse into the buffers of C and reconstruct from them
+        C[0] += S[0]
+        C[0] /= 2
+        for pairs in details:
+            for c, s in pairs:
+                _select(c, s, rule, window)
+        if frame1.ndim == 2:
+            fuse_img = pywt.waverec2(C, 'db4')
+        else:
+            fuse_img = pywt.waverecn(C, 'db4')
+        # odd sizes come back padded by one
+        return fuse_img[tuple(slice(0, n) for n in frame1.shape)]
     def func(dframe):
         frame1, frame2 = dframe[0], dframe[1]
-        frame1 = np.array(frame1)
-        frame2 = np.array(frame2)
-        C = pywt.wavedec2(frame1, 'db4', level=level)
-        S = pywt.wavedec2(frame2, 'db4', level=level)
-        tA2 = (C[0] + S[0])/2
-        coeffs = fuse(tA2, C[1:], S[1:])
-        fuse_img = pywt.waverec2(coeffs, 'db4')
-        if frame1.dtype == np.uint16:
+        dtype = frame1.dtype
+        frame1 = np.ascontiguousarray(frame1, dtype=ftype)
+        frame2 = np.ascontiguousarray(frame2, dtype=ftype)
+        if frame1.ndim > 2 and not hasattr(pywt, 'wavedecn'):
+            # PyWavelets < 0.4 has no n-d transform, volumes are fused plane by plane
+            fuse_img = np.array([pair(a, b) for a, b in zip(frame1, frame2)])
+        else:
+            fuse_img = pair(frame1, frame2)
+        if dtype == np.uint16:
             fuse_img = fuse_img.clip(0,65535).astype(np.uint16)
-        elif frame1.dtype == np.uint8:
+        elif dtype == np.uint8:
             fuse_img = fuse_img.clip(0,255).astype(np.uint8)
+        elif dtype.kind == 'f':
+            fuse_img = fuse_img.astype(dtype, copy=False)
         return fuse_img
     fused_img = np.array(map(func, img_stack))
     fused_img = fused_img.astype(fused_img[0].dtype)
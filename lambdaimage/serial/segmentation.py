@@ -5,37 +5,95 @@
 ################################
 
 from lambdaimage.utils.tool import exeTime
+from collections import OrderedDict
 import numpy as np
 
 def threshold(img_stack, method='adaptive', *args):
-    from skimage.filters import threshold_otsu, threshold_adaptive
+    '''
+    Usage:
+     - binarize every frame of img_stack
+    Args:
+     - method: 'adaptive', 'otsu' (see otsu_threshold), 'duel' (see otsu.duel_levels),
+               or one of the local thresholds
+               'phansalkar', 'sauvola', 'niblack' and 'bernsen' (see local_threshold)
+     - args: the block size of 'adaptive', or the window radius of a local threshold
+             followed by its parameters
+    '''
+    from skimage.filters import threshold_adaptive
     import scipy.ndimage as ndi
+    from lambdaimage.segmentation.local_threshold import local_threshold, METHODS
+    from lambdaimage.segmentation.otsu import duel_levels
     def adaptive(frame):
         binary = threshold_adaptive(frame, block_size=block_size)
         binary = ndi.binary_fill_holes(binary)
         return binary
-    def otsu(frame):
-        threshold = threshold_otsu(frame)
-        binary = frame > threshold
-        return binary
-    def duel(frame):
-        threshold = threshold_otsu(frame)
-        binary1 = frame > threshold
-        frame = frame - binary1 * frame
-        threshold = threshold_otsu(frame)
-        binary2 = frame > threshold
-        binary = binary1 & binary2
-        return binary
+    def local(frame):
+        return local_threshold(frame, method, radius, *params)
     if method=='adaptive':
         block_size = args[0]
         return np.array(map(adaptive, img_stack))
     elif method == 'otsu':
-        return np.array(map(otsu, img_stack))
+        return otsu_threshold(img_stack)
     elif method == 'duel':
-        return np.array(map(duel, img_stack))
+        # the pixels between the two levels of a two-pass Otsu of the stack
+        lo, width, hist = _stack_histogram(img_stack, 256)
+        t2, t1 = [lo + t*width for t in duel_levels(hist)]
+        return np.array([(frame >= t2) & (frame < t1) for frame in img_stack])
+    elif method in METHODS:
+        radius, params = args[0], args[1:]
+        return np.array(map(local, img_stack))
     else:
         raise "Bad Threshold Method", method
 
+def _stack_histogram(img_stack, nbins, window=None):
+    '''
+    Usage:
+     - the histogram of the whole stack, or the list of the histograms of the planes
+       at most window planes away from each plane, with the lo and width of its bins
+    '''
+    from lambdaimage.segmentation.otsu import _bins, _histogram, _windows
+    img_stack = np.asarray(img_stack)
+    lo, hi = img_stack.min(), img_stack.max()
+    # python scalars, so that thresholds do not wrap around in small integer types
+    lo, hi = lo.item(), hi.item()
+    width, nbins = _bins(lo, hi, img_stack.dtype, nbins)
+    if window is None:
+        return lo, width, _histogram(img_stack, lo, width, nbins)
+    return lo, width, _windows([_histogram(frame, lo, width, nbins) for frame in img_stack], window)
+
+@exeTime
+def otsu_levels(img_stack, nclasses=2, nbins=256, window=None):
+    '''
+    Usage:
+     - Otsu / multi-level Otsu thresholds of the whole stack from one histogram
+     - return the nclasses-1 thresholds, class k holds the values in [t[k-1], t[k]),
+       or a list of them per plane when window is given
+    Args:
+     - nclasses: the number of classes, 2 for a single threshold
+     - nbins: the number of bins, integer stacks use one bin per value when they fit
+     - window: if given, the thresholds of each plane come from the histogram of
+               the planes at most window planes away
+    '''
+    from lambdaimage.segmentation.otsu import multi_otsu
+    lo, width, hist = _stack_histogram(img_stack, nbins, window)
+    edges = lambda hist: [lo + t*width for t in multi_otsu(hist, nclasses)]
+    if window is None:
+        return edges(hist)
+    return [edges(h) for h in hist]
+
+def otsu_threshold(img_stack, nclasses=2, nbins=256, window=None):
+    '''
+    Usage:
+     - binarize the stack with thresholds shared by all planes (or a window of planes), see otsu_levels
+     - return a boolean stack for 2 classes, else uint8 class labels
+    '''
+    levels = otsu_levels(img_stack, nclasses, nbins, window)
+    if window is None:
+        levels = [levels] * len(img_stack)
+    if nclasses == 2:
+        return np.array([frame >= t[0] for frame, t in zip(img_stack, levels)])
+    return np.array([np.digitize(frame, t).astype(np.uint8) for frame, t in zip(img_stack, levels)])
+
 def peak_filter(image_stack, smooth_size):
     from skimage.morphology import binary_opening
     def func(frame):
@@ -46,40 +104,49 @@ def peak_filter(image_stack, smooth_size):
 
 @exeTime
 def watershed_3d(image_stack, binary, min_distance=10, min_radius=6):
-    from skimage.feature import peak_local_max
-    from skimage.morphology import watershed, remove_small_objects
-    from scipy import ndimage
-    binary = remove_small_objects(binary, min_radius, connectivity=3)
-    distance = ndimage.distance_transform_edt(binary)
-    local_maxi = peak_local_max(distance, min_distance=min_distance, indices=False, labels=image_stack)
-    markers = ndimage.label(local_maxi)[0]
+    '''
+    Usage:
+     - 3d watershed of the distance transform of the binary stack, seeded at its maxima
+       at least min_distance apart, after dropping the objects smaller than min_radius voxels
+     - return the labels in the smallest unsigned type that holds them (uint8, uint16, ...),
+       see sparse_labels.smallest_dtype
+    '''
+    from skimage.morphology import watershed
+    from lambdaimage.segmentation.distance import edt
+    from lambdaimage.segmentation.region_stats import size_filter
+    from lambdaimage.segmentation.sparse_labels import smallest_dtype
+    from lambdaimage.segmentation.seeds import local_maxima, seeds_to_markers
+    binary = size_filter(binary.astype(bool), min_radius, connectivity=3)
+    distance = edt(binary)
+    seeds = local_maxima(distance, min_distance, mask=binary, exclude_border=True)
+    markers = seeds_to_markers(seeds, binary.shape)
     labeled_stack = watershed(-distance, markers, mask=binary)
-    return labeled_stack
+    return labeled_stack.astype(smallest_dtype(labeled_stack.max()))
+
+def region_properties(labeled_stack, image_stack=None):
+    '''
+    Usage:
+     - the statistics of the labels of every frame, see region_stats
+     - return a list of columns, OrderedDicts of arrays with one row per label
+    '''
+    from lambdaimage.segmentation.region_stats import region_stats
+    if image_stack is None:
+        return [region_stats(frame) for frame in labeled_stack]
+    return [region_stats(frame, image) for frame, image in zip(labeled_stack, image_stack)]
 
 @exeTime
 def properties(labeled_stack):
-    from lambdaimage.udf._moment import moment
-    from scipy import ndimage as ndi
+    '''
+    Usage:
+     - the centroid and volume of every label of a labeled volume
+    '''
     import pandas as pd
-    labeled_stack = np.squeeze(labeled_stack)
-    prop = []
+    from lambdaimage.segmentation.region_stats import region_stats
+    stats = region_stats(np.squeeze(labeled_stack))
     columns = ('x', 'y', 'z', 'volume')
-    indices = []
-    label = 0
-    objects = ndi.find_objects(labeled_stack)
-    for i, _slice in enumerate(objects):
-        if _slice is None:
-            continue
-        label += 1
-        mu = moment(labeled_stack[_slice].astype(np.double))
-        volume = mu[0]
-        x = mu[1] + _slice[0].start
-        y = mu[2] + _slice[1].start
-        y = mu[3] + _slice[2].start
-        prop.append([x,y,z,volume])
-        indices.append(label)
-    indices = pd.Index(indices, name='label')
-    prop = pd.DataFrame(prop, index=indices, columns=columns)
+    values = (stats['centroid-0'], stats['centroid-1'], stats['centroid-2'], stats['area'])
+    prop = pd.DataFrame(OrderedDict(zip(columns, values)),
+                        index=pd.Index(stats['label'], name='label'), columns=columns)
     return prop
 
 if __name__ == "__main__":
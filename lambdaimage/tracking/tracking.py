@@ -0,0 +1,200 @@
+################################
+# FileName : tracking.py
+################################
+
+from lambdaimage.utils.tool import exeTime, log
+from collections import OrderedDict
+import numpy as np
+
+def _positions(table, columns):
+    '''
+    Usage:
+     - the coordinates of the cells of a cell table, or of an array of positions
+    '''
+    if hasattr(table, 'columns'):
+        table = table[list(columns)].values
+    positions = np.asarray(table, dtype=np.float64)
+    return positions.reshape(len(positions), -1)
+
+def candidates(prev, curr, max_distance, k=4):
+    '''
+    Usage:
+     - the candidate links from the cells of prev to their k nearest cells of curr
+       closer than max_distance, found with a KD-tree
+     - return the arrays (i, j, distance) of the links from prev[i] to curr[j]
+    '''
+    from scipy.spatial import cKDTree
+    if not len(prev) or not len(curr):
+        return np.zeros(0, np.intp), np.zeros(0, np.intp), np.zeros(0)
+    k = min(k, len(curr))
+    distance, j = cKDTree(curr).query(prev, k=k, distance_upper_bound=max_distance)
+    distance, j = distance.reshape(len(prev), k), j.reshape(len(prev), k)
+    found = np.isfinite(distance)
+    i = np.nonzero(found)[0]
+    return i, j[found], distance[found]
+
+def _hungarian(cost):
+    '''
+    Usage:
+     - the minimum cost assignment of a square cost matrix with the shortest augmenting
+       path method, for scipy without linear_sum_assignment (< 0.17)
+     - return the arrays (rows, cols) of the assignment, sorted by row
+    '''
+    n = len(cost)
+    u, v = np.zeros(n + 1), np.zeros(n + 1)
+    # p[j] is the row (from 1) assigned to column j, column 0 is the row being inserted
+    p, way = np.zeros(n + 1, np.intp), np.zeros(n + 1, np.intp)
+    for i in range(1, n + 1):
+        p[0], j0 = i, 0
+        minv = np.full(n + 1, np.inf)
+        used = np.zeros(n + 1, bool)
+        while p[j0]:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            j1 = np.argmin(np.where(free, minv[1:], np.inf)) + 1
+            delta = minv[j1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[~used] -= delta
+            j0 = j1
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    rows = p[1:] - 1
+    order = np.argsort(rows)
+    return rows[order], np.arange(n)[order]
+
+def _assign(cost, gate):
+    '''
+    Usage:
+     - the optimal matching of one component of the candidate graph, where leaving a cell
+       unmatched costs gate, with the Hungarian algorithm on the augmented cost matrix
+    Args:
+     - cost: dense (rows, cols) costs, inf for pairs that are not candidates
+    '''
+    try:
+        from scipy.optimize import linear_sum_assignment
+    except ImportError:
+        linear_sum_assignment = _hungarian
+    n, m = cost.shape
+    big = 2 * gate * (n + m) + 1
+    full = np.zeros((n + m, m + n))
+    full[:n, :m] = np.where(np.isfinite(cost), cost, big)
+    full[:n, m:] = big
+    full[n:, :m] = big
+    full[np.arange(n), m + np.arange(n)] = gate
+    full[n + np.arange(m), np.arange(m)] = gate
+    rows, cols = linear_sum_assignment(full)
+    matched = (rows < n) & (cols < m)
+    rows, cols = rows[matched], cols[matched]
+    keep = np.isfinite(cost[rows, cols])
+    return rows[keep], cols[keep]
+
+def link(prev, curr, max_distance, k=4):
+    '''
+    Usage:
+     - link the cells of two consecutive time points one to one, minimizing the total distance
+       of the links, each no longer than max_distance
+     - the Hungarian algorithm runs on each connected component of the sparse candidate graph
+       (see candidates) instead of on all the cells, and isolated pairs are linked directly
+     - return the arrays (i, j) of the links from prev[i] to curr[j]
+    Args:
+     - prev, curr: (cells, dims) positions
+     - k: the number of candidates per cell
+    '''
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    prev, curr = np.asarray(prev, dtype=np.float64), np.asarray(curr, dtype=np.float64)
+    n, m = len(prev), len(curr)
+    i, j, d = candidates(prev, curr, max_distance, k)
+    if not len(i):
+        return np.zeros(0, np.intp), np.zeros(0, np.intp)
+    # the cells of prev are nodes 0..n-1 and those of curr n..n+m-1
+    graph = coo_matrix((np.ones(len(i)), (i, n + j)), shape=(n + m, n + m))
+    _, component = connected_components(graph, directed=False)
+    comp = component[i]
+    order = np.argsort(comp, kind='mergesort')
+    i, j, d, comp = i[order], j[order], d[order], comp[order]
+    starts = np.flatnonzero(np.concatenate(([True], comp[1:] != comp[:-1])))
+    stops = np.concatenate((starts[1:], [len(comp)]))
+    single = stops - starts == 1
+    links_i, links_j = [i[starts[single]]], [j[starts[single]]]
+    for start, stop in zip(starts[~single], stops[~single]):
+        ci, cj, cd = i[start:stop], j[start:stop], d[start:stop]
+        rows, ri = np.unique(ci, return_inverse=True)
+        cols, rj = np.unique(cj, return_inverse=True)
+        cost = np.full((len(rows), len(cols)), np.inf)
+        cost[ri, rj] = cd
+        r, c = _assign(cost, max_distance)
+        links_i.append(rows[r])
+        links_j.append(cols[c])
+    return np.concatenate(links_i), np.concatenate(links_j)
+
+def _tracks(counts, links):
+    '''
+    Usage:
+     - the track of every cell of every time point, numbered from 1 in order of first cell
+    Args:
+     - counts: the number of cells of each time point
+     - links: the (i, j) links from each time point to the next
+    '''
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    total = offsets[-1]
+    src = [offsets[t] + i for t, (i, _) in enumerate(links)]
+    dst = [offsets[t+1] + j for t, (_, j) in enumerate(links)]
+    src = np.concatenate(src) if src else np.zeros(0, np.intp)
+    dst = np.concatenate(dst) if dst else np.zeros(0, np.intp)
+    graph = coo_matrix((np.ones(len(src)), (src, dst)), shape=(total, total))
+    _, component = connected_components(graph, directed=False)
+    _, first, inverse = np.unique(component, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(1, len(first) + 1)
+    return rank[inverse]
+
+@exeTime
+def track(sc, tables, max_distance, k=4, columns=('x', 'y', 'z')):
+    '''
+    Usage:
+     - track cells over time: link the cells of every pair of consecutive time points in
+       parallel with Spark (see link), then stitch the links into lineages
+     - return the track table, one row per cell with its track, time point, row in the cell
+       table of its time point and position, sorted by track and time
+    Args:
+     - sc: the SparkContext
+     - tables: the cell tables of the time points in order (e.g. from segmentation.fusion),
+               or arrays of positions
+     - max_distance: the largest distance a cell moves between two time points
+     - k: the number of nearest candidates considered for each cell
+     - columns: the position columns of the cell tables
+    '''
+    import pandas as pd
+    positions = [_positions(table, columns) for table in tables]
+    counts = [len(p) for p in positions]
+    pairs = [(t, (positions[t], positions[t+1])) for t in range(len(positions) - 1)]
+    log('info')("linking %d time points" % len(positions))
+    links = sc.parallelize(pairs, max(len(pairs), 1)) \
+              .mapValues(lambda v: link(v[0], v[1], max_distance, k)).collect()
+    links = [l for _, l in sorted(links, key=lambda kv: kv[0])]
+    tracks = _tracks(counts, links)
+    data = OrderedDict()
+    data['track'] = tracks
+    data['t'] = np.repeat(np.arange(len(counts)), counts)
+    data['cell'] = np.concatenate([np.arange(n) for n in counts]) if counts else np.zeros(0, np.intp)
+    coords = np.concatenate(positions) if positions else np.zeros((0, len(columns)))
+    for i, col in enumerate(columns[:coords.shape[1]]):
+        data[col] = coords[:, i]
+    order = np.lexsort((data['t'], data['track']))
+    for col in data:
+        data[col] = data[col][order]
+    return pd.DataFrame(data, columns=list(data.keys()))
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,24 @@
+################################
+# FileName : _edt.pyx
+################################
+
+import cython
+import numpy as np
+cimport numpy as np
+
+cdef extern int c_edt_axis(float* f, long n, long inner, double spacing, long start, long stop) nogil
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def edt_axis(np.ndarray[float, ndim=1, mode="c"] f not None, long n, long inner,
+             double spacing, long start, long stop):
+    '''
+    the 1d squared distance transform, in place, of the lines [start, stop) along the middle
+    axis of f seen as (-1, n, inner), without the GIL so that threads can share the lines
+    '''
+    cdef int status
+    with nogil:
+        status = c_edt_axis(&f[0], n, inner, spacing, start, stop)
+    if status != 0:
+        raise MemoryError("cannot allocate the buffers of the distance transform")
+    return f
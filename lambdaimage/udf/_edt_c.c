@@ -0,0 +1,69 @@
+#include <math.h>
+#include <stdlib.h>
+
+/*
+ * One pass of the separable squared Euclidean distance transform (Felzenszwalb & Huttenlocher):
+ * the 1d transform, in place, of the lines [start, stop) along the middle axis of a
+ * C contiguous float32 array of shape (outer, n, inner). Line l starts at
+ * (l / inner) * n * inner + l % inner and its samples are inner apart.
+ * Samples are squared distances, INFINITY where unknown; a line with no finite sample stays INFINITY.
+ * Returns 0, or -1 if the buffers of the pass cannot be allocated.
+ */
+int c_edt_axis(float* f, long n, long inner, double spacing, long start, long stop){
+    long l, q, k, p;
+    float* line;
+    double s, d;
+    long* v = (long*) malloc(n * sizeof(long));
+    double* z = (double*) malloc((n + 1) * sizeof(double));
+    double* g = (double*) malloc(n * sizeof(double));
+    if (v == NULL || z == NULL || g == NULL){
+        free(v);
+        free(z);
+        free(g);
+        return -1;
+    }
+    for (l = start; l < stop; l++){
+        line = f + (l / inner) * n * inner + l % inner;
+        for (q = 0; q < n; q++)
+            g[q] = line[q * inner];
+        /* the lower envelope of the parabolas rooted at the finite samples */
+        k = -1;
+        for (q = 0; q < n; q++){
+            if (isinf(g[q]))
+                continue;
+            if (k < 0){
+                k = 0;
+                v[0] = q;
+                z[0] = -INFINITY;
+                z[1] = INFINITY;
+                continue;
+            }
+            /* z[0] is -INFINITY, so the first parabola is never dropped */
+            while (1){
+                p = v[k];
+                s = ((g[q] + (q * spacing) * (q * spacing)) - (g[p] + (p * spacing) * (p * spacing)))
+                    / (2 * spacing * (q - p));
+                if (s > z[k])
+                    break;
+                k--;
+            }
+            k++;
+            v[k] = q;
+            z[k] = s;
+            z[k + 1] = INFINITY;
+        }
+        if (k < 0)
+            continue;
+        k = 0;
+        for (q = 0; q < n; q++){
+            while (z[k + 1] < q * spacing)
+                k++;
+            d = (q - v[k]) * spacing;
+            line[q * inner] = (float) (d * d + g[v[k]]);
+        }
+    }
+    free(v);
+    free(z);
+    free(g);
+    return 0;
+}
@@ -0,0 +1,118 @@
+""" Content-addressed local store for registration results """
+
+import os
+
+from lambdaimage.utils.serializable import Serializable
+
+
+def _digest(obj, hasher):
+    """ Recursively feed the content of an object to a hashlib object """
+    from numpy import ndarray, ascontiguousarray
+    from lambdaimage.rdds.images import Images
+
+    if isinstance(obj, Images):
+        # hash records in parallel, only the small per-record digests are collected
+        def recordDigest(kv):
+            import hashlib
+            h = hashlib.md5()
+            _digest(kv[1], h)
+            return kv[0], h.hexdigest()
+        digests = sorted(obj.rdd.map(recordDigest).collect())
+        hasher.update("images%r" % (digests,))
+    elif isinstance(obj, ndarray):
+        hasher.update("ndarray%s%r" % (obj.dtype.str, obj.shape))
+        hasher.update(ascontiguousarray(obj).data)
+    elif isinstance(obj, (list, tuple)):
+        hasher.update("%s%d" % (type(obj).__name__, len(obj)))
+        for item in obj:
+            _digest(item, hasher)
+    elif isinstance(obj, dict):
+        hasher.update("dict%d" % len(obj))
+        for k in sorted(obj.keys()):
+            _digest(k, hasher)
+            _digest(obj[k], hasher)
+    else:
+        hasher.update("%s%r" % (type(obj).__name__, obj))
+
+
+class CacheEntry(Serializable, object):
+    """
+    A single cached value, e.g. a RegistrationModel or an affine parameter vector
+    """
+    def __init__(self, value=None):
+        self.value = value
+
+
+class RegistrationCache(object):
+    """
+    Content-addressed cache for registration results.
+
+    Results are stored as JSON files in a local directory, named by a hash of the
+    content of the input images and of the parameters used to estimate them, so
+    that re-running a pipeline on unchanged inputs can skip estimation entirely.
+
+    Parameters
+    ----------
+    path : string, optional, default = '~/.lambdaimage/cache'
+        Directory in which cached results are stored, created if it does not exist
+    """
+    def __init__(self, path='~/.lambdaimage/cache'):
+        self.path = os.path.expanduser(path)
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    @staticmethod
+    def key(*inputs, **params):
+        """
+        Compute a cache key from the content of inputs and a set of parameters.
+
+        Parameters
+        ----------
+        inputs : ndarrays, Images, or simple python values
+            Data the result is computed from. Images are hashed record by record
+            on the workers.
+
+        params : keyword arguments
+            Method name and parameters the result depends on
+
+        Returns
+        -------
+        key : string
+            Hexadecimal digest identifying the inputs and parameters
+        """
+        import hashlib
+        hasher = hashlib.sha1()
+        _digest(list(inputs), hasher)
+        _digest(params, hasher)
+        return hasher.hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.json')
+
+    def __contains__(self, key):
+        return os.path.exists(self._file(key))
+
+    def get(self, key, default=None):
+        """
+        Return the value cached under key, or default if there is none.
+        """
+        if key not in self:
+            return default
+        return CacheEntry.load(self._file(key)).value
+
+    def put(self, key, value):
+        """
+        Store a Serializable object, ndarray, or simple python value under key.
+        """
+        # write to a temporary file first so that readers never see a partial entry
+        tmp = self._file(key) + '.%d.tmp' % os.getpid()
+        CacheEntry(value).save(tmp, overwrite=True)
+        os.rename(tmp, self._file(key))
+
+    def clear(self):
+        """
+        Remove all cached entries.
+        """
+        for f in os.listdir(self.path):
+            if f.endswith('.json'):
+                os.remove(os.path.join(self.path, f))
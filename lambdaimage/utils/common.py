@@ -82,6 +82,38 @@ def smallestFloatType(dtype):
     return promote_types(inType, compType)
 
 
+_precision = {'float': 'float64'}
+
+
+def setPrecision(precision):
+    """
+    Set the floating point precision that processing modules compute in.
+
+    With 'float32', fusion, registration and filtering compute in float32 and complex64, and
+    Data statistics cast records to float32, upcasting to float64 only in their accumulations.
+    With the default 'float64', everything is computed in double precision.
+
+    The setting is read on the driver when an operation is defined, so it applies to operations
+    defined after it is changed.
+
+    Parameters
+    ----------
+    precision : 'float32' or 'float64', or the corresponding numpy dtype
+    """
+    from numpy import dtype as dtypeFunc
+    if str(dtypeFunc(precision)) not in ('float32', 'float64'):
+        raise ValueError("Precision must be 'float32' or 'float64', got '%s'" % precision)
+    _precision['float'] = str(dtypeFunc(precision))
+
+
+def getPrecision():
+    """
+    Returns the floating point dtype that processing modules compute in, see setPrecision.
+    """
+    from numpy import dtype as dtypeFunc
+    return dtypeFunc(_precision['float'])
+
+
 def pil_to_array(pilImage):
     """
     Load a PIL image and return it as a numpy array.  Only supports greyscale images;
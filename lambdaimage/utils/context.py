@@ -227,6 +227,37 @@ class lambdaimageContext():
         else:
             return data.renumber()
 
+    def loadImagesPair(self, dataPathA, dataPathB, npartitions=None, **kwargs):
+        """
+        Loads two co-partitioned Images objects, e.g. the two views of a dual-view acquisition.
+
+        Both are hash partitioned by key with the same number of partitions, so that
+        records with the same key are in the same partition. Pairing them with
+        Images.pairWith, including after per-image operations such as applyValues,
+        then does not require another shuffle.
+
+        Parameters
+        ----------
+        dataPathA, dataPathB : string
+            Paths to the data files of each view, see loadImages
+
+        npartitions : positive int, optional, default = None
+            Number of partitions of both objects, if unspecified will use default parallelism
+
+        kwargs : other keyword arguments
+            Passed on to loadImages for both views
+
+        Returns
+        -------
+        (dataA, dataB) : tuple of lambdaimage.rdds.Images
+        """
+        if npartitions is None:
+            npartitions = self._sc.defaultParallelism
+
+        dataA = self.loadImages(dataPathA, npartitions=npartitions, **kwargs).partitionBy(npartitions)
+        dataB = self.loadImages(dataPathB, npartitions=npartitions, **kwargs).partitionBy(npartitions)
+        return dataA, dataB
+
     def loadSeriesFromArray(self, values, index=None, npartitions=None):
         """
         Load Series data from a local array
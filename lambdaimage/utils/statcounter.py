@@ -63,10 +63,14 @@ class StatCounter(object):
     def merge(self, value):
         self.n += 1
         if self.__requires('mu'):
-            delta = value - self.mu
+            # accumulate single precision values in double precision
+            exact = value
+            if getattr(value, 'dtype', None) is not None and value.dtype.kind == 'f' and value.dtype.itemsize < 8:
+                exact = value.astype('float64')
+            delta = exact - self.mu
             self.mu += delta / self.n
             if self.__requires('m2'):
-                self.m2 += delta * (value - self.mu)
+                self.m2 += delta * (exact - self.mu)
         if self.__requires('maxValue'):
             self.maxValue = maximum(self.maxValue, value) if not self.maxValue is None else value
         if self.__requires('minValue'):
@@ -31,7 +31,8 @@ class Visualization:
     def __init__(self):
         '''
         '''
-        self.cell_table = pd.read_pickle("cell_table.pkl")
+        from lambdaimage.serial.IO import load_table
+        self.cell_table = load_table("cell_table.npz")
         self.cell_table.to_csv("cell_tabel.csv")
     def makeCells(self):
         '''
@@ -4,6 +4,9 @@ from lambdaimage import fusion as fus
 from lambdaimage import segmentation as seg
 from lambdaimage import lambdaimageContext
 from lambdaimage.utils.tool import exeTime, log
+from lambdaimage.utils.cache import RegistrationCache
+from lambdaimage.segmentation.pipeline import SegmentationPipeline
+from lambdaimage.serial.IO import save_table
 from pyspark import SparkContext, SparkConf
 from parseXML import load_xml_file, get_function
 import numpy as np
@@ -16,8 +19,7 @@ result = load_xml_file("./lambdaimage.xml")
 count = 0
 
 log('info')('load tiff ...')
-rddA = tsc.loadImages('/home/wb/data/1-L/*.tif', inputFormat='tif-stack')
-rddB = tsc.loadImages('/home/wb/data/1-R/*.tif', inputFormat='tif-stack')
+rddA, rddB = tsc.loadImagesPair('/home/wb/data/1-L/*.tif', '/home/wb/data/1-R/*.tif', inputFormat='tif-stack')
 
 log('info')('preprocess ...')
 fun, para = get_function(count, result)
@@ -35,24 +37,24 @@ print fun
 count += 1
 fun, para = get_function(count, result)
 log('info')('registration ...')
-rddB = eval(fun)(rddB)(_rddA.get(int(para[0])), _rddB.get(int(para[0])))
+if fun == 'reg.mutual_information':
+    # only mutual_information reuses a cached vec and starts from the keypoints
+    cache = RegistrationCache('./.registration_cache')
+    rddB = eval(fun)(rddB, cache=cache)(_rddA.get(int(para[0])), _rddB.get(int(para[0])), init='keypoints')
+else:
+    rddB = eval(fun)(rddB)(_rddA.get(int(para[0])), _rddB.get(int(para[0])))
 print fun
 
 count += 1
 fun, para = get_function(count, result)
 log('info')('fusion ...')
-L_img = rddA.collectValuesAsArray()
-R_img = rddB.collectValuesAsArray()
-img = zip(L_img, R_img)
-rdd = tsc.loadImagesFromArray(img)
-#rdd = rddA.zip(rddB)
-fused_img = eval(fun)(rdd)
+rdd = rddA.pairWith(rddB)
+rdd = eval(fun)(rdd)
 print fun
 
 count += 1
 fun, para = get_function(count, result)
 log('info')('preprocess ...')
-rdd = tsc.loadImagesFromArray(fused_img)
 rdd = eval(fun)(rdd)
 print fun
 
@@ -62,34 +64,12 @@ fun, para = get_function(count, result)
 rdd = eval(fun)(rdd)
 print fun
 
-sub_img = rdd.collectValuesAsArray()
 log('info')('segmentation ... ')
-
-count += 1
-fun, para = get_function(count, result)
-
-rdd = eval(fun)(rdd, int(para[0]))
-print fun
-
-count += 1
-fun, para = get_function(count, result)
-
-rdd = eval(fun)(rdd, int(para[0]))
-print fun
-smooth = rdd.collectValuesAsArray()
-img = zip(sub_img, smooth)
-rdd = tsc.loadImagesFromArray(img)
-
-count += 1
-fun, para = get_function(count, result)
-
-rdd = eval(fun)(rdd, int(para[0]))
-print fun
-binary = rdd.collectValuesAsArray()
-
-count += 1
-fun, para = get_function(count, result)
-
-prop = eval(fun)(binary, sub_img, int(para[0]), int(para[1]))
-print fun
+# peak_filter, smooth, watershed and fusion (or properties), run as one pass over the planes
+steps = [get_function(count + i, result) for i in range(1, 5)]
+count += 4
+pipeline = SegmentationPipeline.from_steps(steps)
+print [fun for fun, _ in steps]
+prop = pipeline.run(rdd)
+save_table(prop, "cell_table.npz")
 prop.to_csv("prop.csv")
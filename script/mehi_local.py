@@ -45,7 +45,6 @@ img_stack = zip(L_img_stack, R_img_stack)
 rdd = tsc.loadImagesFromArray(img_stack)
 #fused_img = fus.wavelet_fusion(rdd)
 fused_img = eval(get_function("fus", result))(rdd)
-fused_img = tsc.loadImagesFromArray(fused_img)
 log('info')('fusion over ...')
 
 log('info')('saving ...')
@@ -46,6 +46,9 @@ if __name__ == '__main__':
         Extension("lambdaimage.udf._phansalkar",
             sources=["lambdaimage/udf/_phansalkar.pyx", "lambdaimage/udf/_phansalkar_c.c"],
             include_dirs=[numpy.get_include()]),
+        Extension("lambdaimage.udf._edt",
+            sources=["lambdaimage/udf/_edt.pyx", "lambdaimage/udf/_edt_c.c"],
+            include_dirs=[numpy.get_include()]),
     ]
     from Cython.Build import cythonize
     extensions = cythonize(extensions)
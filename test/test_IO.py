@@ -18,3 +18,18 @@ class TestSerialIO(LocalTestCase):
         assert (img_stack.shape == (10,512,512))
         assert (img_stack.dtype == np.uint16)
 
+
+    def test_save_table(self):
+        import pandas as pd
+        import shutil, tempfile
+        table = pd.DataFrame({'x': np.random.rand(20), 'z': np.arange(20)}, columns=['x', 'z'])
+        path = tempfile.mkdtemp()
+        try:
+            save_table(table, os.path.join(path, 'table.npz'))
+            restored = load_table(os.path.join(path, 'table.npz'))
+        finally:
+            shutil.rmtree(path)
+        assert (list(restored.columns) == ['x', 'z'])
+        assert (restored.index.name is None)
+        assert (restored['z'].dtype == table['z'].dtype)
+        assert np.allclose(restored.values, table.values)
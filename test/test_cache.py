@@ -0,0 +1,57 @@
+import os
+from numpy import allclose, arange, array, array_equal
+from scipy.ndimage.interpolation import shift
+from nose.tools import assert_equals, assert_not_equals, assert_true
+
+from lambdaimage.rdds.fileio.imagesloader import ImagesLoader
+from lambdaimage.imgprocessing.registration import Registration
+from lambdaimage.utils.cache import RegistrationCache
+from test_utils import PySparkTestCaseWithOutputDir
+
+
+class TestRegistrationCache(PySparkTestCaseWithOutputDir):
+
+    def test_key(self):
+        a = arange(12).reshape(3, 4)
+        key = RegistrationCache.key(a, method='crosscorr')
+        assert_equals(key, RegistrationCache.key(a.copy(), method='crosscorr'))
+        assert_not_equals(key, RegistrationCache.key(a + 1, method='crosscorr'))
+        assert_not_equals(key, RegistrationCache.key(a.reshape(4, 3), method='crosscorr'))
+        assert_not_equals(key, RegistrationCache.key(a.astype('float'), method='crosscorr'))
+        assert_not_equals(key, RegistrationCache.key(a, method='planarcrosscorr'))
+
+    def test_imagesKey(self):
+        ims = [arange(6).reshape(2, 3), arange(6).reshape(2, 3) * 2]
+        data = ImagesLoader(self.sc).fromArrays(ims)
+        repartitioned = ImagesLoader(self.sc).fromArrays(ims, npartitions=2)
+        assert_equals(RegistrationCache.key(data), RegistrationCache.key(repartitioned))
+        changed = ImagesLoader(self.sc).fromArrays([ims[0], ims[1] + 1])
+        assert_not_equals(RegistrationCache.key(data), RegistrationCache.key(changed))
+
+    def test_putGet(self):
+        cache = RegistrationCache(os.path.join(self.outputdir, 'cache'))
+        assert_equals(cache.get('missing'), None)
+        vec = array([1.5, -2, 0.1, 1, 1, 0, 0])
+        cache.put('vec', vec)
+        assert_true('vec' in cache)
+        assert_true(array_equal(cache.get('vec'), vec))
+        cache.clear()
+        assert_true('vec' not in cache)
+
+    def test_fitCached(self):
+        cache = RegistrationCache(os.path.join(self.outputdir, 'cache'))
+        ref = arange(100).reshape(10, 10) % 7
+        data = ImagesLoader(self.sc).fromArrays([shift(ref, [1, 2], mode='wrap'), ref])
+
+        reg = Registration('crosscorr').prepare(ref)
+        model = reg.fit(data, cache=cache)
+        assert_true(reg.cacheKey(data) in cache)
+
+        cached = reg.fit(data, cache=cache)
+        assert_equals(cached.regMethod, model.regMethod)
+        assert_equals(cached.transClass, model.transClass)
+        assert_true(allclose(cached.toArray(), model.toArray()))
+
+        # a different reference is a different key
+        other = Registration('crosscorr').prepare(ref + 1)
+        assert_not_equals(other.cacheKey(data), reg.cacheKey(data))
@@ -275,6 +275,20 @@ class TestContextLoading(PySparkTestCaseWithOutputDir):
         assert(array_equal(d2.collectValuesAsArray(), target))
         assert(d2.keys().collect() == [0, 1])
 
+    def test_loadImagesPair(self):
+        arysA = [arange(6, dtype=dtypeFunc('uint8')).reshape(2, 3) + i for i in range(3)]
+        arysB = [ary + 100 for ary in arysA]
+        for prefix, arys in (('a', arysA), ('b', arysB)):
+            self.tsc.loadImagesFromArray(arys).saveAsBinaryImages(os.path.join(self.outputdir, prefix))
+
+        dataA, dataB = self.tsc.loadImagesPair(os.path.join(self.outputdir, 'a'), os.path.join(self.outputdir, 'b'),
+                                               npartitions=2)
+        assert_equals(dataA.rdd.partitioner, dataB.rdd.partitioner)
+        paired = dict(dataA.pairWith(dataB).collect())
+        assert_equals(sorted(paired.keys()), [0, 1, 2])
+        for k in paired:
+            assert_true(array_equal(paired[k], [arysA[k], arysB[k]]))
+
 
 class TestContextWriting(PySparkTestCaseWithOutputDir):
 
@@ -0,0 +1,49 @@
+from numpy import abs, allclose, float32, random, zeros
+from scipy.ndimage import convolve
+from nose.tools import assert_equals, assert_raises, assert_true
+
+from lambdaimage.rdds.fileio.imagesloader import ImagesLoader
+from lambdaimage.imgprocessing.deconvolution import Deconvolution
+from test_utils import PySparkTestCase
+
+
+def _gaussianPsf(sigma, size=9):
+    from numpy import exp, indices
+    r = indices((size, size)) - size / 2
+    psf = exp(-(r[0] ** 2 / (2. * sigma[0] ** 2) + r[1] ** 2 / (2. * sigma[1] ** 2)))
+    return float32(psf / psf.sum())
+
+
+class TestMultiviewRL(PySparkTestCase):
+
+    def test_deltaPsf(self):
+        random.seed(42)
+        ims = [random.rand(2, 30, 40).astype(float32) + 1 for _ in range(2)]
+        views = [ImagesLoader(self.sc).fromArrays(list(im)) for im in ims]
+        delta = zeros((3, 3), dtype=float32)
+        delta[1, 1] = 1
+
+        dec = Deconvolution('mvrl').prepare([delta, delta], 3, size=(16, 16), padding=4)
+        out = dec.run(views)
+        assert_equals(out.dtype, 'float32')
+        assert_true(allclose(out.collectValuesAsArray(), (ims[0] + ims[1]) / 2, rtol=1e-4))
+
+    def test_complementaryViews(self):
+        random.seed(42)
+        truth = zeros((48, 48), dtype=float32)
+        truth[random.randint(4, 44, 30), random.randint(4, 44, 30)] = 100
+        truth += 1
+        psfs = [_gaussianPsf((3, 0.5)), _gaussianPsf((0.5, 3))]
+        ims = [convolve(truth, p, mode='reflect') for p in psfs]
+        views = [ImagesLoader(self.sc).fromArrays([im]) for im in ims]
+
+        dec = Deconvolution('mvrl').prepare(psfs, 40, size=(24, 24), padding=9)
+        fused = dec.run(views).collectValuesAsArray()[0]
+        assert_equals(fused.shape, truth.shape)
+        # each view is blurred along a different axis, the joint estimate is sharper than either
+        assert_true(abs(fused - truth).sum() < 0.5 * abs((ims[0] + ims[1]) / 2 - truth).sum())
+
+    def test_psfCount(self):
+        data = ImagesLoader(self.sc).fromArrays([zeros((10, 10))])
+        dec = Deconvolution('mvrl').prepare([_gaussianPsf((1, 1))], 1)
+        assert_raises(ValueError, dec.run, [data, data])
@@ -30,9 +30,36 @@ class TestSerailFusion(LocalTestFusionCase):
         assert (fused_img.dtype == self.L_imgs.dtype)
         assert (fused_img.shape == self.L_imgs.shape)
 
+    def test_content_fusion_downscale(self):
+        img_stack = zip(self.L_imgs, self.R_imgs)
+        fused_img = content_fusion(img_stack, downscale=8)
+        assert (fused_img.dtype == self.L_imgs.dtype)
+        # the downsampled weights stay in float32 whatever the precision setting
+        from lambdaimage.serial.fusion import _content_weight
+        assert (_content_weight(self.L_imgs[0].astype(np.float32), 44, 81, 8).dtype == np.float32)
+        assert (content_fusion([(l.astype(np.float64), r) for l, r in img_stack], downscale=8).dtype == np.float64)
+        assert (fused_img.shape == self.L_imgs.shape)
+        assert (fused_img >= np.minimum(self.L_imgs, self.R_imgs) - 1).all()
+        assert (fused_img <= np.maximum(self.L_imgs, self.R_imgs)).all()
+
     def test_wavelet_fusion(self):
         img_stack = zip(self.L_imgs, self.R_imgs)
         fused_img = wavelet_fusion(img_stack)
         assert (fused_img.dtype == self.L_imgs.dtype)
         assert (fused_img.shape == self.L_imgs.shape)
     
+
+    def test_wavelet_fusion_energy(self):
+        img_stack = zip(self.L_imgs, self.R_imgs)
+        fused_img = wavelet_fusion(img_stack, rule='energy')
+        assert (fused_img.dtype == self.L_imgs.dtype)
+        assert (fused_img.shape == self.L_imgs.shape)
+
+    def test_wavelet_fusion_3d(self):
+        volA = self.L_imgs.transpose(1, 2, 0)[:64, :80]
+        volB = self.R_imgs.transpose(1, 2, 0)[:64, :80]
+        fused_img = wavelet_fusion([(volA, volB)], level=2)
+        assert (fused_img.dtype == volA.dtype)
+        assert (fused_img.shape == (1,) + volA.shape)
+        same = wavelet_fusion([(volA, volA)], level=2)
+        assert (np.abs(same[0].astype(int) - volA).max() <= 1)
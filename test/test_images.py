@@ -463,6 +463,57 @@ class TestImagesMethods(PySparkTestCase):
             for actual, expected in zip(subtracted, expectedArys):
                 assert_true(allclose(expected, actual[1]))
 
+    def test_pairWith(self):
+        arysA = [arange(4, dtype=dtypeFunc('int16')).reshape(2, 2) + i for i in range(5)]
+        arysB = [ary * 10 for ary in arysA]
+        dataA = ImagesLoader(self.sc).fromArrays(arysA, npartitions=3)
+        dataB = ImagesLoader(self.sc).fromArrays(arysB[::-1], npartitions=2).applyKeys(lambda k: 4 - k)
+
+        paired = dataA.pairWith(dataB)
+        assert_equals(paired.dims.count, (2, 2, 2))
+        for k, v in paired.collect():
+            assert_true(array_equal(v[0], arysA[k]))
+            assert_true(array_equal(v[1], arysB[k]))
+
+        # already co-partitioned data is joined without another shuffle
+        dataA.partitionBy(4)
+        dataB.partitionBy(4)
+        paired = dataA.applyValues(lambda v: v + 1).pairWith(dataB)
+        assert_equals(paired.rdd.partitioner, dataA.rdd.partitioner)
+        assert_equals(paired.rdd.toDebugString().count('ShuffledRDD'), 2)
+        assert_equals(paired.count(), 5)
+        # partitioning can still be dropped explicitly
+        unpartitioned = dataA.applyValues(lambda v: v + 1, preservesPartitioning=False)
+        assert_equals(unpartitioned.rdd.partitioner, None)
+
+    def test_label(self):
+        from numpy import random, unique
+        from scipy.ndimage import label, generate_binary_structure
+
+        def samePartition(a, b):
+            pairs = set(zip(a.ravel(), b.ravel()))
+            return len(pairs) == len(set(a.ravel())) == len(set(b.ravel()))
+
+        random.seed(0)
+        stack = (random.rand(6, 20, 30) > 0.6).astype('uint8')
+        data = ImagesLoader(self.sc).fromArrays(list(stack))
+        for connectivity in (1, 3):
+            expected, n = label(stack, generate_binary_structure(3, connectivity))
+            labels = data.label(connectivity, size=(7, 8)).collectValuesAsArray()
+            assert_equals(labels.dtype, 'int32')
+            assert_true(samePartition(labels, expected))
+            assert_true(array_equal(unique(labels), arange(n + 1)))
+
+        # volumes are labeled one by one
+        volumes = (random.rand(2, 10, 12, 14) > 0.7).astype('uint8')
+        data = ImagesLoader(self.sc).fromArrays(list(volumes))
+        labels = data.label(2, size=(5, 6, 7)).collectValuesAsArray()
+        for vol, lab in zip(volumes, labels):
+            assert_true(samePartition(lab, label(vol, generate_binary_structure(3, 2))[0]))
+        assert_true(set(labels[0].ravel()).isdisjoint(labels[1][labels[1] > 0]))
+
+        assert_raises(ValueError, data.label, 4)
+
 
 class TestImagesStats(PySparkTestCase):
     def test_mean(self):
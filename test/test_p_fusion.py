@@ -6,6 +6,7 @@
 
 from lambdaimage.fusion.fusion import *
 from lambdaimage import lambdaimageContext
+from lambdaimage.rdds.images import Images
 from test_utils import PySparkTestCase
 import numpy as np
 import os
@@ -29,16 +30,73 @@ class TestParalleledFusion(PySparkTestFusionCase):
         self.R_imgs = self.R_imgs.collectValuesAsArray()
         img_stack = zip(self.L_imgs, self.R_imgs)
         rdd = self.tsc.loadImagesFromArray(img_stack)
-        fused_img = content_fusion(rdd)
+        fused_img = content_fusion(rdd).collectValuesAsArray()
         assert (fused_img.dtype == self.L_imgs.dtype)
         assert (fused_img.shape == self.L_imgs.shape)
     
+    def test_content_fusion_downscale(self):
+        self.L_imgs = self.L_imgs.collectValuesAsArray()
+        self.R_imgs = self.R_imgs.collectValuesAsArray()
+        img_stack = zip(self.L_imgs, self.R_imgs)
+        rdd = self.tsc.loadImagesFromArray(img_stack)
+        fused_img = content_fusion(rdd, downscale=8).collectValuesAsArray()
+        assert (fused_img.dtype == self.L_imgs.dtype)
+        from lambdaimage.fusion.fusion import _content_weight
+        assert (_content_weight(self.L_imgs[0].astype(np.float32), 44, 81, 8).dtype == np.float32)
+        assert (fused_img.shape == self.L_imgs.shape)
+
+    def test_fusion_images(self):
+        self.L_imgs = self.L_imgs.collectValuesAsArray()
+        self.R_imgs = self.R_imgs.collectValuesAsArray()
+        img_stack = zip(self.L_imgs, self.R_imgs)
+        rdd = self.tsc.loadImagesFromArray(img_stack)
+        fused = content_fusion(rdd, downscale=8)
+        assert isinstance(fused, Images)
+        assert (fused.dims.count == self.L_imgs.shape[1:])
+        assert (fused.dtype == self.L_imgs.dtype)
+        assert (sorted(fused.keys().collect()) == sorted(rdd.keys().collect()))
+
     def test_wavelet_fusion(self):
         self.L_imgs = self.L_imgs.collectValuesAsArray()
         self.R_imgs = self.R_imgs.collectValuesAsArray()
         img_stack = zip(self.L_imgs, self.R_imgs)
         rdd = self.tsc.loadImagesFromArray(img_stack)
-        fused_img = wavelet_fusion(rdd)
+        fused_img = wavelet_fusion(rdd).collectValuesAsArray()
         assert (fused_img.dtype == self.L_imgs.dtype)
         assert (fused_img.shape == self.L_imgs.shape)
 
+
+    def test_multiview_fusion(self):
+        L = self.L_imgs.collectValuesAsArray()
+        for method in ('content', 'sigmoid', 'wavelet'):
+            fused = multiview_fusion([self.L_imgs, self.R_imgs, self.L_imgs], method=method,
+                                     size=(64, 64), padding=16, sgm1=2, sgm2=3)
+            assert isinstance(fused, Images)
+            fused_img = fused.collectValuesAsArray()
+            assert (fused_img.dtype == L.dtype)
+            assert (fused_img.shape == L.shape)
+
+    def test_multiview_fusion_blocks(self):
+        np.random.seed(0)
+        views = [np.random.randint(0, 1000, (2, 50, 70)).astype(np.uint16) for _ in range(3)]
+        imgs = [self.tsc.loadImagesFromArray(list(v)) for v in views]
+        # identical views are left unchanged
+        same = multiview_fusion([imgs[0]] * 3, size=(20, 30), padding=12, sgm1=2, sgm2=2)
+        assert (same.collectValuesAsArray() == views[0]).all()
+        # blocks whose padding covers the gaussian support match fusion of whole frames
+        from scipy.ndimage import gaussian_filter
+        frames = [v.astype(np.float32) for v in views]
+        w = [gaussian_filter((f - gaussian_filter(f, (0, 1, 1), truncate=3.0)) ** 2, (0, 1, 1), truncate=3.0)
+             for f in frames]
+        expected = np.round(sum(a * b for a, b in zip(w, frames)) / sum(w))
+        fused = multiview_fusion(imgs, size=(20, 30), padding=12, sgm1=1, sgm2=1).collectValuesAsArray()
+        assert (np.abs(fused.astype(np.float32) - expected) <= 1).all()
+
+    def test_multiview_fusion_default_padding(self):
+        np.random.seed(1)
+        views = [np.random.randint(0, 1000, (2, 300, 320)).astype(np.uint16) for _ in range(2)]
+        imgs = [self.tsc.loadImagesFromArray(list(v)) for v in views]
+        # the default padding covers the weights, so small blocks give the fusion of whole frames
+        whole = multiview_fusion(imgs, size=(300, 320)).collectValuesAsArray()
+        blocks = multiview_fusion(imgs, size=(64, 64)).collectValuesAsArray()
+        assert (blocks == whole).all()
@@ -5,6 +5,7 @@
 ################################
 
 from lambdaimage.registration.registration import *
+from lambdaimage.registration.registration import _trans, _get_trans
 from lambdaimage.serial.preprocess import flip
 from lambdaimage import lambdaimageContext
 from test_utils import PySparkTestCase
@@ -42,6 +43,15 @@ class TestParalleledRegistration(PySparkTestRegistrationCase):
         vec = c_powell(self.imgA, self.imgB, self.vec0)
         assert (abs(vec[0]-2) <= 5 and abs(vec[1]-3) <= 5 and abs(vec[2]-0) <= 0.5 and abs(vec[3]-1) <= 0.5 and abs(vec[4]-1) <= 0.5 and abs(vec[5]) < 0.2 and abs(vec[6]) < 0.2)
     
+    def test_keypoint_init(self):
+        vec_true = [12, -8, 0.05, 1, 1, 0, 0]
+        imgB = _trans(self.imgA, vec_true)
+        vec = keypoint_init(self.imgA, imgB)
+        U = np.linalg.inv(_get_trans(vec_true))
+        assert (abs(vec[0]-U[0,2]) <= 3 and abs(vec[1]-U[1,2]) <= 3 and abs(vec[2]+0.05) < 0.02)
+        blank = np.zeros_like(self.imgA)
+        assert_equals(keypoint_init(blank, blank), [0,0,0,1,1,0,0])
+
     def test_execute(self):
         rdd = self.tsc.loadImagesFromArray(self.L_imgs)
         ret = execute(rdd, self.vec0).collectValuesAsArray() 
@@ -55,6 +65,21 @@ class TestParalleledRegistration(PySparkTestRegistrationCase):
         assert (ret.shape == self.shape)
         assert (ret.dtype == self.dtype)
 
+    def test_mutual_information_cache(self):
+        import tempfile, shutil
+        from lambdaimage.utils.cache import RegistrationCache
+        path = tempfile.mkdtemp()
+        try:
+            cache = RegistrationCache(path)
+            key = cache.key(self.imgA, self.imgB, method='mutual_information', init='identity', ftol=0.1)
+            cache.put(key, self.vec0)
+            # a cached vec is applied without running powell
+            rdd = self.tsc.loadImagesFromArray(self.L_imgs)
+            ret = mutual_information(rdd, cache=cache)(self.imgA, self.imgB).collectValuesAsArray()
+            assert_equals(sum(self.L_imgs.flatten()), sum(np.array(ret).flatten()))
+        finally:
+            shutil.rmtree(path)
+
     def test_cross_correlation(self):
         img_stack = zip(self.L_imgs, self.R_imgs)
         rdd = self.tsc.loadImagesFromArray(img_stack)
@@ -5,10 +5,11 @@
 ################################
 
 from lambdaimage.segmentation.segmentation import *
+from lambdaimage.segmentation import segmentation
 from lambdaimage import lambdaimageContext
 from test_utils import PySparkTestCase
 import numpy as np
-from nose.tools import assert_equals
+from nose.tools import assert_equals, assert_raises
 import os
 
 L_pwd = os.path.abspath('.') + '/test_data/L_side_8/*.tif'
@@ -36,6 +37,174 @@ class TestParalleledSegmentation(PySparkTestSegmentationCase):
         assert (ret.shape == self.shape)
         ret = np.array(threshold(rdd, 'duel').collectValuesAsArray())
         assert (ret.shape == self.shape)
+        for method in ('phansalkar', 'sauvola', 'niblack', 'bernsen'):
+            ret = np.array(threshold(rdd, method, 7).collectValuesAsArray())
+            assert (ret.shape == self.shape)
+        serial = threshold(rdd, 'sauvola', 7, 0.3).collectValuesAsArray()
+        from lambdaimage.segmentation.local_threshold import sauvola
+        assert (serial == np.array([sauvola(f, 7, 0.3) for f in rdd.collectValuesAsArray()])).all()
+
+    def test_otsu_levels(self):
+        from lambdaimage.serial import segmentation as serial
+        stack = self.L_imgs.collectValuesAsArray()
+        assert (otsu_levels(self.L_imgs) == serial.otsu_levels(stack))
+        assert (otsu_levels(self.L_imgs, nclasses=3) == serial.otsu_levels(stack, nclasses=3))
+        windowed = otsu_levels(self.L_imgs, window=2)
+        assert ([windowed[k] for k in sorted(windowed)] == serial.otsu_levels(stack, window=2))
+        binary = otsu_threshold(self.L_imgs).collectValuesAsArray()
+        assert (binary == serial.otsu_threshold(stack)).all()
+        labels = otsu_threshold(self.L_imgs, nclasses=3, window=2).collectValuesAsArray()
+        assert (labels == serial.otsu_threshold(stack, nclasses=3, window=2)).all()
+
+    def test_watershed_3d_blocks(self):
+        from scipy import ndimage
+        zz, yy, xx = np.indices((20, 60, 60))
+        # spheres inside and across the block boundaries, the last two touching
+        centers = [(10, 10, 10), (10, 30, 31), (8, 45, 15), (12, 29, 50), (10, 48, 26), (10, 48, 35)]
+        binary = np.zeros((20, 60, 60), dtype=np.uint8)
+        for z, y, x in centers:
+            binary[(zz-z)**2 + (yy-y)**2 + (xx-x)**2 <= 25] = 1
+        rdd = self.tsc.loadImagesFromArray(list(binary))
+        labels = watershed_3d_blocks(rdd, min_distance=3, size=(30, 30), padding=10).collectValuesAsArray()
+        assert (labels.shape == binary.shape)
+        assert ((labels > 0) == (binary > 0)).all()
+        assert (len(np.unique(labels[labels > 0])) == len(centers))
+        for z, y, x in centers:
+            sphere = (zz-z)**2 + (yy-y)**2 + (xx-x)**2 <= 4
+            assert (len(np.unique(labels[sphere])) == 1)
+        # the same partition as a single block
+        whole = watershed_3d_blocks(rdd, min_distance=3, size=(60, 60), padding=10).collectValuesAsArray()
+        pairs = set(zip(labels[binary > 0], whole[binary > 0]))
+        assert (len(pairs) == len(centers))
+
+    def test_watershed_3d_blocks_volumes(self):
+        zz, yy, xx = np.indices((20, 60, 60))
+        volumes = np.zeros((2, 20, 60, 60), dtype=np.uint8)
+        # the same spheres in both volumes, and one more in the second
+        centers = [[(10, 10, 10), (10, 30, 31), (10, 48, 26), (10, 48, 35)], [(10, 10, 10), (10, 30, 31), (12, 29, 50)]]
+        for volume, cs in zip(volumes, centers):
+            for z, y, x in cs:
+                volume[(zz-z)**2 + (yy-y)**2 + (xx-x)**2 <= 25] = 1
+        rdd = self.tsc.loadImagesFromArray(volumes)
+        labels = watershed_3d_blocks(rdd, min_distance=3, size=(20, 30, 30), padding=10).collectValuesAsArray()
+        assert (labels.shape == volumes.shape)
+        assert ((labels > 0) == (volumes > 0)).all()
+        # objects of different volumes never share a label
+        ids = [set(np.unique(l[l > 0])) for l in labels]
+        assert (len(ids[0]) == len(centers[0]) and len(ids[1]) == len(centers[1]))
+        assert (not ids[0] & ids[1])
+        for t, cs in enumerate(centers):
+            for z, y, x in cs:
+                sphere = (zz-z)**2 + (yy-y)**2 + (xx-x)**2 <= 4
+                assert (len(np.unique(labels[t][sphere])) == 1)
+
+    def test_region_properties(self):
+        from lambdaimage.serial.segmentation import region_properties as serial_region_properties
+        labels = self.L_imgs.applyValues(lambda v: (v > v.mean()).astype(np.int32) + (v > 2 * v.mean()))
+        stats = dict(region_properties(labels, self.L_imgs).collect())
+        expected = serial_region_properties(labels.collectValuesAsArray(), self.L_imgs.collectValuesAsArray())
+        assert (sorted(stats.keys()) == range(len(expected)))
+        for k, columns in enumerate(expected):
+            assert (stats[k].keys() == columns.keys())
+            for name in columns:
+                assert np.allclose(stats[k][name], columns[name])
+
+    def test_clustering(self):
+        import pandas as pd
+        from scipy.cluster.hierarchy import fclusterdata
+        from lambdaimage.segmentation.linkage import single_linkage
+        np.random.seed(0)
+        points = np.random.rand(300, 3) * 50
+        for t in (2, 4, 8):
+            labels = single_linkage(points, t)
+            expected = fclusterdata(points, t, criterion='distance')
+            pairs = set(zip(labels, expected))
+            assert (len(pairs) == len(set(labels)) == len(set(expected)))
+        assert (len(single_linkage(np.zeros((0, 3)), 1)) == 0)
+        prop = pd.DataFrame({'x': [0, 0.5, 9], 'y': [0, 0, 0], 'z': [0, 1, 0]})
+        assert (list(clustering(prop, 2).index) == [1, 1, 2])
+
+    def test_weighted_average(self):
+        import pandas as pd
+        import shutil, tempfile
+        np.random.seed(0)
+        prop = pd.DataFrame({'x': np.random.rand(50), 'y': np.random.rand(50), 'z': np.arange(50),
+                             'intensitysum': np.random.rand(50) + 0.1, 'tag': np.arange(50)},
+                            index=pd.Index(np.random.randint(1, 8, 50), name='label'),
+                            columns=['x', 'y', 'z', 'intensitysum', 'tag'])
+        table = weighted_average(prop, 'intensitysum')
+        expected = prop.groupby(level='label').apply(df_average, 'intensitysum')
+        assert (list(table.index) == list(expected.index))
+        for col in ('x', 'y', 'z', 'tag'):
+            assert np.allclose(table[col], expected[col])
+        assert np.allclose(table['intensitysum'], prop.groupby(level='label')['intensitysum'].sum())
+
+        path = tempfile.mkdtemp()
+        try:
+            save_table(table, os.path.join(path, 'cell_table.npz'))
+            restored = load_table(os.path.join(path, 'cell_table.npz'))
+        finally:
+            shutil.rmtree(path)
+        assert (list(restored.columns) == list(table.columns))
+        assert (restored.index.name == 'label')
+        assert np.allclose(restored.values, table.values)
+
+    def test_distance_transform_blocks(self):
+        from scipy import ndimage as ndi
+        np.random.seed(0)
+        stack = ndi.gaussian_filter(np.random.rand(10, 40, 50), 2) > 0.48
+        rdd = self.tsc.loadImagesFromArray(stack.astype(np.uint8))
+        expected = ndi.distance_transform_edt(stack, (2, 1, 1))
+        ret = distance_transform_blocks(rdd, 5, sampling=(2, 1, 1), size=(12, 16)).collectValuesAsArray()
+        assert (ret.dtype == np.float32)
+        assert np.allclose(ret, np.minimum(expected, 5), atol=1e-5)
+        volumes = self.tsc.loadImagesFromArray(stack.reshape(2, 5, 40, 50).astype(np.uint8))
+        ret = distance_transform_blocks(volumes, 4, size=(5, 12, 16)).collectValuesAsArray()
+        for volume, distance in zip(stack.reshape(2, 5, 40, 50), ret):
+            assert np.allclose(distance, np.minimum(ndi.distance_transform_edt(volume), 4), atol=1e-5)
+
+    def test_size_filter_blocks(self):
+        from scipy import ndimage as ndi
+        np.random.seed(0)
+        stack = ndi.gaussian_filter(np.random.rand(6, 40, 50), 1) > 0.52
+        rdd = self.tsc.loadImagesFromArray(stack)
+        labels, _ = ndi.label(stack)
+        sizes = np.bincount(labels.ravel())
+        ret = size_filter_blocks(rdd, 5, 40, size=(16, 16)).collectValuesAsArray()
+        assert (ret.dtype == bool)
+        assert (ret == ((sizes[labels] >= 5) & (sizes[labels] <= 40) & stack)).all()
+        labeled = rdd.label(size=(16, 16))
+        ret = size_filter_blocks(labeled, 5).collectValuesAsArray()
+        assert (ret.dtype == np.int32)
+        assert ((ret > 0) == ((sizes[labels] >= 5) & stack)).all()
+
+    def test_compress_labels(self):
+        stack = np.zeros((5, 20, 30), dtype=np.int64)
+        stack[1:4, 5:10, 5:25] = 2
+        stack[3, 0, :] = 700
+        rdd = self.tsc.loadImagesFromArray(stack)
+        sparse = compress_labels(rdd).cache()
+        assert (sparse.values().map(lambda v: v.nbytes).sum() < stack.nbytes // 20)
+        ret = decompress_labels(sparse).collectValuesAsArray()
+        assert (ret.dtype == np.uint16)
+        assert (ret == stack).all()
+        ret = collect_labels(rdd)
+        assert (ret.dtype == np.uint16)
+        assert (ret == stack).all()
+
+    def test_seeds_blocks(self):
+        from lambdaimage.segmentation.seeds import local_maxima
+        from scipy import ndimage as ndi
+        np.random.seed(0)
+        smooth = ndi.gaussian_filter(np.random.rand(8, 60, 60), 3).astype(np.float32)
+        smooth = np.maximum(smooth - np.median(smooth), 0)
+        rdd = self.tsc.loadImagesFromArray(smooth)
+        seeds = seeds_blocks(rdd, 4, size=(20, 25))
+        assert (sorted(map(tuple, seeds)) == sorted(map(tuple, local_maxima(smooth, 4))))
+        volumes = self.tsc.loadImagesFromArray(smooth.reshape(2, 4, 60, 60))
+        seeds = seeds_blocks(volumes, 4, size=(4, 20, 25))
+        expected = [(t,) + tuple(c) for t in range(2) for c in local_maxima(smooth.reshape(2, 4, 60, 60)[t], 4)]
+        assert (sorted(map(tuple, seeds)) == sorted(expected))
 
     #def test_watershed_3d(self):
     #    rdd = self.L_imgs
@@ -44,3 +213,52 @@ class TestParalleledSegmentation(PySparkTestSegmentationCase):
     #    labeled_stack = watershed_3d(self.L_imgs.collectValuesAsArray(), binary)
     #    assert (labeled_stack.shape == self.shape)
     #    prop = properties(labeled_stack)
+
+class TestSegmentationPipeline(PySparkTestSegmentationCase):
+
+    def test_properties(self):
+        from lambdaimage.segmentation.pipeline import SegmentationPipeline
+        from lambdaimage.preprocess.preprocess import smooth
+        pipeline = SegmentationPipeline(peak_size=20, smooth_size=2, min_radius=3, radius=(2, 30))
+        prop = pipeline.properties(self.L_imgs)
+        assert (len(prop) > 0)
+
+        # the same as the chain of the separate steps
+        binary = peak_filter(self.L_imgs, 20).applyValues(lambda v: v.astype(np.uint8))
+        smoothed = smooth(binary, 2)
+        labels = watershed(self.L_imgs.pairWith(smoothed), 3)
+        expected = properties(labels, self.L_imgs.collectValuesAsArray(), 2, 30)
+        assert (list(prop.columns) == list(expected.columns))
+        assert (list(prop.index) == list(expected.index))
+        assert np.allclose(prop.values, expected.values)
+
+        # the labels of the planes are saved by the executors, one archive per partition
+        from lambdaimage.segmentation.sparse_labels import load_labels
+        import shutil, tempfile
+        path = tempfile.mkdtemp()
+        try:
+            saved = pipeline.properties(self.L_imgs, labels=os.path.join(path, 'labels'))
+            restored = load_labels(os.path.join(path, 'labels'))
+        finally:
+            shutil.rmtree(path)
+        assert np.allclose(saved.values, prop.values)
+        assert (restored == labels.collectValuesAsArray()).all()
+
+        cells = pipeline.run(self.L_imgs, 10)
+        assert (list(cells.columns) == ['x', 'y', 'z', 'intensitysum', 'size'])
+        assert (len(cells) <= len(prop))
+
+    def test_from_steps(self):
+        from lambdaimage.segmentation.pipeline import SegmentationPipeline
+        steps = [('seg.peak_filter', ['20']), ('prep.smooth', ['2']), ('seg.watershed', ['3']), ('seg.fusion', ['2', '30'])]
+        pipeline = SegmentationPipeline.from_steps(steps)
+        assert ((pipeline.peak_size, pipeline.smooth_size, pipeline.min_radius) == (20, 2, 3))
+        assert (pipeline.radius == (2, 30) and pipeline.threshold == 10)
+        assert (SegmentationPipeline.from_steps(steps[:3] + [('seg.fusion', ['2', '30', '6'])]).threshold == 6)
+        # properties returns the objects of the planes unclustered
+        pipeline = SegmentationPipeline.from_steps(steps[:3] + [('seg.properties', ['2', '30'])])
+        assert (pipeline.threshold is None)
+        prop = pipeline.run(self.L_imgs)
+        assert (list(prop.columns) == ['x', 'y', 'z', 'intensitysum', 'size', 'tag'])
+        assert_raises(ValueError, SegmentationPipeline.from_steps, steps[1:])
+        assert_raises(ValueError, SegmentationPipeline.from_steps, steps[:3] + [('seg.watershed_3d', ['2', '30'])])
@@ -0,0 +1,105 @@
+from numpy import allclose, array, float32, float64, random, roll
+from scipy.ndimage import gaussian_filter
+from nose.tools import assert_equals, assert_raises, assert_true
+
+from lambdaimage.rdds.fileio.imagesloader import ImagesLoader
+from lambdaimage.utils.common import setPrecision, getPrecision
+from lambdaimage.fusion.fusion import wavelet_fusion, content_fusion
+from lambdaimage.registration.registration import cross_correlation
+from lambdaimage.serial import fusion as serial_fusion
+from test_utils import PySparkTestCase, LocalTestCase
+
+
+def _smoothRandom(shape, seed=42):
+    random.seed(seed)
+    return gaussian_filter(random.randn(*shape), 2) * 100 + 1000
+
+
+class TestPrecisionSetting(LocalTestCase):
+
+    def tearDown(self):
+        setPrecision('float64')
+        super(TestPrecisionSetting, self).tearDown()
+
+    def test_setPrecision(self):
+        assert_equals(getPrecision(), float64)
+        setPrecision('float32')
+        assert_equals(getPrecision(), float32)
+        setPrecision(float64)
+        assert_equals(getPrecision(), float64)
+
+    def test_badPrecision(self):
+        assert_raises(ValueError, setPrecision, 'float16')
+        assert_raises(TypeError, setPrecision, 'double-ish')
+
+
+class TestPrecisionAgreement(PySparkTestCase):
+    """
+    Results computed in float32 should agree with the float64 results
+    """
+    def tearDown(self):
+        setPrecision('float64')
+        super(TestPrecisionAgreement, self).tearDown()
+
+    def _both(self, func):
+        setPrecision('float64')
+        double = func()
+        setPrecision('float32')
+        single = func()
+        return double, single
+
+    def test_stats(self):
+        random.seed(42)
+        arys = [random.rand(20, 30) * 1e4 + 1e6 for _ in range(10)]
+        data = ImagesLoader(self.sc).fromArrays(arys)
+        double, single = self._both(lambda: data.stats())
+        # records are cast to float32 but accumulated in float64
+        assert_equals(single.mean().dtype, float64)
+        assert_true(allclose(single.mean(), double.mean(), rtol=1e-7))
+        assert_true(allclose(single.stdev(), double.stdev(), rtol=1e-3))
+        double, single = self._both(lambda: data.sum())
+        assert_equals(single.dtype, float64)
+        assert_true(allclose(single, double, rtol=1e-7))
+
+    def test_gaussianFilter(self):
+        data = ImagesLoader(self.sc).fromArrays([_smoothRandom((30, 40))])
+        double, single = self._both(lambda: data.gaussianFilter(sigma=2).collectValuesAsArray())
+        assert_equals(double.dtype, float64)
+        assert_equals(single.dtype, float32)
+        assert_true(allclose(single, double, rtol=1e-5))
+
+    def test_crossCorrelation(self):
+        ref = _smoothRandom((32, 32))
+        data = ImagesLoader(self.sc).fromArrays([array([ref, roll(roll(ref, 2, 0), -3, 1)])])
+        double, single = self._both(lambda: cross_correlation(data).collectValuesAsArray())
+        assert_equals(single.dtype, float32)
+        assert_true(allclose(single, double, rtol=1e-4))
+        assert_true(allclose(double, ref, rtol=1e-6))
+
+    def test_waveletFusion(self):
+        pairs = [(_smoothRandom((40, 40), seed), _smoothRandom((40, 40), seed + 1)) for seed in range(2)]
+        data = ImagesLoader(self.sc).fromArrays([array(p) for p in pairs])
+        double, single = self._both(lambda: wavelet_fusion(data, level=2).collectValuesAsArray())
+        assert_true(allclose(single, double, rtol=1e-4))
+        double, single = self._both(lambda: serial_fusion.wavelet_fusion(pairs, level=2))
+        assert_true(allclose(single, double, rtol=1e-4))
+
+    def test_contentFusion(self):
+        pairs = [(_smoothRandom((64, 64), seed), _smoothRandom((64, 64), seed + 1)) for seed in range(2)]
+        data = ImagesLoader(self.sc).fromArrays([array(p) for p in pairs])
+        double, single = self._both(lambda: content_fusion(data, sgm1=4, sgm2=8).collectValuesAsArray())
+        assert_true(allclose(single, double, rtol=1e-4))
+        double, single = self._both(lambda: serial_fusion.content_fusion(pairs, sgm1=4, sgm2=8))
+        assert_true(allclose(single, double, rtol=1e-4))
+        # the downscaled weights are float32 under both settings
+        double, single = self._both(lambda: content_fusion(data, sgm1=4, sgm2=8, downscale=4).collectValuesAsArray())
+        assert_true((single == double).all())
+        # integer frames are cast back, the blended frames stay between the two views
+        pairs = [(a.astype('uint16'), b.astype('uint16')) for a, b in pairs]
+        data = ImagesLoader(self.sc).fromArrays([array(p) for p in pairs])
+        double, single = self._both(lambda: content_fusion(data, sgm1=4, sgm2=8).collectValuesAsArray())
+        assert_equals(single.dtype, 'uint16')
+        assert_true(allclose(single, double, atol=1))
+        lo = [min(a.min(), b.min()) for a, b in pairs]
+        hi = [max(a.max(), b.max()) for a, b in pairs]
+        assert_true(all(f.min() >= l - 1 and f.max() <= h for f, l, h in zip(single, lo, hi)))
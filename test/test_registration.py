@@ -5,6 +5,7 @@
 ################################
 
 from lambdaimage.serial.registration import *
+from lambdaimage.serial.registration import _trans, _get_trans
 from lambdaimage.serial.preprocess import flip
 from lambdaimage.serial.IO import load_tiff
 from test_utils import LocalTestCase
@@ -33,10 +34,27 @@ class TestSerialRegistration(LocalTestRegistrationCase):
         #vec = p_powell(self.imgA, self.imgB, self.vec0)
         #assert (abs(vec[0]-2) <= 5 and abs(vec[1]-3) <= 5 and abs(vec[2]-0) <= 0.5 and abs(vec[3]-1) <= 0.5 and abs(vec[4]-1) <= 0.5 and abs(vec[5]) < 0.2 and abs(vec[6]) < 0.2)
     
+    def test_update(self):
+        from lambdaimage.serial.registration import _update
+        from lambdaimage.udf._update import update
+        imgA = np.ascontiguousarray(self.imgA)
+        imgB = np.ascontiguousarray(self.imgB)
+        for vec in (self.vec0, [3.3,-2.7,0.02,1.01,0.99,0.01,0.003]):
+            assert abs(_update(vec, imgA, imgB) - update(vec, imgA, imgB)) < 1e-8
+
     def test_c_powell(self):
         vec = c_powell(self.imgA, self.imgB, self.vec0)
         assert (abs(vec[0]-2) <= 5 and abs(vec[1]-3) <= 5 and abs(vec[2]-0) <= 0.5 and abs(vec[3]-1) <= 0.5 and abs(vec[4]-1) <= 0.5 and abs(vec[5]) < 0.2 and abs(vec[6]) < 0.2)
     
+    def test_keypoint_init(self):
+        vec_true = [12, -8, 0.05, 1, 1, 0, 0]
+        imgB = _trans(self.imgA, vec_true)
+        vec = keypoint_init(self.imgA, imgB)
+        U = np.linalg.inv(_get_trans(vec_true))
+        assert (abs(vec[0]-U[0,2]) <= 3 and abs(vec[1]-U[1,2]) <= 3 and abs(vec[2]+0.05) < 0.02)
+        blank = np.zeros_like(self.imgA)
+        assert_equals(keypoint_init(blank, blank), [0,0,0,1,1,0,0])
+
     def test_execute(self):
         ret = execute(self.L_imgs, self.vec0) 
         assert_equals(sum(self.L_imgs.flatten()), sum(ret.flatten()))
@@ -45,6 +63,8 @@ class TestSerialRegistration(LocalTestRegistrationCase):
         ret = mutual_information(self.L_imgs, 0, self.vec0, self.imgA, self.imgB)
         assert (ret.shape == self.L_imgs.shape)
         assert (ret.dtype == self.L_imgs.dtype)
+        ret = mutual_information(self.L_imgs, 0, self.vec0, self.imgA, self.imgB, init='keypoints')
+        assert (ret.shape == self.L_imgs.shape)
 
     def test_cross_correlation(self):
         img_stack = zip(self.L_imgs, self.R_imgs)
@@ -0,0 +1,118 @@
+from numpy import allclose, array, diff, random
+from scipy.ndimage import gaussian_filter
+from scipy.ndimage.interpolation import shift
+from nose.tools import assert_equals, assert_raises, assert_true
+
+from lambdaimage.rdds.fileio.imagesloader import ImagesLoader
+from lambdaimage.imgprocessing.registration import Registration
+from lambdaimage.imgprocessing.regmethods.utils import computeDisplacement, computeDisplacementNear
+from lambdaimage.imgprocessing.transformation import Displacement, DisplacementField
+from test_utils import PySparkTestCase, LocalTestCase
+
+
+def _smoothRandom(shape, seed=42):
+    random.seed(seed)
+    return gaussian_filter(random.randn(*shape), 2) * 100
+
+
+class TestCrossCorr(PySparkTestCase):
+
+    def test_displacementNear(self):
+        ref = _smoothRandom((30, 40))
+        im = shift(ref, [3, -2], mode='wrap')
+        assert_equals(computeDisplacement(im, ref), [3, -2])
+        assert_equals(computeDisplacementNear(im, ref, [2, -1], radius=1), [3, -2])
+        assert_equals(computeDisplacementNear(im, ref, [3, -2], radius=0), [3, -2])
+
+    def test_iterativeRefinement(self):
+        ref = _smoothRandom((40, 40))
+        shifts = [[i, -(i / 2)] for i in range(8)]
+        data = ImagesLoader(self.sc).fromArrays([shift(ref, s, mode='wrap') for s in shifts])
+
+        # drifting frames make a blurry mean reference, refining it recovers the relative shifts
+        reg = Registration('crosscorr').prepare(data, nrounds=3, searchRadius=1)
+        deltas = reg.fit(data).toArray()
+        assert_true(allclose(diff(deltas, axis=0), diff(shifts, axis=0)))
+
+        out = reg.run(data).collectValuesAsArray()
+        assert_true(allclose(out[1][5:-5, 5:-5], out[6][5:-5, 5:-5]))
+
+    def test_displacementNearVolume(self):
+        ref = _smoothRandom((16, 20, 24))
+        im = shift(ref, [2, -3, 1], mode='wrap')
+        assert_equals(computeDisplacementNear(im, ref, [1, -2, 0], radius=1), [2, -3, 1])
+        # integer images are correlated in float64, without overflow
+        assert_equals(computeDisplacementNear((im + 1000).astype('uint16'), (ref + 1000).astype('uint16'),
+                                              [2, -3, 1], radius=2), [2, -3, 1])
+        # the peak is taken within the window even if it is not the global one
+        assert_equals(computeDisplacementNear(im, ref, [6, -3, 1], radius=1), [5, -3, 1])
+
+    def test_badRounds(self):
+        ref = _smoothRandom((10, 10))
+        assert_raises(ValueError, Registration('crosscorr').prepare, ref, nrounds=0)
+
+
+class TestPiecewiseRigid(PySparkTestCase):
+
+    def test_globalShift(self):
+        ref = _smoothRandom((64, 64))
+        im = shift(ref, [2, -1], mode='wrap')
+        data = ImagesLoader(self.sc).fromArrays([im, im, im])
+
+        reg = Registration('piecewiserigid').prepare(ref, size=(32, 32), padding=8)
+        model = reg.fit(data)
+
+        assert_equals(len(model.transformations), 3)
+        assert_equals(model.transClass, 'DisplacementField')
+        deltas = model.toArray()
+        assert_equals(deltas.shape, (3, 2, 2, 2))
+        assert_true(allclose(deltas[..., 0], 2))
+        assert_true(allclose(deltas[..., 1], -1))
+
+        out = reg.run(data).collectValuesAsArray()
+        assert_true(allclose(out[0][4:-4, 4:-4], ref[4:-4, 4:-4]))
+
+        # a single image is divided into the same blocks locally
+        field = reg.getTransform(im)
+        assert_equals(field.__class__.__name__, 'DisplacementField')
+        assert_true(allclose(field.toArray(), deltas[0]))
+
+    def test_localShifts(self):
+        ref = _smoothRandom((64, 64))
+        im = ref.copy()
+        im[32:, :] = shift(ref, [0, 3], mode='wrap')[32:, :]
+        data = ImagesLoader(self.sc).fromArrays([im])
+
+        reg = Registration('piecewiserigid').prepare(ref, size=(32, 32), padding=8, smooth=0)
+        deltas = reg.fit(data).toArray()[0]
+        assert_true(allclose(deltas[0, :], [0, 0]))
+        assert_true(allclose(deltas[1, :], [0, 3]))
+
+        # regularization pulls block displacements towards their neighbors
+        reg = Registration('piecewiserigid').prepare(ref, size=(32, 32), padding=8, smooth=0.5, niter=1)
+        deltas = reg.fit(data).toArray()[0]
+        assert_true((deltas[0, :, 1] > 0).all() and (deltas[1, :, 1] < 3).all())
+
+    def test_badSmoothing(self):
+        ref = _smoothRandom((64, 64))
+        assert_raises(ValueError, Registration('piecewiserigid').prepare, ref, smooth=2)
+        assert_raises(ValueError, Registration('piecewiserigid').prepare, ref, nrounds=2)
+
+
+class TestDisplacementField(LocalTestCase):
+
+    def test_uniformField(self):
+        im = _smoothRandom((20, 30))
+        field = DisplacementField(centers=[[5, 15], [5, 15, 25]], delta=[[[2, 1]] * 3] * 2)
+        expected = Displacement([2, 1]).apply(im)
+        assert_true(allclose(field.apply(im), expected))
+
+    def test_interpolatedField(self):
+        field = DisplacementField(centers=[[0, 10]], delta=[[0], [10]])
+        assert_true(allclose(field.getField((11,))[0], array(range(11))))
+
+    def test_serialize(self):
+        field = DisplacementField(centers=[[5, 15], [5, 15]], delta=[[[1, 0], [0, 1]], [[1, 1], [0, 0]]])
+        restored = DisplacementField.fromJSON(field.toJSON())
+        assert_equals(restored.centers, field.centers)
+        assert_true(allclose(restored.toArray(), field.toArray()))
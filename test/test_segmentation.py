@@ -32,9 +32,199 @@ class TestSerialSegmentation(LocalTestSegmentationCase):
         assert (ret.shape == self.L_imgs.shape)
         ret = threshold(self.L_imgs, 'duel')
         assert (ret.shape == self.L_imgs.shape)
+        for method in ('phansalkar', 'sauvola', 'niblack', 'bernsen'):
+            ret = threshold(self.L_imgs, method, 7)
+            assert (ret.shape == self.L_imgs.shape)
+            assert (ret.dtype == bool)
+
+    def test_local_stats(self):
+        from lambdaimage.segmentation.local_threshold import local_stats
+        from scipy.ndimage import uniform_filter
+        np.random.seed(0)
+        for shape, radius in (((23, 41), 3), ((9, 12, 15), (1, 2, 3))):
+            frame = np.random.rand(*shape) * 1000 + 5000
+            size = 2*np.array(radius) + 1
+            # windows are clipped at the border
+            count = uniform_filter(np.ones(shape), size, mode='constant')
+            mean = uniform_filter(frame, size, mode='constant') / count
+            sq = uniform_filter(frame*frame, size, mode='constant') / count
+            m, s = local_stats(frame, radius)
+            assert np.allclose(m, mean)
+            assert np.allclose(s, np.sqrt(sq - mean*mean), rtol=1e-4)
+
+    def test_local_threshold_border(self):
+        from lambdaimage.segmentation.local_threshold import local_threshold
+        frame = np.zeros((40, 70), dtype=np.uint16)
+        frame[:10, :10] = 1000
+        frame[20:30, 30:60] = 1000
+        for method in ('phansalkar', 'sauvola', 'niblack', 'bernsen'):
+            binary = local_threshold(frame, method, 15)
+            # objects touching the border are found as well as inner ones
+            assert binary[:10, :10].all(), method
+            assert binary[20:30, 30:60].all(), method
+            if method != 'niblack':
+                # niblack is known to pick up background next to sparse objects
+                assert not binary[35:, :].any(), method
 
     #def test_watershed_3d(self):
     #    binary = threshold(self.L_imgs, 'adaptive', 15)
     #    labeled_stack = watershed_3d(self.L_imgs, binary)
     #    assert (labeled_stack.shape == self.L_imgs.shape)
     #    prop = properties(labeled_stack)
+
+    def test_otsu_levels(self):
+        from skimage.filters import threshold_otsu
+        levels = otsu_levels(self.L_imgs)
+        assert (len(levels) == 1)
+        binary = otsu_threshold(self.L_imgs)
+        assert (binary.shape == self.L_imgs.shape)
+        assert (binary == (self.L_imgs >= levels[0])).all()
+        # one threshold for the stack, from the histogram of all planes
+        np.random.seed(1)
+        stack = np.concatenate([np.random.normal(60, 10, 6000), np.random.normal(150, 20, 4000)])
+        stack = stack.clip(0, 255).astype(np.uint8)
+        stack[:2] = 0, 255
+        assert (otsu_levels(stack.reshape(10, 20, 50))[0] == threshold_otsu(stack) + 1)
+
+    def test_multi_otsu(self):
+        np.random.seed(1)
+        stack = np.concatenate([np.random.normal(60, 10, 5000), np.random.normal(150, 20, 3000),
+                                np.random.normal(220, 8, 2000)]).clip(0, 255).astype(np.uint8)
+        stack = stack.reshape(10, 20, 50)
+        t1, t2 = otsu_levels(stack, nclasses=3)
+        assert (60 < t1 < 150 < t2 < 220)
+        labels = otsu_threshold(stack, nclasses=3)
+        assert (labels.dtype == np.uint8)
+        assert (labels == (stack >= t1).astype(int) + (stack >= t2)).all()
+        # each plane uses the histogram of its neighbours
+        levels = otsu_levels(stack, window=1)
+        assert (len(levels) == 10)
+
+    def test_multi_otsu_bins(self):
+        from lambdaimage.segmentation.otsu import multi_otsu, duel_levels, _gain, MAX_BINS
+        np.random.seed(2)
+        values = np.concatenate([np.random.normal(800, 150, 50000), np.random.normal(2000, 300, 30000),
+                                 np.random.normal(3200, 100, 20000)]).clip(0, 4095).astype(int)
+        hist = np.bincount(values, minlength=4096)
+        assert (len(hist) > MAX_BINS)
+        # the levels found on merged bins give the best split of the full histogram
+        P = np.concatenate(([0], np.cumsum(hist))).astype(float)
+        S = np.concatenate(([0], np.cumsum(hist*np.arange(len(hist))))).astype(float)
+        t = np.arange(1, len(hist))
+        a, b = t[:, None], t[None, :]
+        total = np.where(a < b, _gain(P, S, 0, a) + _gain(P, S, a, b) + _gain(P, S, b, len(hist)), -np.inf)
+        t1, t2 = multi_otsu(hist, 3)
+        assert np.isclose(_gain(P, S, 0, t1) + _gain(P, S, t1, t2) + _gain(P, S, t2, len(hist)), total.max())
+        # the second pass of duel splits the bins under the first level
+        low, high = duel_levels(hist)
+        assert (high == multi_otsu(hist)[0])
+        assert (low == multi_otsu(hist[:high])[0])
+        # 8 bit values get one bin per value
+        stack = (values[::10] // 16).reshape(10, 20, 50)
+        lo = stack.min()
+        binary = threshold(stack, 'duel')
+        levels = duel_levels(np.bincount((stack - lo).ravel()))
+        assert (binary == ((stack >= lo + levels[0]) & (stack < lo + levels[1]))).all()
+
+    def test_region_stats(self):
+        from lambdaimage.segmentation.region_stats import region_stats
+        from skimage.measure import regionprops
+        from scipy import ndimage as ndi
+        np.random.seed(0)
+        image = np.random.rand(40, 50)
+        labels = ndi.label(ndi.gaussian_filter(image, 2) > 0.5)[0]
+        labels[labels == 2] = 0
+        stats = region_stats(labels, image)
+        props = regionprops(labels, intensity_image=image)
+        assert (list(stats['label']) == [p.label for p in props])
+        for i, p in enumerate(props):
+            assert (stats['area'][i] == p.area)
+            assert np.allclose([stats['centroid-0'][i], stats['centroid-1'][i]], p.centroid)
+            assert np.allclose([stats['weighted_centroid-0'][i], stats['weighted_centroid-1'][i]], p.weighted_centroid)
+            assert (tuple(stats['bbox-%d' % j][i] for j in range(4)) == p.bbox)
+            assert np.allclose(stats['intensity_mean'][i], p.mean_intensity)
+            assert (stats['intensity_max'][i] == p.max_intensity)
+            # xy ordered moments, as in regionprops of this skimage
+            mu = p.moments_central
+            assert np.allclose([stats['moments_central-0-0'][i], stats['moments_central-0-1'][i],
+                                stats['moments_central-1-1'][i]], [mu[0, 2], mu[1, 1], mu[2, 0]])
+        empty = region_stats(np.zeros((3, 4, 5), dtype=int))
+        assert (len(empty['label']) == 0 and len(empty['bbox-5']) == 0)
+
+    def test_properties(self):
+        labels = np.zeros((4, 10, 12), dtype=int)
+        labels[1:3, 2:5, 3:9] = 1
+        labels[2, 7:9, 0:2] = 3
+        prop = properties(labels)
+        assert (list(prop.index) == [1, 3])
+        assert np.allclose(prop.loc[1, ['x', 'y', 'z', 'volume']], [1.5, 3, 5.5, 36])
+        assert np.allclose(prop.loc[3, ['x', 'y', 'z', 'volume']], [2, 7.5, 0.5, 4])
+
+    def test_edt(self):
+        from lambdaimage.segmentation.distance import edt
+        from scipy import ndimage as ndi
+        np.random.seed(0)
+        for shape, sampling in (((30, 40), None), ((12, 20, 25), (3, 1, 1)), ((9,), 2)):
+            binary = np.random.rand(*shape) > 0.05
+            distance = edt(binary, sampling)
+            assert (distance.dtype == np.float32)
+            assert np.allclose(distance, ndi.distance_transform_edt(binary, sampling), atol=1e-5)
+            assert (edt(binary, sampling, threads=1) == distance).all()
+        binary = np.random.rand(40, 50) > 0.001
+        assert np.allclose(edt(binary, threads=3), ndi.distance_transform_edt(binary), atol=1e-4)
+        assert np.isinf(edt(np.ones((3, 4)))).all()
+
+    def test_size_filter(self):
+        from lambdaimage.segmentation.region_stats import size_filter
+        from skimage.morphology import remove_small_objects
+        np.random.seed(0)
+        binary = np.random.rand(8, 30, 30) > 0.7
+        for connectivity in (1, 3):
+            kept = size_filter(binary, 4, connectivity=connectivity)
+            assert (kept.dtype == bool)
+            assert (kept == remove_small_objects(binary, 4, connectivity=connectivity)).all()
+        labels = np.array([[0, 5, 5, 0, 7], [9, 9, 9, 0, 7]])
+        assert (size_filter(labels, 2, 2) == [[0, 5, 5, 0, 7], [0, 0, 0, 0, 7]]).all()
+        assert (size_filter(labels * 10**6, 3) == [[0, 0, 0, 0, 0], [9, 9, 9, 0, 0]] * np.array(10**6)).all()
+        assert (size_filter(labels + 1, 3) == [[1, 0, 0, 1, 0], [10, 10, 10, 1, 0]]).all()
+
+    def test_sparse_labels(self):
+        from lambdaimage.segmentation.sparse_labels import SparseLabels, smallest_dtype, save_labels, load_labels
+        import pickle, shutil, tempfile
+        assert (smallest_dtype(255) == np.uint8 and smallest_dtype(256) == np.uint16)
+        labels = np.zeros((4, 30, 40), dtype=np.int64)
+        labels[1, 3:9, 5:20] = 3
+        labels[2:4, 10:12, :] = 300
+        labels[3, -1, -1] = 7
+        sparse = SparseLabels.fromarray(labels)
+        assert (sparse.dtype == np.uint16)
+        assert (sparse.nbytes < labels.nbytes // 50)
+        assert (sparse.toarray() == labels).all()
+        assert (pickle.loads(pickle.dumps(sparse, 2)).toarray(np.int32) == labels).all()
+        assert (SparseLabels.fromarray(np.zeros((2, 3), int)).toarray() == 0).all()
+        path = tempfile.mkdtemp()
+        try:
+            planes = [labels[0], SparseLabels.fromarray(labels[1]), labels[2], labels[3]]
+            save_labels(planes, os.path.join(path, 'labels.npz'))
+            stack = load_labels(os.path.join(path, 'labels.npz'))
+        finally:
+            shutil.rmtree(path)
+        assert (stack.dtype == np.uint16)
+        assert (stack == labels).all()
+
+    def test_local_maxima(self):
+        from lambdaimage.segmentation.seeds import local_maxima, seeds_to_markers
+        from skimage.feature import peak_local_max
+        from scipy import ndimage as ndi
+        np.random.seed(0)
+        smooth = ndi.gaussian_filter(np.random.rand(20, 60, 60), 3).astype(np.float32)
+        mask = smooth > np.median(smooth)
+        seeds = local_maxima(smooth, 4, mask=mask)
+        expected = peak_local_max(np.where(mask, smooth, 0), min_distance=4, exclude_border=False)
+        assert (sorted(map(tuple, seeds)) == sorted(map(tuple, expected)))
+        # a plateau is one seed
+        plateau = np.zeros((10, 10))
+        plateau[3:6, 3:6] = 1
+        assert (len(local_maxima(plateau, 2)) == 1)
+        markers = seeds_to_markers(seeds, smooth.shape)
+        assert (markers.max() == len(seeds) and (markers > 0).sum() == len(seeds))
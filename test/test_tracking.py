@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+from nose.tools import assert_equals, assert_true
+
+from lambdaimage.tracking.tracking import _hungarian, candidates, link, track
+from test_utils import PySparkTestCase
+
+
+class TestTracking(PySparkTestCase):
+
+    def test_candidates(self):
+        prev = np.array([[0., 0], [10, 0]])
+        curr = np.array([[1., 0], [0, 2], [30, 30]])
+        i, j, d = candidates(prev, curr, 3)
+        assert_equals(sorted(zip(i, j)), [(0, 0), (0, 1)])
+        assert_true(np.allclose(sorted(d), [1, 2]))
+
+    def test_hungarian(self):
+        from itertools import permutations
+        np.random.seed(2)
+        for n in range(1, 6):
+            cost = np.round(np.random.rand(n, n) * 10)
+            rows, cols = _hungarian(cost)
+            assert_equals(list(rows), list(range(n)))
+            best = min(cost[range(n), list(p)].sum() for p in permutations(range(n)))
+            assert_equals(cost[rows, cols].sum(), best)
+
+    def test_link(self):
+        np.random.seed(0)
+        prev = np.random.rand(200, 3) * 100
+        order = np.random.permutation(200)
+        curr = prev[order] + np.random.randn(200, 3) * 0.3
+        i, j = link(prev, curr, 3)
+        assert_equals(len(i), 200)
+        assert_true((order[j] == i).all())
+
+        # a crowded pair prefers the matching with the smallest total distance
+        i, j = link([[0., 0], [2, 0]], [[1.2, 0], [3.5, 0]], 2)
+        assert_equals(sorted(zip(i, j)), [(0, 0), (1, 1)])
+        # links are gated
+        i, j = link([[0., 0]], [[5., 0]], 2)
+        assert_equals(len(i), 0)
+
+    def test_track(self):
+        np.random.seed(1)
+        start = np.random.rand(30, 3) * 100
+        tables = []
+        for t in range(4):
+            cells = start + t * np.array([1., 0.5, 0])
+            if t == 2:
+                cells = np.vstack([cells, [[500., 500, 500]]])
+            perm = np.random.permutation(len(cells))
+            tables.append(pd.DataFrame(cells[perm], columns=['x', 'y', 'z']))
+        table = track(self.sc, tables, 3)
+        assert_equals(list(table.columns), ['track', 't', 'cell', 'x', 'y', 'z'])
+        assert_equals(len(table), 121)
+        lengths = table.groupby('track').size()
+        assert_equals(sorted(lengths.values), [1] + [4] * 30)
+        for _, cells in table.groupby('track'):
+            if len(cells) == 4:
+                assert_true(np.allclose(np.diff(cells[['x', 'y']].values, axis=0), [1, 0.5]))